@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "noorGold.settings")
+# Under ASGI the shop uses its async views; set to "0" to keep the sync ones.
+os.environ.setdefault("SHOP_ASYNC_VIEWS", "1")
 
 application = get_asgi_application()
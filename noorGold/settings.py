@@ -7,6 +7,7 @@ customisation. The secret key here is for development purposes only and
 should be replaced in production.
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -19,7 +20,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-z4c@72=891jzy5(qvj=@^1-8u(s&eg0$hqmx3=b&7y8!(t9w^i"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Set DJANGO_DEBUG=0 in production.
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") != "0"
 
 ALLOWED_HOSTS: list[str] = ["*"]
 
@@ -38,6 +40,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Serves collected, hashed static files when DEBUG is off.
+    "shop.staticfiles.StaticFilesMiddleware",
+    # Server-Timing headers and the numbers behind /metrics.
+    "shop.metrics.InstrumentationMiddleware",
+    # Off unless SHOP_PROFILE_SAMPLE_RATE or SHOP_PROFILE_SLOW_MS is set.
+    "shop.profiling.ProfilingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -49,12 +57,20 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "noorGold.urls"
 
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+if not DEBUG:
+    # Parse each template once per process instead of on every render.
+    TEMPLATE_LOADERS = [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            "loaders": TEMPLATE_LOADERS,
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -72,10 +88,42 @@ WSGI_APPLICATION = "noorGold.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES: dict[str, dict[str, str]] = {
+# SQLite in WAL mode with tuned pragmas (shop/db.py), persistent connections
+# and a read-only connection to the same file that serves catalog reads, so
+# admin writes never block the storefront.
+SQLITE_PATH = BASE_DIR / "db.sqlite3"
+CONN_MAX_AGE = int(os.environ.get("DJANGO_CONN_MAX_AGE", "60"))
+
+DATABASES: dict[str, dict] = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": SQLITE_PATH,
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+    },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": f"file:{SQLITE_PATH}?mode=ro",
+        "OPTIONS": {"uri": True},
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    },
+}
+DATABASE_ROUTERS = ["shop.db.ReadReplicaRouter"]
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The shop stores versioned data (navbar, site config, ...) here, and cache
+# invalidation bumps namespace versions in it, so every worker process must
+# share it. The file-based cache is shared by all workers on one host; point
+# this at Redis or Memcached when serving from several hosts.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("SHOP_CACHE_DIR") or BASE_DIR / "cache",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
     }
 }
 
@@ -115,9 +163,46 @@ STATIC_URL = "static/"
 # serve styles and scripts from the `static` folder during development.
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+# Where collectstatic writes hashed, precompressed copies of the assets.
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+if not DEBUG:
+    STORAGES = {
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "shop.staticfiles.CompressedManifestStaticFilesStorage"},
+    }
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Stream uploads to disk and hash them on the way for content-addressed
+# photo storage (shop/uploads.py).
+FILE_UPLOAD_HANDLERS = ["shop.uploads.HashingFileUploadHandler"]
+# Hand media transfers to the front proxy: "nginx" (X-Accel-Redirect to
+# SHOP_MEDIA_ACCEL_PREFIX) or "sendfile" (X-Sendfile). See shop/media.py.
+SHOP_MEDIA_ACCEL = os.environ.get("SHOP_MEDIA_ACCEL") or None
+SHOP_MEDIA_ACCEL_PREFIX = "/protected-media/"
+
+# /metrics: a bearer token to require (without one it is served only under
+# DEBUG), and a directory where each worker process publishes its counters so
+# any worker can report them all. Server-Timing headers are sent under DEBUG
+# or with SHOP_SERVER_TIMING=1.
+SHOP_METRICS_TOKEN = os.environ.get("SHOP_METRICS_TOKEN") or None
+SHOP_METRICS_DIR = os.environ.get("SHOP_METRICS_DIR") or None
+SHOP_SERVER_TIMING = DEBUG or os.environ.get("SHOP_SERVER_TIMING") == "1"
+
+# Profile this fraction of requests with cProfile, and keep stack samples of
+# every request slower than SHOP_PROFILE_SLOW_MS. See shop/profiling.py.
+SHOP_PROFILE_SAMPLE_RATE = float(os.environ.get("SHOP_PROFILE_SAMPLE_RATE", "0"))
+SHOP_PROFILE_SLOW_MS = float(os.environ["SHOP_PROFILE_SLOW_MS"]) if os.environ.get("SHOP_PROFILE_SLOW_MS") else None
+SHOP_PROFILE_DIR = BASE_DIR / "profiles"
+SHOP_PROFILE_MAX_BYTES = 50 * 1024 * 1024
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Serve the shop through its async views, which load independent queries
+# concurrently. noorGold/asgi.py turns this on; WSGI keeps the sync views.
+SHOP_ASYNC_VIEWS = os.environ.get("SHOP_ASYNC_VIEWS") == "1"
+# Give each of those queries its own thread and connection.
+SHOP_ASYNC_PARALLEL_QUERIES = os.environ.get("SHOP_ASYNC_PARALLEL_QUERIES") == "1"
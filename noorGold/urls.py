@@ -4,15 +4,26 @@ Defines the routing table for the project and includes app URL configurations.
 """
 
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+
+from shop import api, feeds
+from shop.media import serve_media
+from shop.metrics import metrics_view
+from shop.profiling import get_admin_urls as profiling_admin_urls
 
 urlpatterns = [
+    path("admin/", include(profiling_admin_urls())),
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
+    path("sitemap.xml", feeds.sitemap_index, name="sitemap"),
+    path("sitemap-categories.xml", feeds.sitemap_categories, name="sitemap_categories"),
+    path("sitemap-products-<int:chunk>.xml", feeds.sitemap_products, name="sitemap_products"),
+    path("api/categories/", api.categories, name="api_categories"),
+    path("api/products/", api.products, name="api_products"),
+    path("api/products/<slug:slug>/", api.product_detail, name="api_product_detail"),
+    re_path(r"^feeds/products\.(?P<fmt>json|xml)$", feeds.product_feed, name="product_feed"),
     path("", include(("shop.urls", "shop"), namespace="shop")),
+    # Product photos, in development and production alike.
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>products/.+)$", serve_media, name="media"),
 ]
-
-# Serve media files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
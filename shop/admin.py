@@ -1,5 +1,103 @@
-from django.contrib import admin
-from .models import Category, WageTier, Product, ProductImage, SiteConfig
+from __future__ import annotations
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.utils import unquote
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Max
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.urls import path
+from django.utils import timezone
+
+from . import pricing, search
+from .cache import CATALOG, NAVIGATION, SIMILAR, invalidate, versioned_key
+from .models import Category, GoldRate, WageTier, Product, ProductImage, SiteConfig
+from .pagination import CachedCountPaginator
+from .uploads import content_hash
+
+
+def cached_choices(model, namespace: str) -> list[tuple[int, str]]:
+    """``(pk, name)`` of every row of ``model``, cached per ``namespace`` version.
+
+    Categories invalidate ``navigation`` and wage tiers ``catalog`` when saved,
+    so the changelist sidebar and action form never query them on a warm page.
+    """
+    key = versioned_key(namespace, "admin-choices", model._meta.label_lower)
+    choices = cache.get(key)
+    if choices is None:
+        choices = list(model.objects.order_by("sort_order", "name").values_list("pk", "name"))
+        cache.set(key, choices, 60 * 60)
+    return choices
+
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    """A foreign-key filter whose choices come from :func:`cached_choices`."""
+
+    model = None
+    namespace = CATALOG
+
+    def lookups(self, request, model_admin):
+        return [(str(pk), name) for pk, name in cached_choices(self.model, self.namespace)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f"{self.parameter_name}_id": self.value()})
+        return queryset
+
+
+class CategoryFilter(CachedChoicesFilter):
+    title = "دسته‌بندی"
+    parameter_name = "category"
+    model = Category
+    namespace = NAVIGATION
+
+
+class WageTierFilter(CachedChoicesFilter):
+    title = "نوع اجرت"
+    parameter_name = "wage_tier"
+    model = WageTier
+
+
+class ProductActionForm(ActionForm):
+    """The action dropdown plus the target of "change category/wage tier"."""
+
+    category = forms.TypedChoiceField(label="دسته‌بندی", required=False, coerce=int, empty_value=None)
+    wage_tier = forms.TypedChoiceField(label="نوع اجرت", required=False, coerce=int, empty_value=None)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["category"].choices = [("", "---------")] + cached_choices(Category, NAVIGATION)
+        self.fields["wage_tier"].choices = [("", "---------")] + cached_choices(WageTier, CATALOG)
+
+
+# Fields the "similar pieces" index is built from.
+SIMILAR_FIELDS = frozenset({"is_active", "category_id", "wage_tier_id"})
+
+
+def bulk_update(queryset, reindex: bool = False, reprice: bool = False, **values) -> int:
+    """Set ``values`` on the selected products with one ``UPDATE``; return rows changed.
+
+    Rows that already hold the values are left alone. Signals do not fire for
+    ``update()``, so the search index, prices and the catalog cache are
+    refreshed here, once for the whole selection.
+    """
+    selected = Product.objects.filter(pk__in=queryset.order_by().values("pk"))
+    # The selection may be filtered on the field about to change, so the rows
+    # are pinned by primary key before the update.
+    pks = list(selected.exclude(**values).values_list("pk", flat=True))
+    if not pks:
+        return 0
+    changed = Product.objects.filter(pk__in=pks).update(updated_at=timezone.now(), **values)
+    if reindex:
+        search.index_products(pks)
+    if reprice:
+        pricing.recompute_prices(product_ids=pks)
+    invalidate(CATALOG)
+    if SIMILAR_FIELDS.intersection(values):
+        invalidate(SIMILAR)
+    return changed
 
 
 class ProductImageInline(admin.TabularInline):
@@ -20,8 +118,8 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(WageTier)
 class WageTierAdmin(admin.ModelAdmin):
-    list_display = ("name", "sort_order", "is_active")
-    list_editable = ("sort_order", "is_active")
+    list_display = ("name", "wage_percent", "sort_order", "is_active")
+    list_editable = ("wage_percent", "sort_order", "is_active")
     search_fields = ("name",)
 
 
@@ -33,14 +131,29 @@ class ProductAdmin(admin.ModelAdmin):
         "category",
         "wage_tier",
         "weight_gram",
+        "computed_price",
         "is_active",
         "is_featured",
         "created_at",
     )
-    list_filter = ("category", "wage_tier", "is_active", "is_featured")
+    list_select_related = ("category", "wage_tier")
+    list_filter = (CategoryFilter, WageTierFilter, "is_active", "is_featured")
     search_fields = ("name", "code")
     prepopulated_fields = {"slug": ("name",)}
+    autocomplete_fields = ("category", "wage_tier")
     inlines = [ProductImageInline]
+    # One cached COUNT per catalog version instead of two table scans a page.
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    action_form = ProductActionForm
+    actions = (
+        "activate",
+        "deactivate",
+        "feature",
+        "unfeature",
+        "change_category",
+        "change_wage_tier",
+    )
 
     fieldsets = (
         ("اطلاعات اصلی", {
@@ -54,6 +167,98 @@ class ProductAdmin(admin.ModelAdmin):
         }),
     )
 
+    def _report(self, request, changed: int) -> None:
+        self.message_user(request, f"{changed} محصول بروزرسانی شد.")
+
+    @admin.action(description="فعال کردن محصولات انتخاب‌شده", permissions=["change"])
+    def activate(self, request, queryset):
+        self._report(request, bulk_update(queryset, reindex=True, is_active=True))
+
+    @admin.action(description="غیرفعال کردن محصولات انتخاب‌شده", permissions=["change"])
+    def deactivate(self, request, queryset):
+        self._report(request, bulk_update(queryset, reindex=True, is_active=False))
+
+    @admin.action(description="نمایش ویژه محصولات انتخاب‌شده", permissions=["change"])
+    def feature(self, request, queryset):
+        self._report(request, bulk_update(queryset, is_featured=True))
+
+    @admin.action(description="حذف از نمایش ویژه", permissions=["change"])
+    def unfeature(self, request, queryset):
+        self._report(request, bulk_update(queryset, is_featured=False))
+
+    @admin.action(description="تغییر دسته‌بندی به ...", permissions=["change"])
+    def change_category(self, request, queryset):
+        category_id = self._action_value(request, "category")
+        if category_id is None:
+            self.message_user(request, "یک دسته‌بندی انتخاب کنید.", level=messages.WARNING)
+            return
+        # Category names are indexed with their products.
+        self._report(request, bulk_update(queryset, reindex=True, category_id=category_id))
+
+    @admin.action(description="تغییر نوع اجرت به ...", permissions=["change"])
+    def change_wage_tier(self, request, queryset):
+        wage_tier_id = self._action_value(request, "wage_tier")
+        if wage_tier_id is None:
+            self.message_user(request, "یک نوع اجرت انتخاب کنید.", level=messages.WARNING)
+            return
+        self._report(request, bulk_update(queryset, reprice=True, wage_tier_id=wage_tier_id))
+
+    def get_urls(self):
+        upload = path(
+            "<path:object_id>/images/upload/",
+            self.admin_site.admin_view(self.upload_images_view),
+            name="shop_product_upload_images",
+        )
+        return [upload] + super().get_urls()
+
+    def upload_images_view(self, request, object_id):
+        """Drop-zone endpoint: add every file in ``images`` to the product.
+
+        Files arrive already streamed to disk and hashed; content the product
+        already has is skipped, and content another product has is shared.
+        """
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        product = self.get_object(request, unquote(object_id))
+        if product is None:
+            raise Http404("No such product")
+        if not self.has_change_permission(request, product):
+            raise PermissionDenied
+        existing = set(product.images.values_list("content_hash", flat=True))
+        sort_order = product.images.aggregate(top=Max("sort_order"))["top"]
+        sort_order = -1 if sort_order is None else sort_order
+        field = forms.ImageField()
+        added, skipped, errors = [], [], []
+        for upload in request.FILES.getlist("images"):
+            try:
+                field.clean(upload)
+            except ValidationError as exc:
+                errors.append({"name": upload.name, "error": " ".join(exc.messages)})
+                continue
+            digest = content_hash(upload)
+            if digest in existing:
+                skipped.append(upload.name)
+                continue
+            existing.add(digest)
+            sort_order += 1
+            image = ProductImage(product=product, image=upload, sort_order=sort_order)
+            image.save()
+            added.append({"id": image.pk, "name": upload.name, "url": image.image.url})
+        status = 400 if errors and not (added or skipped) else 200
+        return JsonResponse({"added": added, "skipped": skipped, "errors": errors}, status=status)
+
+    def _action_value(self, request, field: str) -> int | None:
+        try:
+            return self.action_form().fields[field].clean(request.POST.get(field))
+        except ValidationError:
+            return None
+
+
+@admin.register(GoldRate)
+class GoldRateAdmin(admin.ModelAdmin):
+    list_display = ("rate_per_gram", "source", "created_at")
+    fields = ("rate_per_gram", "source")
+
 
 @admin.register(SiteConfig)
 class SiteConfigAdmin(admin.ModelAdmin):
@@ -0,0 +1,323 @@
+"""
+Read-only JSON API for the mobile app and marketplace syncs.
+
+``/api/categories/``, ``/api/products/`` and ``/api/products/<slug>/``
+serialize ``values()`` rows straight to JSON: no model instances are built
+and every field is formatted by at most one plain function. ``?fields=``
+selects a subset of a resource's fields and only those columns are read.
+
+Products are filtered with ``category`` (slug), ``wage_tier`` (id),
+``min_weight`` and ``max_weight`` (a half-open range, as on category pages),
+newest first, and paginated by an opaque
+``?cursor=`` token (:class:`~shop.pagination.CursorPaginator`), so a sync
+walking the whole catalog pays the same for every page. ``limit`` sets the
+page size up to ``SHOP_API_MAX_PAGE_SIZE``.
+
+ETags follow the newest ``updated_at`` of the rows a response covers, which
+price recomputes and photo changes bump too, and the navigation version,
+since rows carry their category's slug. Polling clients get a ``304`` from
+one cached aggregate (or one indexed row for a product) when nothing
+changed. Responses are gzip-compressed for clients that accept it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse
+from django.utils.http import quote_etag
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_safe
+
+from .cache import CATALOG, NAVIGATION, cached_aggregate, get_version, last_changed
+from .feeds import base_url, conditional_response, url_template, w3c_datetime
+from .models import Category, Product, ProductImage
+from .pagination import INT64_RANGE, CursorPaginator
+
+DEFAULT_PAGE_SIZE = 24
+DEFAULT_MAX_PAGE_SIZE = 100
+CURSOR_KEYS = ("-created_at", "-id")
+
+# Public field name -> ``values()`` lookup.
+CATEGORY_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "slug": "slug",
+    "description": "description",
+    "sort_order": "sort_order",
+}
+PRODUCT_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "code": "code",
+    "slug": "slug",
+    "url": "slug",
+    "category": "category__slug",
+    "wage_tier": "wage_tier_id",
+    "weight_gram": "weight_gram",
+    "price": "computed_price",
+    "image": "main_image__image",
+    "is_featured": "is_featured",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+# Only the detail endpoint serves these by default; ``images`` is not a column.
+DETAIL_FIELDS = {**PRODUCT_FIELDS, "description": "description", "images": None}
+PRODUCT_LIST_DEFAULT = tuple(PRODUCT_FIELDS)
+JSON_CONTENT_TYPE = "application/json"
+
+
+class BadRequest(ValueError):
+    """A query parameter the API cannot honour; answered with a JSON 400."""
+
+
+def _latest(*stamps):
+    return max((stamp for stamp in stamps if stamp is not None), default=None)
+
+
+def _dumps(data) -> str:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json(data) -> HttpResponse:
+    return HttpResponse(_dumps(data), content_type=JSON_CONTENT_TYPE)
+
+
+def _error(message: str, status: int) -> JsonResponse:
+    return JsonResponse({"error": message}, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+def _etag(*parts) -> str:
+    raw = ":".join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def parse_fields(request, available: dict, default) -> tuple[str, ...]:
+    """Field names requested with ``?fields=a,b``, in the resource's order."""
+    raw = request.GET.get("fields")
+    if not raw:
+        return tuple(default)
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = requested - available.keys()
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    return tuple(name for name in available if name in requested)
+
+
+def _formatters(request) -> dict:
+    """Per-field formatting of raw column values; other fields pass through."""
+    base = base_url(request)
+    prefix, suffix = url_template("shop:product_detail", base)
+
+    def media(name):
+        return urljoin(base + "/", default_storage.url(name)) if name else None
+
+    return {
+        "url": lambda slug: prefix + slug + suffix,
+        "image": media,
+        "weight_gram": float,
+        "price": lambda price: int(price) if price is not None else None,
+        "created_at": w3c_datetime,
+        "updated_at": w3c_datetime,
+        "media": media,
+    }
+
+
+def serialize(rows, fields, lookups: dict, formatters: dict) -> list[dict]:
+    """Rows from ``values(*lookups)`` as dicts of the public ``fields``."""
+    columns = [
+        (name, lookups[name], formatters.get(name)) for name in fields if lookups[name] is not None
+    ]
+    return [
+        {name: row[lookup] if fmt is None else fmt(row[lookup]) for name, lookup, fmt in columns}
+        for row in rows
+    ]
+
+
+def _lookups(fields, lookups: dict, *required: str) -> list[str]:
+    needed = dict.fromkeys(required)
+    needed.update((lookups[name], None) for name in fields if lookups[name] is not None)
+    return list(needed)
+
+
+def _int(raw: str, message: str) -> int:
+    # str.isdigit() also accepts digits int() rejects, such as "²", and SQLite
+    # overflows past 64 bits.
+    if not (raw.isascii() and raw.isdigit()) or int(raw) not in INT64_RANGE:
+        raise BadRequest(message)
+    return int(raw)
+
+
+def _decimal(request, name: str) -> Decimal | None:
+    raw = request.GET.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        value = Decimal(raw)
+    except InvalidOperation:
+        value = None
+    if value is None or not value.is_finite():
+        raise BadRequest(f"{name} must be a number.")
+    return value
+
+
+def filter_products(request):
+    """Active products narrowed by the ``category``, ``wage_tier`` and weight parameters."""
+    qs = Product.objects.active()
+    if category := request.GET.get("category"):
+        qs = qs.filter(category__slug=category, category__is_active=True)
+    if wage_tier := request.GET.get("wage_tier"):
+        qs = qs.filter(wage_tier_id=_int(wage_tier, "wage_tier must be an id."))
+    min_weight, max_weight = _decimal(request, "min_weight"), _decimal(request, "max_weight")
+    if min_weight is not None:
+        qs = qs.filter(weight_gram__gte=min_weight)
+    if max_weight is not None:
+        qs = qs.filter(weight_gram__lt=max_weight)
+    return qs
+
+
+def page_size(request) -> int:
+    maximum = getattr(settings, "SHOP_API_MAX_PAGE_SIZE", DEFAULT_MAX_PAGE_SIZE)
+    raw = request.GET.get("limit")
+    if not raw:
+        return min(getattr(settings, "SHOP_API_PAGE_SIZE", DEFAULT_PAGE_SIZE), maximum)
+    message = f"limit must be between 1 and {maximum}."
+    limit = _int(raw, message)
+    if not 1 <= limit <= maximum:
+        raise BadRequest(message)
+    return limit
+
+
+def _page_url(request, cursor: str | None) -> str | None:
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query["cursor"] = cursor
+    return request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+
+
+@require_safe
+@gzip_page
+def categories(request):
+    """Active categories in navigation order."""
+    try:
+        fields = parse_fields(request, CATEGORY_FIELDS, CATEGORY_FIELDS)
+    except BadRequest as exc:
+        return _error(str(exc), 400)
+    # Category edits bump the navigation version.
+    etag = _etag("api:categories", get_version(NAVIGATION), ",".join(fields))
+
+    def build():
+        rows = (
+            Category.objects.filter(is_active=True)
+            .order_by("sort_order", "name")
+            .values(*_lookups(fields, CATEGORY_FIELDS))
+        )
+        return _json({"results": serialize(rows, fields, CATEGORY_FIELDS, {})})
+
+    return conditional_response(request, build, None, etag)
+
+
+@require_safe
+@gzip_page
+def products(request):
+    """One cursor page of active products, newest first."""
+    try:
+        fields = parse_fields(request, PRODUCT_FIELDS, PRODUCT_LIST_DEFAULT)
+        qs = filter_products(request)
+        limit = page_size(request)
+        cursor = request.GET.get("cursor")
+        rows = qs.values(*_lookups(fields, PRODUCT_FIELDS, "id", "created_at"))
+        paginator = CursorPaginator(rows, limit, CURSOR_KEYS)
+        # Restarting from the first page would send a sync round in circles.
+        if cursor and not paginator.is_valid_cursor(cursor):
+            raise BadRequest("Invalid cursor.")
+    except BadRequest as exc:
+        return _error(str(exc), 400)
+    stats = cached_aggregate(qs, lastmod=Max("updated_at"), count=Count("pk"))
+    base = base_url(request)
+    etag = _etag(
+        "api:products", stats["lastmod"], stats["count"], get_version(NAVIGATION), base, request.get_full_path()
+    )
+    # Rows that left the page or renamed categories leave updated_at alone.
+    last_modified = _latest(stats["lastmod"], last_changed(CATALOG), last_changed(NAVIGATION))
+
+    def build():
+        page = paginator.page(cursor)
+        return _json(
+            {
+                "count": stats["count"],
+                "next": _page_url(request, page.next_cursor),
+                "previous": _page_url(request, page.previous_cursor),
+                "results": serialize(page.object_list, fields, PRODUCT_FIELDS, _formatters(request)),
+            }
+        )
+
+    return conditional_response(request, build, last_modified, etag)
+
+
+def product_images(product_id: int, media) -> list[dict]:
+    """Photos of a product with their responsive derivatives, if built."""
+    images = []
+    rows = (
+        ProductImage.objects.filter(product_id=product_id)
+        .order_by("sort_order", "id")
+        .values("id", "image", "is_main", "derivatives")
+    )
+    for row in rows:
+        manifest = row["derivatives"] or {}
+        built = manifest.get("source") == row["image"]
+        images.append(
+            {
+                "id": row["id"],
+                "url": media(row["image"]),
+                "is_main": row["is_main"],
+                "width": manifest.get("width") if built else None,
+                "height": manifest.get("height") if built else None,
+                "sources": {
+                    fmt: [[width, media(name)] for width, name in entries]
+                    for fmt, entries in (manifest.get("sources") or {}).items()
+                }
+                if built
+                else {},
+            }
+        )
+    return images
+
+
+@require_safe
+@gzip_page
+def product_detail(request, slug: str):
+    """One active product with its description and photos."""
+    try:
+        fields = parse_fields(request, DETAIL_FIELDS, DETAIL_FIELDS)
+    except BadRequest as exc:
+        return _error(str(exc), 400)
+    row = (
+        Product.objects.active()
+        .filter(slug=slug)
+        .values(*_lookups(fields, DETAIL_FIELDS, "id", "updated_at"))
+        .first()
+    )
+    if row is None:
+        return _error("Product not found.", 404)
+    base = base_url(request)
+    # Photo changes bump the product's updated_at as well; category renames
+    # bump the navigation version.
+    etag = _etag("api:product", row["id"], row["updated_at"], get_version(NAVIGATION), base, ",".join(fields))
+    last_modified = _latest(row["updated_at"], last_changed(NAVIGATION))
+
+    def build():
+        formatters = _formatters(request)
+        data = serialize([row], fields, DETAIL_FIELDS, formatters)[0]
+        if "images" in fields:
+            data["images"] = product_images(row["id"], formatters["media"])
+        return _json(data)
+
+    return conditional_response(request, build, last_modified, etag)
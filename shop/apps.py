@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "shop"
+
+    def ready(self) -> None:
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .db import configure_sqlite
+
+        connection_created.connect(configure_sqlite, dispatch_uid="shop.db.configure_sqlite")
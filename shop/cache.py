@@ -0,0 +1,109 @@
+"""
+Versioned cache helpers for the shop application.
+
+Cached values are stored under keys that embed a per-namespace version number
+kept in the shared cache. Invalidating a namespace is a single ``incr`` on its
+version key, which every worker process notices on its next lookup; stale
+entries simply age out. Each bump also records its time for
+``Last-Modified`` headers (:func:`last_changed`).
+"""
+
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import transaction
+
+# Namespace for data rendered on every page: navbar categories and site config.
+NAVIGATION = "navigation"
+# Namespace for data derived from products and wage tiers (facet counts, ...).
+CATALOG = "catalog"
+# Namespace for the current gold rate.
+PRICING = "pricing"
+# Namespace for wage tier names and activity, which facet options list even
+# in categories without products of that tier.
+WAGE_TIERS = "wage-tiers"
+# Namespace for the per-category "similar pieces" indexes (shop/similar.py),
+# invalidated by bulk writes that change weight, category, tier or activity.
+SIMILAR = "similar"
+
+
+def _version_key(namespace: str) -> str:
+    return f"shop:version:{namespace}"
+
+
+def _changed_key(namespace: str) -> str:
+    return f"shop:changed:{namespace}"
+
+
+def get_version(namespace: str) -> int:
+    """Return the current version of ``namespace``, initialising it if needed."""
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted key never reuses an old version.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(namespace: str) -> None:
+    """Invalidate every cached value of ``namespace``."""
+    key = _version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    cache.set(_changed_key(namespace), time.time(), timeout=None)
+
+
+def last_changed(namespace: str) -> datetime:
+    """When ``namespace`` was last invalidated, for ``Last-Modified`` headers.
+
+    An evicted timestamp restarts at the current time, so it can only ever
+    move forward.
+    """
+    key = _changed_key(namespace)
+    changed = cache.get(key)
+    if changed is None:
+        cache.add(key, time.time(), timeout=None)
+        changed = cache.get(key, time.time())
+    return datetime.fromtimestamp(changed, tz=timezone.utc)
+
+
+def invalidate(namespace: str) -> None:
+    """Bump ``namespace`` now and again once the current transaction commits.
+
+    The second bump drops anything another worker cached from the
+    pre-commit state of the database in the meantime.
+    """
+    bump_version(namespace)
+    transaction.on_commit(lambda: bump_version(namespace))
+
+
+def versioned_key(namespace: str, *parts) -> str:
+    """Build a cache key that is invalidated together with ``namespace``."""
+    suffix = ":".join(str(part) for part in parts)
+    return f"shop:{namespace}:{get_version(namespace)}:{suffix}"
+
+
+def query_fingerprint(queryset) -> str:
+    """A short, stable digest of the SQL a queryset would run."""
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        sql = "empty"
+    return hashlib.md5(sql.encode(), usedforsecurity=False).hexdigest()
+
+
+def cached_aggregate(queryset, namespace: str = CATALOG, timeout: int = 60 * 60, **aggregates) -> dict:
+    """Run ``queryset.aggregate(**aggregates)`` at most once per ``namespace`` version."""
+    names = ",".join(f"{name}={aggregates[name]!r}" for name in sorted(aggregates))
+    key = versioned_key(namespace, "aggregate", query_fingerprint(queryset), names)
+    result = cache.get(key)
+    if result is None:
+        result = queryset.aggregate(**aggregates)
+        cache.set(key, result, timeout)
+    return result
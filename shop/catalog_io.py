@@ -0,0 +1,512 @@
+"""
+Bulk catalog import and export.
+
+Catalog files are CSV (with a header row) or JSON Lines with one product per
+row and the columns in ``COLUMNS``. ``category`` is a category slug or name,
+``wage_tier`` a wage tier name, and ``images`` a ``|``-separated list (or a
+JSON array) of image paths relative to an images directory or entries of a
+zip archive; the first image becomes the main image. Photos are stored by
+content, so a file referenced by many rows is written once.
+
+Rows are matched to existing products by ``code`` and then by ``slug``;
+matches are updated with the columns present in the row and everything else
+is created. Files are streamed and written in chunks, each in its own
+transaction with one ``bulk_create`` and one ``bulk_update``, so memory use
+does not grow with the file size. Categories and wage tiers are resolved
+through in-memory lookup maps, slugs are allocated per chunk with
+:func:`shop.slugs.assign_slugs`, and prices are computed in memory. Because
+bulk writes bypass model signals, each chunk reindexes search and invalidates
+the catalog cache itself.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import os
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import cache, search
+from .models import Category, Product, ProductImage, WageTier
+from .pricing import current_rate, price_for_product
+from .slugs import SAVE_ATTEMPTS, assign_slugs
+from .uploads import store_content
+
+COLUMNS = (
+    "code",
+    "name",
+    "slug",
+    "category",
+    "wage_tier",
+    "weight_gram",
+    "description",
+    "is_active",
+    "is_featured",
+    "images",
+)
+REQUIRED_FOR_CREATE = ("name", "category", "weight_gram")
+IMAGE_SEPARATOR = "|"
+DEFAULT_BATCH_SIZE = 1000
+# Error messages kept for the report; further errors are only counted.
+MAX_REPORTED_ERRORS = 100
+
+_TRUE = {"1", "true", "yes", "y", "بله", "فعال"}
+_FALSE = {"0", "false", "no", "n", "خیر", "غیرفعال"}
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(path: str | Path) -> str:
+    return "jsonl" if Path(path).suffix.lower() in {".jsonl", ".ndjson", ".json"} else "csv"
+
+
+def read_rows(path: str | Path, fmt: str):
+    """Yield ``(line_number, row)``; ``row`` is a ``RowError`` for unparsable lines."""
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as handle:
+            reader = csv.DictReader(handle)
+            for row in reader:
+                yield reader.line_num, row
+        return
+    with open(path, encoding="utf-8-sig") as handle:
+        for number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield number, RowError(f"invalid JSON: {exc}")
+                continue
+            yield number, row if isinstance(row, dict) else RowError("expected a JSON object")
+
+
+def _text(value) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = _text(value).lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise RowError(f"not a yes/no value: {value!r}")
+
+
+def _image_refs(value) -> list[str]:
+    if isinstance(value, list):
+        refs = [_text(ref) for ref in value]
+    else:
+        refs = [ref.strip() for ref in _text(value).split(IMAGE_SEPARATOR)]
+    return [ref for ref in refs if ref]
+
+
+class ImageSource:
+    """Opens image references from a directory or a zip archive."""
+
+    def __init__(self, directory: str | Path | None = None, archive: str | Path | None = None):
+        self.directory = Path(directory).resolve() if directory else None
+        self.archive = zipfile.ZipFile(archive) if archive else None
+        self._entries = set(self.archive.namelist()) if self.archive else set()
+
+    def exists(self, ref: str) -> bool:
+        if self.archive is not None:
+            return ref in self._entries
+        path = self._path(ref)
+        return path is not None and path.is_file()
+
+    def _path(self, ref: str) -> Path | None:
+        if self.directory is None:
+            return None
+        path = (self.directory / ref).resolve()
+        # References must stay inside the images directory.
+        return path if path.is_relative_to(self.directory) else None
+
+    def open(self, ref: str):
+        if self.archive is not None:
+            return self.archive.open(ref)
+        return open(self._path(ref), "rb")
+
+    def close(self) -> None:
+        if self.archive is not None:
+            self.archive.close()
+
+
+class Lookups:
+    """In-memory maps from file values to categories and wage tiers."""
+
+    def __init__(self, create_categories: bool = False, dry_run: bool = False):
+        self.create_categories = create_categories
+        self.dry_run = dry_run
+        self.categories: dict[str, int | None] = {}
+        # Reverse display order, so the first category in the menu wins a
+        # name clash; slugs are unique and take precedence over names.
+        rows = list(Category.objects.order_by("-sort_order", "-pk").values_list("pk", "slug", "name"))
+        for pk, _, name in rows:
+            self.categories[search.normalize(name.strip())] = pk
+        for pk, slug, _ in rows:
+            self.categories[slug.lower()] = pk
+        self.tiers = {tier.pk: tier for tier in WageTier.objects.all()}
+        self.tiers_by_name = {
+            search.normalize(tier.name.strip()): tier
+            for tier in sorted(self.tiers.values(), key=lambda t: (-t.sort_order, -t.pk))
+        }
+        self.created_categories = 0
+
+    def category_id(self, value) -> int | None:
+        text = _text(value)
+        if not text:
+            raise RowError("category is required")
+        for key in (text.lower(), search.normalize(text)):
+            if key in self.categories:
+                return self.categories[key]
+        if not self.create_categories:
+            raise RowError(f"unknown category: {text}")
+        # Dry runs only note that the category would be created.
+        pk = None if self.dry_run else Category.objects.create(name=text).pk
+        self.categories[search.normalize(text)] = pk
+        self.created_categories += 1
+        return pk
+
+    def wage_tier(self, value) -> WageTier | None:
+        text = _text(value)
+        if not text:
+            return None
+        try:
+            return self.tiers_by_name[search.normalize(text)]
+        except KeyError:
+            raise RowError(f"unknown wage tier: {text}") from None
+
+
+@dataclass
+class ImportStats:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    images: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def _update_rows(products, field_names) -> None:
+    """Write ``field_names`` of ``products`` with one ``executemany``.
+
+    ``bulk_update()`` spends most of its time building per-row ``CASE``
+    expressions; a parameterised ``UPDATE ... WHERE id = %s`` is far cheaper.
+    """
+    fields = [Product._meta.get_field(name) for name in field_names]
+    quote = connection.ops.quote_name
+    assignments = ", ".join(f"{quote(field.column)} = %s" for field in fields)
+    params = [
+        [field.get_db_prep_save(getattr(product, field.attname), connection) for field in fields]
+        + [product.pk]
+        for product in products
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(Product._meta.db_table)} SET {assignments} "
+            f"WHERE {quote(Product._meta.pk.column)} = %s",
+            params,
+        )
+
+
+class CatalogImporter:
+    """Imports a stream of rows chunk by chunk; see the module docstring."""
+
+    def __init__(
+        self,
+        images: ImageSource | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        dry_run: bool = False,
+        create_categories: bool = False,
+    ):
+        self.images = images
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.lookups = Lookups(create_categories=create_categories, dry_run=dry_run)
+        self.stats = ImportStats()
+        self.rate = current_rate()
+
+    def clean(self, raw: dict) -> dict:
+        """Validate one row; only the columns present in it are returned."""
+        data = {}
+        for column in COLUMNS:
+            if column not in raw:
+                continue
+            value = raw[column]
+            if column == "category":
+                data["category_id"] = self.lookups.category_id(value)
+            elif column == "wage_tier":
+                data["wage_tier"] = self.lookups.wage_tier(value)
+            elif column in ("is_active", "is_featured"):
+                if _text(value):
+                    data[column] = _bool(value)
+            elif column == "images":
+                refs = _image_refs(value)
+                missing = [ref for ref in refs if self.images is None or not self.images.exists(ref)]
+                if missing:
+                    raise RowError(f"image not found: {missing[0]}")
+                data["images"] = refs
+            elif column in ("slug", "weight_gram") and not _text(value):
+                continue
+            else:
+                model_field = Product._meta.get_field(column)
+                try:
+                    data[column] = model_field.clean(_text(value), None)
+                except ValidationError as exc:
+                    raise RowError(f"{column}: {' '.join(exc.messages)}") from None
+        return data
+
+    def run(self, rows, on_chunk=None) -> ImportStats:
+        """Import ``(line, row)`` pairs; ``on_chunk(stats)`` runs after each commit."""
+        chunk = []
+        for line, raw in rows:
+            self.stats.rows += 1
+            try:
+                if isinstance(raw, RowError):
+                    raise raw
+                chunk.append((line, self.clean(raw)))
+            except RowError as exc:
+                self.stats.add_error(line, str(exc))
+            if len(chunk) >= self.batch_size:
+                self.write_chunk(chunk)
+                chunk = []
+                if on_chunk:
+                    on_chunk(self.stats)
+        if chunk:
+            self.write_chunk(chunk)
+        if on_chunk:
+            on_chunk(self.stats)
+        return self.stats
+
+    def _existing(self, chunk) -> tuple[dict, dict]:
+        codes = {data["code"] for _, data in chunk if data.get("code")}
+        slugs = {data["slug"] for _, data in chunk if data.get("slug")}
+        by_code: dict[str, Product] = {}
+        by_slug: dict[str, Product] = {}
+        if codes or slugs:
+            for product in Product.objects.filter(Q(code__in=codes) | Q(slug__in=slugs)).order_by("pk"):
+                product.wage_tier = self.lookups.tiers.get(product.wage_tier_id)
+                if product.code:
+                    by_code.setdefault(product.code, product)
+                by_slug[product.slug] = product
+        return by_code, by_slug
+
+    def _price(self, product: Product):
+        return price_for_product(product, self.rate) if self.rate is not None else None
+
+    def _repriced(self, product: Product) -> bool:
+        return product.computed_price != self._price(product)
+
+    def write_chunk(self, chunk) -> None:
+        by_code, by_slug = self._existing(chunk)
+        creates: dict[int, Product] = {}
+        updates: dict[int, Product] = {}
+        update_fields = {"computed_price", "updated_at"}
+        image_jobs: dict[int, tuple[Product, list[str]]] = {}
+
+        for line, data in chunk:
+            data = dict(data)
+            refs = data.pop("images", None)
+            product = by_code.get(data.get("code")) or by_slug.get(data.get("slug"))
+            if product is None:
+                missing = [
+                    name
+                    for name in REQUIRED_FOR_CREATE
+                    if name not in data and f"{name}_id" not in data
+                ]
+                if missing:
+                    self.stats.add_error(line, f"{', '.join(missing)} required for new products")
+                    continue
+                product = Product(**data)
+                creates[id(product)] = product
+                if product.code:
+                    by_code[product.code] = product
+                if product.slug:
+                    by_slug[product.slug] = product
+            else:
+                data.pop("slug", None)  # existing slugs are never changed
+                changed = {
+                    name
+                    for name, value in data.items()
+                    if getattr(product, "wage_tier_id" if name == "wage_tier" else name)
+                    != (value.pk if name == "wage_tier" and value else value)
+                }
+                for name in changed:
+                    setattr(product, name, data[name])
+                update_fields.update("category" if name == "category_id" else name for name in changed)
+                if product.pk is not None and (changed or self._repriced(product)):
+                    updates[product.pk] = product
+            if refs and not product.main_image_id:
+                image_jobs[id(product)] = (product, refs)
+
+        now = timezone.now()
+        for product in (*creates.values(), *updates.values()):
+            product.computed_price = self._price(product)
+            product.updated_at = now
+        if self.dry_run:
+            self.stats.created += len(creates)
+            self.stats.updated += len(updates)
+            self.stats.images += sum(len(refs) for _, refs in image_jobs.values())
+            return
+
+        generated = [product for product in creates.values() if not product.slug]
+        for attempt in range(SAVE_ATTEMPTS):
+            assign_slugs(creates.values())
+            try:
+                with transaction.atomic():
+                    images = self._save(
+                        list(creates.values()), list(updates.values()), update_fields, image_jobs
+                    )
+                break
+            except IntegrityError:
+                # Most likely a concurrent writer took one of our slugs.
+                if attempt == SAVE_ATTEMPTS - 1:
+                    raise
+                for product in creates.values():
+                    product.pk = None
+                    product._state.adding = True
+                for product in generated:
+                    product.slug = ""
+        self.stats.created += len(creates)
+        self.stats.updated += len(updates)
+        self.stats.images += images
+
+    def _save(self, creates, updates, update_fields, image_jobs) -> int:
+        Product.objects.bulk_create(creates)
+        if updates:
+            _update_rows(updates, sorted(update_fields))
+        images = self._attach_images(image_jobs.values()) if image_jobs else 0
+        search.index_products([product.pk for product in (*creates, *updates)])
+        cache.invalidate(cache.CATALOG)
+        cache.invalidate(cache.SIMILAR)
+        return images
+
+    def _attach_images(self, jobs) -> int:
+        images = []
+        for product, refs in jobs:
+            for index, ref in enumerate(refs):
+                image = ProductImage(product_id=product.pk, is_main=index == 0, sort_order=index)
+                with self.images.open(ref) as handle:
+                    image.content_hash, image.image = store_content(File(handle), ref)
+                images.append(image)
+        ProductImage.objects.bulk_create(images)
+        products = []
+        for image in images:
+            if image.is_main:
+                products.append(Product(pk=image.product_id, main_image_id=image.pk))
+        _update_rows(products, ["main_image"])
+        return len(images)
+
+
+class Checkpoint:
+    """Records how many rows of a file were committed so an import can resume."""
+
+    def __init__(self, path: str | Path, source: str | Path):
+        self.path = Path(path)
+        stat = os.stat(source)
+        self.fingerprint = {"source": str(Path(source).resolve()), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    def load(self) -> int:
+        """Rows already committed, or 0 if there is no checkpoint for this file."""
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return 0
+        if payload.get("file") != self.fingerprint:
+            return 0
+        return int(payload.get("rows", 0))
+
+    def save(self, rows: int) -> None:
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(json.dumps({"file": self.fingerprint, "rows": rows}), encoding="utf-8")
+        os.replace(temporary, self.path)
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def _export_row(row: dict, images: list[str]) -> dict:
+    return {
+        "code": row["code"],
+        "name": row["name"],
+        "slug": row["slug"],
+        "category": row["category__slug"],
+        "wage_tier": row["wage_tier__name"] or "",
+        "weight_gram": str(row["weight_gram"]),
+        "description": row["description"],
+        "is_active": int(row["is_active"]),
+        "is_featured": int(row["is_featured"]),
+        "images": images,
+    }
+
+
+def export_rows(queryset=None, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Yield export rows in primary key order, fetching images per batch."""
+    queryset = (queryset if queryset is not None else Product.objects.all()).order_by("pk")
+    fields = (
+        "pk",
+        "code",
+        "name",
+        "slug",
+        "category__slug",
+        "wage_tier__name",
+        "weight_gram",
+        "description",
+        "is_active",
+        "is_featured",
+    )
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).values(*fields)[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1]["pk"]
+        images: dict[int, list[str]] = {}
+        for product_id, name in (
+            ProductImage.objects.filter(product_id__in=[row["pk"] for row in batch])
+            .order_by("product_id", "-is_main", "sort_order", "id")
+            .values_list("product_id", "image")
+        ):
+            images.setdefault(product_id, []).append(name)
+        for row in batch:
+            yield _export_row(row, images.get(row["pk"], []))
+
+
+def write_rows(rows, handle, fmt: str, archive: zipfile.ZipFile | None = None) -> int:
+    """Write export rows to ``handle``; image files are copied into ``archive``."""
+    writer = csv.DictWriter(handle, fieldnames=COLUMNS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    count = 0
+    for row in rows:
+        if archive is not None:
+            for name in row["images"]:
+                if name not in archive.NameToInfo and default_storage.exists(name):
+                    with default_storage.open(name) as source, archive.open(name, "w") as target:
+                        for chunk in iter(lambda: source.read(1 << 16), b""):
+                            target.write(chunk)
+        if writer:
+            writer.writerow({**row, "images": IMAGE_SEPARATOR.join(row["images"])})
+        else:
+            handle.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
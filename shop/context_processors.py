@@ -2,20 +2,62 @@
 Context processors for the shop app.
 
 Provides global variables used throughout templates such as the list of
-categories to populate the navigation bar and the site configuration.
+categories to populate the navbar and the site configuration. Both are cached
+as plain Python structures, in process and in the shared cache, under the
+``navigation`` cache version so that a warm request does not hit the database.
 """
 
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import NAVIGATION, get_version
+from .metrics import timed
 from .models import Category, SiteConfig
 
+SITE_CONFIG_FIELDS = (
+    "store_name",
+    "whatsapp_number",
+    "address",
+    "instagram_link",
+    "phone_number",
+    "working_hours",
+    "updated_at",
+)
+
+# Process-local copy of the last loaded data, tagged with its version.
+_local: dict[str, tuple[int, dict]] = {}
+
+
+def _load_navigation() -> dict:
+    return {
+        "navbar_categories": list(
+            Category.objects.filter(is_active=True)
+            .order_by("sort_order", "name")
+            .values("name", "slug")
+        ),
+        "site_config": SiteConfig.objects.order_by("pk").values(*SITE_CONFIG_FIELDS).first(),
+    }
 
-def global_context(request):  # pragma: no cover - simple context provider
+
+def get_navigation() -> dict:
+    """Return navbar categories and site config, loading them at most once per version."""
+    version = get_version(NAVIGATION)
+    local = _local.get(NAVIGATION)
+    if local is not None and local[0] == version:
+        return local[1]
+    key = f"shop:{NAVIGATION}:{version}:data"
+    data = cache.get(key)
+    if data is None:
+        data = _load_navigation()
+        cache.set(key, data, getattr(settings, "SHOP_NAVIGATION_CACHE_TIMEOUT", 60 * 60 * 24))
+    _local[NAVIGATION] = (version, data)
+    return data
+
+
+def global_context(request):
     """Global context for navbar categories and site configuration.
 
     This makes categories and site configuration available in every template.
     """
-    navbar_categories = Category.objects.filter(is_active=True).order_by("sort_order", "name")
-    site_config = SiteConfig.objects.first()
-    return {
-        "navbar_categories": navbar_categories,
-        "site_config": site_config,
-    }
+    with timed("navigation_seconds"):
+        return get_navigation()
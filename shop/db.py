@@ -0,0 +1,68 @@
+"""
+SQLite tuning and read/write routing for production.
+
+:func:`configure_sqlite` runs on every new SQLite connection and applies
+``SHOP_SQLITE_PRAGMAS``: WAL journaling lets readers proceed while a writer
+commits, ``busy_timeout`` makes a second writer wait instead of failing with
+"database is locked", ``synchronous=NORMAL`` is durable enough under WAL
+and saves an fsync per commit, and ``mmap_size``/``cache_size`` keep hot
+pages in memory.
+
+:class:`ReadReplicaRouter` sends reads of ``shop`` models to the ``replica``
+alias, a read-only connection to the same file (or a real replica), and all
+writes to ``default``. Reads inside a transaction on ``default`` stay there
+so a request always sees its own uncommitted writes.
+"""
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA = "replica"
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "wal",
+    "busy_timeout": 5000,
+    "synchronous": "normal",
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative values are KiB: 64 MiB of page cache per connection.
+    "cache_size": -64 * 1024,
+    "temp_store": "memory",
+}
+
+
+def configure_sqlite(sender, connection, **kwargs) -> None:
+    """``connection_created`` handler applying ``SHOP_SQLITE_PRAGMAS``."""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SHOP_SQLITE_PRAGMAS", DEFAULT_PRAGMAS)
+    read_only = connection.settings_dict.get("OPTIONS", {}).get("uri") and "mode=ro" in str(
+        connection.settings_dict["NAME"]
+    )
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            # The journal mode is a property of the file; only writers set it.
+            if name == "journal_mode" and read_only:
+                continue
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class ReadReplicaRouter:
+    """Reads of ``shop`` models from ``replica``, everything else on ``default``."""
+
+    app_labels = {"shop"}
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.app_labels or REPLICA not in settings.DATABASES:
+            return None
+        if connections["default"].in_atomic_block:
+            return "default"
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {"default", REPLICA} or None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
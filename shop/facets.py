@@ -0,0 +1,201 @@
+"""
+Faceted filtering for category pages.
+
+Customers can narrow a category by wage tier (``?wage=<id>``, repeatable) and
+by weight (``?min_weight=`` / ``?max_weight=``). Facet counts for every wage
+tier and every configured weight bucket are computed in one aggregate query
+with conditional ``Count`` expressions and cached per category under the
+newest ``updated_at`` and row count of the category's products, so edits in
+other categories keep the cache warm, and under the ``wage-tiers`` version.
+
+Counts are disjunctive: a wage tier's count respects the weight filter but not
+the other selected tiers, and vice versa, so every option shows how many
+products selecting it would add.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.http import QueryDict
+
+from .cache import WAGE_TIERS, cached_aggregate, versioned_key
+from .models import Product, WageTier
+from .pagination import INT64_RANGE
+
+# Half-open ``[low, high)`` ranges in grams; ``None`` means unbounded.
+DEFAULT_WEIGHT_BUCKETS = ((0, 2), (2, 5), (5, 10), (10, 20), (20, None))
+FACET_CACHE_TIMEOUT = 60 * 60
+
+
+def get_weight_buckets() -> tuple:
+    return tuple(getattr(settings, "SHOP_WEIGHT_BUCKETS", DEFAULT_WEIGHT_BUCKETS))
+
+
+def _decimal(value: str | None) -> Decimal | None:
+    if not value:
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() and number >= 0 else None
+
+
+def _weight_q(low, high) -> Q:
+    q = Q()
+    if low is not None:
+        q &= Q(weight_gram__gte=low)
+    if high is not None:
+        q &= Q(weight_gram__lt=high)
+    return q
+
+
+def _count(q: Q) -> Count:
+    return Count("pk", filter=q) if q else Count("pk")
+
+
+def _bucket_label(low, high) -> str:
+    if high is None:
+        return f"{low} گرم و بیشتر" if low else "همه وزن‌ها"
+    if not low:
+        return f"کمتر از {high} گرم"
+    return f"{low} تا {high} گرم"
+
+
+@dataclass(frozen=True)
+class FacetSelection:
+    """The filters chosen in the query string."""
+
+    wage_tier_ids: tuple[int, ...] = ()
+    min_weight: Decimal | None = None
+    max_weight: Decimal | None = None
+
+    @classmethod
+    def from_querydict(cls, params: QueryDict) -> "FacetSelection":
+        # str.isdigit() also accepts digits int() rejects, such as "²", and
+        # ids past 64 bits overflow SQLite.
+        wage_ids = sorted(
+            {
+                int(value)
+                for value in params.getlist("wage")
+                if value.isascii() and value.isdigit() and int(value) in INT64_RANGE
+            }
+        )
+        return cls(
+            wage_tier_ids=tuple(wage_ids),
+            min_weight=_decimal(params.get("min_weight")),
+            max_weight=_decimal(params.get("max_weight")),
+        )
+
+    @property
+    def is_active(self) -> bool:
+        return bool(self.wage_tier_ids) or self.min_weight is not None or self.max_weight is not None
+
+    def wage_q(self) -> Q:
+        return Q(wage_tier_id__in=self.wage_tier_ids) if self.wage_tier_ids else Q()
+
+    def weight_q(self) -> Q:
+        return _weight_q(self.min_weight, self.max_weight)
+
+    def apply(self, queryset):
+        return queryset.filter(self.wage_q() & self.weight_q())
+
+    def cache_key(self) -> str:
+        wages = ",".join(str(pk) for pk in self.wage_tier_ids)
+        return f"{wages}|{self.min_weight}|{self.max_weight}"
+
+
+def category_stats(category_id: int) -> dict:
+    """Newest ``updated_at`` and count of a category's active products.
+
+    Every product edit bumps ``updated_at``; deactivations, moves and
+    deletions change the count. Cached per catalog version.
+    """
+    return cached_aggregate(
+        Product.objects.active().filter(category_id=category_id),
+        last_modified=Max("updated_at"),
+        count=Count("pk"),
+    )
+
+
+def compute_facet_counts(category_id: int, selection: FacetSelection) -> dict:
+    """Return cached facet counts for a category, computing them in one query."""
+    scope = category_stats(category_id)
+    stamp = scope["last_modified"].timestamp() if scope["last_modified"] else 0
+    key = versioned_key(WAGE_TIERS, "facets", category_id, stamp, scope["count"], selection.cache_key())
+    counts = cache.get(key)
+    if counts is not None:
+        return counts
+
+    tiers = list(WageTier.objects.filter(is_active=True).values_list("pk", "name"))
+    buckets = get_weight_buckets()
+    aggregates = {"total": _count(selection.wage_q() & selection.weight_q())}
+    for pk, _ in tiers:
+        aggregates[f"wage_{pk}"] = _count(Q(wage_tier_id=pk) & selection.weight_q())
+    for index, (low, high) in enumerate(buckets):
+        aggregates[f"weight_{index}"] = _count(_weight_q(low, high) & selection.wage_q())
+    row = Product.objects.active().filter(category_id=category_id).aggregate(**aggregates)
+
+    counts = {
+        "total": row["total"],
+        "wage_tiers": [(pk, name, row[f"wage_{pk}"]) for pk, name in tiers],
+        "weights": [
+            (low, high, row[f"weight_{index}"]) for index, (low, high) in enumerate(buckets)
+        ],
+    }
+    cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
+
+
+def build_facets(category_id: int, params: QueryDict) -> dict:
+    """Facet options with counts, selection state and toggle URLs for templates."""
+    selection = FacetSelection.from_querydict(params)
+    counts = compute_facet_counts(category_id, selection)
+
+    def query_with(**changes) -> str:
+        query = params.copy()
+        query.pop("page", None)
+        query.pop("cursor", None)
+        for name, values in changes.items():
+            query.setlist(name, [str(value) for value in values if value is not None])
+        return query.urlencode()
+
+    wage_tiers = []
+    for pk, name, count in counts["wage_tiers"]:
+        selected = pk in selection.wage_tier_ids
+        toggled = set(selection.wage_tier_ids) ^ {pk}
+        wage_tiers.append({
+            "id": pk,
+            "name": name,
+            "count": count,
+            "selected": selected,
+            "query": query_with(wage=sorted(toggled)),
+        })
+
+    weights = []
+    for low, high, count in counts["weights"]:
+        low_value = Decimal(low) if low is not None else None
+        high_value = Decimal(high) if high is not None else None
+        selected = selection.min_weight == low_value and selection.max_weight == high_value
+        weights.append({
+            "label": _bucket_label(low, high),
+            "count": count,
+            "selected": selected,
+            "query": query_with(
+                min_weight=[] if selected else [low],
+                max_weight=[] if selected else [high],
+            ),
+        })
+
+    return {
+        "selection": selection,
+        "total": counts["total"],
+        "wage_tiers": wage_tiers,
+        "weights": weights,
+        "clear_query": query_with(wage=[], min_weight=[], max_weight=[]),
+    }
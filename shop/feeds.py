@@ -0,0 +1,274 @@
+"""
+Sitemaps and a product feed for crawlers and marketplaces.
+
+Products are split into sitemaps by primary-key range (``SHOP_SITEMAP_CHUNK_SIZE``
+ids per file), so a product always stays in the same file and an edit only
+changes the file that contains it. The sitemap index lists every chunk with
+its ``lastmod``, the newest ``updated_at`` in it, from one grouped query
+cached per catalog version.
+
+A chunk's rendered XML is cached under its own ``lastmod`` and row count
+rather than the catalog version: after an edit the index and the chunk
+statistics are recomputed, but only the chunk whose statistics changed is
+rendered again. A miss streams the file from ``values_list().iterator()``
+and fills the cache once the last row is written.
+
+The product feed (JSON or XML) streams every active product the same way,
+straight from ``values_list()`` rows. Its ETag follows the catalog cache
+version, which also moves for price and photo changes that leave
+``updated_at`` alone, and the navigation version, since items carry their
+category's name, so pollers get a ``304`` when nothing changed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count, F, Max
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .cache import CATALOG, NAVIGATION, cached_aggregate, get_version, last_changed, versioned_key
+from .models import Category, Product
+
+DEFAULT_CHUNK_SIZE = 10_000
+ITERATOR_CHUNK_SIZE = 2000
+# Rows joined into one string before it is yielded to the server.
+WRITE_BATCH = 500
+CHUNK_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+XML_CONTENT_TYPE = "application/xml; charset=utf-8"
+
+
+def chunk_size() -> int:
+    return getattr(settings, "SHOP_SITEMAP_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+
+def chunk_products(chunk: int):
+    size = chunk_size()
+    return Product.objects.active().filter(pk__gt=chunk * size, pk__lte=(chunk + 1) * size)
+
+
+def chunk_stats() -> list[dict]:
+    """``{"chunk", "lastmod", "count"}`` for every non-empty product chunk."""
+    size = chunk_size()
+    key = versioned_key(CATALOG, "sitemap-chunks", size)
+    stats = cache.get(key)
+    if stats is None:
+        stats = list(
+            Product.objects.active()
+            .annotate(chunk=(F("pk") - 1) / size)
+            .values("chunk")
+            .annotate(lastmod=Max("updated_at"), count=Count("pk"))
+            .order_by("chunk")
+        )
+        cache.set(key, stats, 60 * 60)
+    return stats
+
+
+def w3c_datetime(value) -> str:
+    """``value`` in the W3C datetime format sitemaps and feeds use."""
+    return value.isoformat(timespec="seconds")
+
+
+def base_url(request) -> str:
+    """Scheme and host of ``request``, without a trailing slash."""
+    return request.build_absolute_uri("/").rstrip("/")
+
+
+def url_template(name: str, base: str) -> tuple[str, str]:
+    """Prefix and suffix around the slug of ``name``, so rows skip ``reverse()``."""
+    prefix, suffix = reverse(name, kwargs={"slug": "__slug__"}).split("__slug__")
+    return base + prefix, suffix
+
+
+def conditional_response(request, response_factory, last_modified, etag: str):
+    """A ``304`` when the validators match, else ``response_factory()``; both carry them."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = response_factory()
+    response.headers["ETag"] = etag
+    if timestamp is not None:
+        response.headers["Last-Modified"] = http_date(timestamp)
+    return response
+
+
+def _batched(pieces):
+    batch = []
+    for piece in pieces:
+        batch.append(piece)
+        if len(batch) >= WRITE_BATCH:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def _cache_when_complete(key: str, chunks):
+    """Yield ``chunks`` and store their concatenation once all were sent."""
+    written = []
+    for chunk in chunks:
+        written.append(chunk)
+        yield chunk
+    cache.set(key, "".join(written), CHUNK_CACHE_TIMEOUT)
+
+
+@require_safe
+def sitemap_index(request):
+    base = base_url(request)
+    stats = chunk_stats()
+    last_modified = max((row["lastmod"] for row in stats), default=None)
+    parts = [XML_DECLARATION, f'<sitemapindex xmlns="{SITEMAP_NS}">']
+    parts.append(f"<sitemap><loc>{escape(base + reverse('sitemap_categories'))}</loc>")
+    if last_modified:
+        parts.append(f"<lastmod>{w3c_datetime(last_modified)}</lastmod>")
+    parts.append("</sitemap>")
+    for row in stats:
+        loc = base + reverse("sitemap_products", kwargs={"chunk": row["chunk"]})
+        parts.append(f"<sitemap><loc>{escape(loc)}</loc><lastmod>{w3c_datetime(row['lastmod'])}</lastmod></sitemap>")
+    parts.append("</sitemapindex>\n")
+    body = "".join(parts)
+    etag = quote_etag(hashlib.md5(body.encode(), usedforsecurity=False).hexdigest())
+    return conditional_response(request, lambda: HttpResponse(body, content_type=XML_CONTENT_TYPE), last_modified, etag)
+
+
+@require_safe
+def sitemap_categories(request):
+    base = base_url(request)
+    categories = list(
+        Category.objects.filter(is_active=True)
+        .annotate(lastmod=Max("products__updated_at"))
+        .order_by("sort_order", "name")
+        .values_list("slug", "lastmod")
+    )
+    prefix, suffix = url_template("shop:category_detail", base)
+    parts = [XML_DECLARATION, f'<urlset xmlns="{SITEMAP_NS}">']
+    for slug, lastmod in categories:
+        parts.append(f"<url><loc>{escape(prefix + slug + suffix)}</loc>")
+        if lastmod:
+            parts.append(f"<lastmod>{w3c_datetime(lastmod)}</lastmod>")
+        parts.append("</url>")
+    parts.append("</urlset>\n")
+    return HttpResponse("".join(parts), content_type=XML_CONTENT_TYPE)
+
+
+def _product_urls(chunk: int, base: str):
+    prefix, suffix = url_template("shop:product_detail", base)
+    yield XML_DECLARATION + f'<urlset xmlns="{SITEMAP_NS}">'
+    rows = chunk_products(chunk).order_by("pk").values_list("slug", "updated_at")
+    yield from _batched(
+        f"<url><loc>{escape(prefix + slug + suffix)}</loc><lastmod>{w3c_datetime(updated_at)}</lastmod></url>"
+        for slug, updated_at in rows.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    )
+    yield "</urlset>\n"
+
+
+@require_safe
+def sitemap_products(request, chunk: int):
+    # Unknown chunks never reach the database, whose integers they may overflow.
+    stats = next((row for row in chunk_stats() if row["chunk"] == chunk), None)
+    if stats is None:
+        raise Http404("Empty sitemap chunk")
+    base = base_url(request)
+    version = f"{chunk_size()}:{chunk}:{stats['lastmod'].timestamp()}:{stats['count']}"
+    digest = hashlib.md5(f"{version}:{base}".encode(), usedforsecurity=False).hexdigest()
+    key = f"shop:sitemap:products:{digest}"
+
+    def build():
+        cached = cache.get(key)
+        if cached is not None:
+            return HttpResponse(cached, content_type=XML_CONTENT_TYPE)
+        return StreamingHttpResponse(
+            _cache_when_complete(key, _product_urls(chunk, base)), content_type=XML_CONTENT_TYPE
+        )
+
+    return conditional_response(request, build, stats["lastmod"], quote_etag(digest))
+
+
+FEED_FIELDS = (
+    "pk",
+    "name",
+    "code",
+    "slug",
+    "weight_gram",
+    "computed_price",
+    "category__name",
+    "main_image__image",
+    "updated_at",
+)
+
+
+def _feed_items(base: str):
+    prefix, suffix = url_template("shop:product_detail", base)
+    rows = Product.objects.active().order_by("pk").values_list(*FEED_FIELDS)
+    for pk, name, code, slug, weight, price, category, image, updated_at in rows.iterator(
+        chunk_size=ITERATOR_CHUNK_SIZE
+    ):
+        yield {
+            "id": pk,
+            "name": name,
+            "code": code,
+            "url": prefix + slug + suffix,
+            "weight_gram": float(weight),
+            "price": int(price) if price is not None else None,
+            "category": category,
+            "image": urljoin(base + "/", default_storage.url(image)) if image else None,
+            "updated_at": w3c_datetime(updated_at),
+        }
+
+
+def _json_feed(base: str):
+    yield '{"products":['
+    yield from _batched(
+        ("," if index else "") + json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+        for index, item in enumerate(_feed_items(base))
+    )
+    yield "]}\n"
+
+
+def _xml_feed(base: str):
+    yield XML_DECLARATION + "<products>"
+
+    def element(item):
+        fields = "".join(
+            f"<{key}>{escape(str(value))}</{key}>" for key, value in item.items() if value not in (None, "")
+        )
+        return f"<product>{fields}</product>"
+
+    yield from _batched(element(item) for item in _feed_items(base))
+    yield "</products>\n"
+
+
+@require_safe
+def product_feed(request, fmt: str):
+    """Every active product as JSON or XML, for marketplace and app syncs."""
+    stats = cached_aggregate(Product.objects.active(), lastmod=Max("updated_at"), count=Count("pk"))
+    base = base_url(request)
+    version = f"feed:{fmt}:{get_version(CATALOG)}:{get_version(NAVIGATION)}:{base}"
+    # Products that left the feed and renamed categories leave updated_at alone.
+    candidates = [last_changed(CATALOG), last_changed(NAVIGATION)]
+    if stats["lastmod"]:
+        candidates.append(stats["lastmod"])
+    etag = quote_etag(hashlib.md5(version.encode(), usedforsecurity=False).hexdigest())
+    if fmt == "json":
+        content_type, stream = "application/json", _json_feed
+    else:
+        content_type, stream = XML_CONTENT_TYPE, _xml_feed
+    return conditional_response(
+        request,
+        lambda: StreamingHttpResponse(stream(base), content_type=content_type),
+        max(candidates),
+        etag,
+    )
@@ -0,0 +1,179 @@
+"""
+Responsive image derivatives for product photos.
+
+Every ``ProductImage`` original is resized to a fixed set of widths and
+encoded in modern formats (AVIF, WebP) plus a JPEG fallback. Derivatives are
+written next to the original under ``products/<product_id>/`` and their
+storage names are recorded on ``ProductImage.derivatives`` so that templates
+can build ``srcset`` attributes without touching the storage backend.
+
+Derivatives are built off the request path by a small thread pool; Pillow
+releases the GIL while resampling and encoding, so threads are enough here.
+The ``build_image_derivatives`` management command uses a process pool to
+backfill existing media on all cores.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (320, 640, 960, 1280)
+DEFAULT_FORMATS = ("avif", "webp", "jpeg")
+
+ENCODER_OPTIONS = {
+    "avif": {"format": "AVIF", "quality": 55},
+    "webp": {"format": "WEBP", "quality": 75, "method": 4},
+    "jpeg": {"format": "JPEG", "quality": 80, "optimize": True, "progressive": True},
+}
+EXTENSIONS = {"avif": ".avif", "webp": ".webp", "jpeg": ".jpg"}
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _format_supported(fmt: str) -> bool:
+    """Return True when the installed Pillow can encode ``fmt``."""
+    if fmt == "jpeg":
+        return True
+    try:
+        return bool(features.check_module(fmt))
+    except ValueError:
+        # Older Pillow releases do not know the module name at all.
+        return False
+
+
+def get_widths() -> tuple[int, ...]:
+    """Target widths in pixels, smallest first."""
+    return tuple(sorted(getattr(settings, "SHOP_IMAGE_WIDTHS", DEFAULT_WIDTHS)))
+
+
+def get_formats() -> tuple[str, ...]:
+    """Configured output formats that this Pillow build can actually encode."""
+    formats = getattr(settings, "SHOP_IMAGE_FORMATS", DEFAULT_FORMATS)
+    return tuple(fmt for fmt in formats if fmt in ENCODER_OPTIONS and _format_supported(fmt))
+
+
+def derivative_name(original_name: str, width: int, fmt: str) -> str:
+    """Storage name of a derivative, placed next to the original file."""
+    root, _ = os.path.splitext(original_name)
+    return f"{root}-{width}w{EXTENSIONS[fmt]}"
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    if fmt == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, **ENCODER_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def build_derivatives(original_name: str, storage=None) -> dict:
+    """Generate all derivatives for one original and return their manifest.
+
+    The manifest is the value stored on ``ProductImage.derivatives``::
+
+        {"source": "products/1/a.jpg", "width": 2000, "height": 1500,
+         "sources": {"webp": [[320, "products/1/a-320w.webp"], ...], ...}}
+
+    Widths larger than the original are clamped to the original width so we
+    never upscale.
+    """
+    storage = storage or default_storage
+    with storage.open(original_name, "rb") as fh:
+        with Image.open(fh) as opened:
+            source = ImageOps.exif_transpose(opened)
+            source.load()
+    if source.mode not in ("RGB", "RGBA"):
+        source = source.convert("RGBA" if "A" in source.getbands() else "RGB")
+
+    src_width, src_height = source.size
+    targets = sorted({min(width, src_width) for width in get_widths()})
+    sources: dict[str, list[list]] = {fmt: [] for fmt in get_formats()}
+
+    for width in targets:
+        if width == src_width:
+            resized = source
+        else:
+            height = max(1, round(src_height * width / src_width))
+            resized = source.resize((width, height), Image.LANCZOS)
+        for fmt in sources:
+            name = derivative_name(original_name, width, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            saved_name = storage.save(name, ContentFile(_encode(resized, fmt)))
+            sources[fmt].append([width, saved_name])
+
+    return {
+        "source": original_name,
+        "width": src_width,
+        "height": src_height,
+        "sources": sources,
+    }
+
+
+def generate_for_image(image_id: int) -> None:
+    """Build derivatives for a ``ProductImage`` row and record the manifest."""
+    from django.utils import timezone
+
+    from .cache import CATALOG, invalidate
+    from .models import Product, ProductImage
+
+    close_old_connections()
+    try:
+        row = (
+            ProductImage.objects.filter(pk=image_id)
+            .values_list("image", "product_id")
+            .first()
+        )
+        if not row or not row[0]:
+            return
+        name, product_id = row
+        manifest = build_derivatives(name)
+        # Guard against the image being replaced while we were encoding.
+        if ProductImage.objects.filter(pk=image_id, image=name).update(derivatives=manifest):
+            # Pages and API responses now list the derivatives; let their
+            # validators notice.
+            Product.objects.filter(pk=product_id).update(updated_at=timezone.now())
+            invalidate(CATALOG)
+    except Exception:  # pragma: no cover - logged, never raised into the pool
+        logger.exception("Failed to build derivatives for ProductImage %s", image_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, "SHOP_IMAGE_WORKERS", min(4, os.cpu_count() or 1))
+            _executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="shop-images",
+            )
+        return _executor
+
+
+def schedule_derivatives(image_id: int) -> None:
+    """Queue derivative generation, or run it inline when configured to."""
+    if getattr(settings, "SHOP_IMAGE_DERIVATIVES_SYNC", False):
+        generate_for_image(image_id)
+    else:
+        _get_executor().submit(generate_for_image, image_id)
+
+
+def needs_derivatives(image_name: str, manifest: dict | None) -> bool:
+    """True when ``manifest`` is missing or describes a different file."""
+    return bool(image_name) and (manifest or {}).get("source") != image_name
@@ -0,0 +1,179 @@
+"""Compare the sync views with their async variants, request by request."""
+
+import asyncio
+import json
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+
+from shop import views
+from shop.models import Product
+
+from .bench_views import bench_targets, git_revision, percentile
+
+# bench_views target label -> (sync view, async view)
+PAIRS = {
+    "home": (views.HomeView, views.AsyncHomeView),
+    "product_list": (views.ProductListView, views.AsyncProductListView),
+    "category_detail": (views.CategoryDetailView, views.AsyncCategoryDetailView),
+    "category_detail_facet": (views.CategoryDetailView, views.AsyncCategoryDetailView),
+    "product_detail": (views.ProductDetailView, views.AsyncProductDetailView),
+}
+MODES = ("sync", "async", "async_parallel")
+
+
+class QueryDelay:
+    """Sleep before every query to stand in for a database across the network."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, connection=None, **kwargs):
+        connections_ = [connection] if connection else connections.all(initialized_only=True)
+        for conn in connections_:
+            if self not in conn.execute_wrappers:
+                conn.execute_wrappers.append(self)
+
+    def __enter__(self):
+        self.install()
+        connection_created.connect(self.install)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.install)
+        for conn in connections.all(initialized_only=True):
+            if self in conn.execute_wrappers:
+                conn.execute_wrappers.remove(self)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the sync views against their async variants through a request "
+        "factory: sequential latency percentiles and throughput with concurrent "
+        "requests, as JSON. --query-delay-ms adds a per-query delay to model a "
+        "networked database, where concurrent queries pay off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Measured requests per target and mode.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight for the throughput run.")
+        parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per target first.")
+        parser.add_argument("--query-delay-ms", type=float, default=0, help="Delay added to every query.")
+        parser.add_argument("--only", action="append", help="Only run this target (repeatable).")
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        targets = {label: urls for label, urls in bench_targets().items() if label in PAIRS}
+        if options["only"]:
+            unknown = set(options["only"]) - set(targets)
+            if unknown:
+                raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+            targets = {label: urls for label, urls in targets.items() if label in options["only"]}
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "query_delay_ms": options["query_delay_ms"],
+                "products": Product.objects.count(),
+                "database": connections["default"].vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+            },
+            "results": {},
+        }
+        with QueryDelay(options["query_delay_ms"] / 1000):
+            for label, urls in targets.items():
+                report["results"][label] = {
+                    mode: self.run_target(label, urls, mode, options) for mode in MODES
+                }
+                if options["verbosity"] > 1:
+                    for mode, result in report["results"][label].items():
+                        self.stderr.write(
+                            f"{label} {mode}: p50 {result['p50_ms']} ms, "
+                            f"{result['throughput_rps']} req/s"
+                        )
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                handle.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def run_target(self, label: str, urls: list[str], mode: str, options) -> dict:
+        sync_class, async_class = PAIRS[label]
+        view = (sync_class if mode == "sync" else async_class).as_view()
+        factory = RequestFactory()
+
+        def request(index):
+            url = urls[index % len(urls)]
+            return factory.get(url), resolve(url.split("?")[0]).kwargs
+
+        def fetch_sync(index):
+            req, kwargs = request(index)
+            start = time.perf_counter()
+            response = view(req, **kwargs)
+            response.render()
+            return response.status_code, time.perf_counter() - start
+
+        async def fetch_async(index):
+            req, kwargs = request(index)
+            start = time.perf_counter()
+            response = await view(req, **kwargs)
+            await sync_to_async(response.render)()
+            return response.status_code, time.perf_counter() - start
+
+        async def run_async(indexes, concurrency):
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def bounded(index):
+                async with semaphore:
+                    return await fetch_async(index)
+
+            return await asyncio.gather(*(bounded(index) for index in indexes))
+
+        def run(indexes, concurrency):
+            if mode != "sync":
+                return asyncio.run(run_async(indexes, concurrency))
+            if concurrency == 1:
+                return [fetch_sync(index) for index in indexes]
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                return list(pool.map(fetch_sync, indexes))
+
+        with override_settings(SHOP_ASYNC_PARALLEL_QUERIES=mode == "async_parallel"):
+            run(range(options["warmup"]), 1)
+            samples = run(range(options["requests"]), 1)
+            start = time.perf_counter()
+            concurrent = run(range(options["requests"]), options["concurrency"])
+            wall = time.perf_counter() - start
+
+        latencies = sorted(elapsed * 1000 for _, elapsed in samples)
+        statuses: dict[str, int] = {}
+        for status, _ in samples + list(concurrent):
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            "url": urls[0],
+            "statuses": statuses,
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "throughput_rps": round(len(concurrent) / wall, 1),
+        }
@@ -0,0 +1,154 @@
+"""Explain and time the catalog queries the public views run."""
+
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, router, transaction
+from django.db.models import Count, Max
+from django.test.utils import CaptureQueriesContext
+
+from shop.models import Category, Product
+from shop.pagination import CursorPaginator, keyset_ordering
+from shop.seed import seed_catalog
+from shop.views import CategoryDetailView
+
+PAGE = 12
+DEEP_PAGE = 400
+# Whole-catalog aggregates read through ``cached_aggregate`` once per catalog
+# version; scanning for them is expected and never fails --strict.
+CACHED_QUERIES = {"catalog_validators", "category_validators"}
+
+
+def catalog_queries() -> dict:
+    """Callables issuing the same queries as ``shop.views`` and ``global_context``."""
+    category = (
+        Category.objects.filter(is_active=True)
+        .annotate(n=Count("products"))
+        .order_by("-n")
+        .first()
+    )
+    product = Product.objects.active().order_by("-created_at").first()
+    slug = product.slug if product else ""
+    code = product.code if product else ""
+    active = Product.objects.active()
+    newest = active.cards().order_by("-created_at", "-id")
+    deep = list(newest.values("created_at", "id")[PAGE * DEEP_PAGE - 1 : PAGE * DEEP_PAGE])
+    paginator = CursorPaginator(newest, PAGE, ("-created_at", "-id"))
+    deep_cursor = paginator.cursor_after(deep[0], DEEP_PAGE + 1) if deep else None
+
+    queries = {
+        "navbar_categories": lambda: list(
+            Category.objects.filter(is_active=True).order_by("sort_order", "name")
+        ),
+        "home_latest": lambda: list(active.cards().order_by("-created_at")[:8]),
+        "home_hero": lambda: active.cards().filter(is_featured=True).order_by("-created_at").first(),
+        "catalog_validators": lambda: active.aggregate(
+            last_modified=Max("updated_at"), count=Count("pk")
+        ),
+        "list_offset_first": lambda: list(newest[:PAGE]),
+        "list_offset_deep": lambda: list(newest[PAGE * DEEP_PAGE : PAGE * (DEEP_PAGE + 1)]),
+        "product_validators": lambda: active.filter(slug=slug)
+        .values_list("updated_at", flat=True)
+        .first(),
+        "product_detail": lambda: active.cards().filter(slug=slug).first(),
+        # import_catalog matches rows to products by code.
+        "import_code_match": lambda: list(Product.objects.filter(code__in=[code]).order_by("pk")),
+    }
+    if deep_cursor is not None:
+        queries["list_cursor_deep"] = lambda: paginator.page(deep_cursor).object_list
+    if category:
+        in_category = active.cards().filter(category=category)
+        queries["category_validators"] = lambda: in_category.order_by().aggregate(
+            last_modified=Max("updated_at"), count=Count("pk")
+        )
+        for sort, keys in CategoryDetailView.sort_keys.items():
+            ordered = in_category.order_by(*keyset_ordering(Product, keys))
+            queries[f"category_{sort}"] = lambda ordered=ordered: list(ordered[: PAGE + 1])
+    return queries
+
+
+def explain(sql: str) -> list[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def is_bad_plan(plan: list[str]) -> bool:
+    """A full table scan, or a temporary B-tree sorting a scanned (not searched) table."""
+    scans = [step for step in plan if step.startswith("SCAN ")]
+    if any("USING" not in step for step in scans):
+        return True
+    return bool(scans) and any("TEMP B-TREE" in step for step in plan)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN QUERY PLAN on and time each catalog query. With --products a "
+        "synthetic catalog is seeded inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=0, help="Synthetic products to seed first.")
+        parser.add_argument("--repeat", type=int, default=20, help="Timed runs per query.")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for --products.")
+        parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+        parser.add_argument(
+            "--strict",
+            action="store_true",
+            help="Fail when a query scans a table or sorts a scan with a temporary B-tree.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("bench_queries relies on SQLite's EXPLAIN QUERY PLAN.")
+        with transaction.atomic():
+            if options["products"]:
+                seed_catalog(options["products"], seed=options["seed"], images=False)
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+            results = self.run(options["repeat"])
+            transaction.set_rollback(True)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2, ensure_ascii=False))
+        else:
+            for name, result in results.items():
+                style = self.style.ERROR if result["bad_plan"] else self.style.SUCCESS
+                note = "  (cached)" if name in CACHED_QUERIES else ""
+                self.stdout.write(
+                    style(
+                        f"{name:<24} p50 {result['p50_ms']:8.3f} ms  "
+                        f"max {result['max_ms']:8.3f} ms{note}"
+                    )
+                )
+                for step in result["plan"]:
+                    self.stdout.write(f"    {step}")
+
+        bad = [
+            name
+            for name, result in results.items()
+            if result["bad_plan"] and name not in CACHED_QUERIES
+        ]
+        if bad and options["strict"]:
+            raise CommandError(f"Queries without a suitable index: {', '.join(bad)}")
+
+    def run(self, repeat: int) -> dict:
+        results = {}
+        for name, query in catalog_queries().items():
+            with CaptureQueriesContext(connections[router.db_for_read(Product)]) as captured:
+                query()
+            plan = [step for entry in captured.captured_queries for step in explain(entry["sql"])]
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                query()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                "plan": plan,
+                "bad_plan": is_bad_plan(plan),
+                "p50_ms": round(statistics.median(timings), 3),
+                "max_ms": round(max(timings), 3),
+            }
+        return results
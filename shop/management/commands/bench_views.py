@@ -0,0 +1,249 @@
+"""Load-test every shop URL and the JSON API and report latency, throughput and query counts."""
+
+import json
+import math
+import platform
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from shop import urls as shop_urls
+from shop.models import Category, Product, WageTier
+from shop.search import tokenize
+
+# Product detail requests rotate over this many products so one warm row
+# does not flatter the numbers.
+DETAIL_SAMPLE = 50
+DEEP_PAGE = 50
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted ``values``."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class QueryCounter:
+    """Counts statements on every alias in this thread, since reads go to ``replica``."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for conn in connections.all():
+            self._stack.enter_context(conn.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def bench_targets() -> dict[str, list[str]]:
+    """URLs to request for every pattern in ``shop.urls``, keyed by a label."""
+    products = Product.objects.active().order_by("-created_at")
+    sample = list(products.values_list("slug", "name")[:DETAIL_SAMPLE])
+    category = (
+        Category.objects.filter(is_active=True)
+        .annotate(n=Count("products"))
+        .order_by("-n", "pk")
+        .values_list("slug", flat=True)
+        .first()
+    )
+    tier = WageTier.objects.filter(is_active=True).values_list("pk", flat=True).first()
+    tokens = tokenize(sample[0][1]) if sample else []
+
+    builders = {
+        "home": lambda url: {"home": [url()]},
+        "product_list": lambda url: {
+            "product_list": [url()],
+            "product_list_deep": [f"{url()}?page={DEEP_PAGE}"],
+        },
+        "search": lambda url: {"search": [f"{url()}?{urlencode({'q': tokens[0]})}"]} if tokens else {},
+        "category_detail": lambda url: {
+            "category_detail": [url(slug=category)],
+            "category_detail_price": [f"{url(slug=category)}?sort=price_asc"],
+            "category_detail_facet": [f"{url(slug=category)}?wage={tier}"] if tier else [],
+        }
+        if category
+        else {},
+        "product_detail": lambda url: {
+            "product_detail": [url(slug=slug) for slug, _ in sample]
+        },
+    }
+    targets = {}
+    for pattern in shop_urls.urlpatterns:
+        name = f"{shop_urls.app_name}:{pattern.name}"
+        if pattern.name not in builders:
+            raise CommandError(f"bench_views does not know how to request {name}.")
+
+        def url(name=name, **kwargs):
+            return reverse(name, kwargs=kwargs or None)
+
+        targets.update(builders[pattern.name](url))
+    # The JSON API is routed by the project, next to the feeds.
+    targets["api_products"] = [reverse("api_products")]
+    targets["api_products_filtered"] = [f"{reverse('api_products')}?{urlencode({'category': category})}"] if category else []
+    targets["api_product_detail"] = [reverse("api_product_detail", kwargs={"slug": slug}) for slug, _ in sample]
+    return {label: urls for label, urls in targets.items() if urls}
+
+
+class ClientRunner:
+    """Requests through Django's test client, one client per thread."""
+
+    mode = "client"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def fetch(self, url: str) -> tuple[int, int, int | None, float]:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = Client()
+        with QueryCounter() as captured:
+            start = time.perf_counter()
+            response = client.get(url)
+            body = b"".join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - start
+        return response.status_code, len(body), len(captured), elapsed
+
+
+class HTTPRunner:
+    """Requests against a running server; query counts are not available."""
+
+    mode = "http"
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def fetch(self, url: str) -> tuple[int, int, int | None, float]:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(self.base_url + url, timeout=30) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            status, body = exc.code, exc.read()
+        return status, len(body), None, time.perf_counter() - start
+
+
+def git_revision() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every URL in shop/urls.py through the test client (or a running "
+        "server with --url) and print latency percentiles, throughput, query counts "
+        "and response sizes as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per target.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Concurrent worker threads.")
+        parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per target first.")
+        parser.add_argument("--url", help="Base URL of a running server, e.g. http://127.0.0.1:8000.")
+        parser.add_argument("--only", action="append", help="Only run this target (repeatable).")
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        runner = HTTPRunner(options["url"]) if options["url"] else ClientRunner()
+        targets = bench_targets()
+        if options["only"]:
+            unknown = set(options["only"]) - set(targets)
+            if unknown:
+                raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+            targets = {label: urls for label, urls in targets.items() if label in options["only"]}
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "revision": git_revision(),
+                "mode": runner.mode,
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "products": Product.objects.count(),
+                "debug": settings.DEBUG,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+            },
+            "results": {},
+        }
+        for label, urls in targets.items():
+            report["results"][label] = self.run_target(runner, urls, options)
+            if options["verbosity"] > 1:
+                result = report["results"][label]
+                self.stderr.write(f"{label}: p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms")
+
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                handle.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def run_target(self, runner, urls: list[str], options) -> dict:
+        for index in range(options["warmup"]):
+            runner.fetch(urls[index % len(urls)])
+
+        def fetch(index):
+            return runner.fetch(urls[index % len(urls)])
+
+        start = time.perf_counter()
+        if options["concurrency"] == 1:
+            samples = [fetch(index) for index in range(options["requests"])]
+        else:
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+                samples = list(pool.map(fetch, range(options["requests"])))
+        wall = time.perf_counter() - start
+
+        latencies = sorted(sample[3] * 1000 for sample in samples)
+        statuses: dict[str, int] = {}
+        for status, *_ in samples:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        queries = [sample[2] for sample in samples if sample[2] is not None]
+        return {
+            "url": urls[0],
+            "statuses": statuses,
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "throughput_rps": round(len(samples) / wall, 1),
+            "queries_avg": round(sum(queries) / len(queries), 2) if queries else None,
+            "queries_max": max(queries) if queries else None,
+            "bytes_avg": round(sum(sample[1] for sample in samples) / len(samples)),
+        }
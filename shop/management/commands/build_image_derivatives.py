@@ -0,0 +1,70 @@
+"""Backfill responsive image derivatives for existing product photos."""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from shop.images import build_derivatives, needs_derivatives
+from shop.models import ProductImage
+
+
+def _init_worker() -> None:
+    # Spawned workers (macOS/Windows) start with an unconfigured Django.
+    django.setup()
+
+
+def _build(name: str) -> tuple[str, dict | None, str]:
+    try:
+        return name, build_derivatives(name), ""
+    except Exception as exc:  # reported by the parent process
+        return name, None, str(exc)
+
+
+class Command(BaseCommand):
+    help = "Generate resized AVIF/WebP/JPEG derivatives for product images using all CPU cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (defaults to the number of CPU cores).",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild derivatives even when they are already up to date.",
+        )
+
+    def handle(self, *args, **options):
+        pending: dict[str, list[int]] = {}
+        rows = ProductImage.objects.values_list("pk", "image", "derivatives")
+        for pk, name, manifest in rows.iterator(chunk_size=2000):
+            if options["force"] or needs_derivatives(name, manifest):
+                pending.setdefault(name, []).append(pk)
+
+        if not pending:
+            self.stdout.write("All product images already have derivatives.")
+            return
+
+        self.stdout.write(f"Building derivatives for {len(pending)} files...")
+        # Never share an open SQLite handle with forked workers.
+        connections.close_all()
+        built = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=_init_worker) as pool:
+            for name, manifest, error in pool.map(_build, pending, chunksize=8):
+                if manifest is None:
+                    failed += 1
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                ProductImage.objects.filter(pk__in=pending[name], image=name).update(
+                    derivatives=manifest
+                )
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} files, {failed} failed."))
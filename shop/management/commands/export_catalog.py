@@ -0,0 +1,35 @@
+"""Export products to a CSV or JSON Lines file."""
+
+import sys
+import zipfile
+
+from django.core.management.base import BaseCommand
+
+from shop.catalog_io import detect_format, export_rows, write_rows
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "Stream the catalog to a CSV/JSONL file that import_catalog can read back."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file, or - for standard output.")
+        parser.add_argument("--format", choices=("csv", "jsonl"), help="Override format detection.")
+        parser.add_argument("--images-zip", help="Also copy every product image into this zip archive.")
+        parser.add_argument("--active-only", action="store_true", help="Skip inactive products.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path == "-" else detect_format(path))
+        queryset = Product.objects.active() if options["active_only"] else Product.objects.all()
+        archive = zipfile.ZipFile(options["images_zip"], "w") if options["images_zip"] else None
+        handle = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+        try:
+            count = write_rows(export_rows(queryset), handle, fmt, archive=archive)
+        finally:
+            if handle is not sys.stdout:
+                handle.close()
+            if archive is not None:
+                archive.close()
+        if path != "-":
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} products to {path}."))
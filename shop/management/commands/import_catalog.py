@@ -0,0 +1,96 @@
+"""Import products in bulk from a CSV or JSON Lines file."""
+
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_io import DEFAULT_BATCH_SIZE, CatalogImporter, Checkpoint, ImageSource, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update products from a CSV/JSONL catalog file, streaming it in "
+        "chunked transactions. Rows are matched to existing products by code, then slug."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Catalog file (.csv, or .jsonl for JSON Lines).")
+        parser.add_argument("--format", choices=("csv", "jsonl"), help="Override format detection.")
+        parser.add_argument(
+            "--images-dir",
+            help="Directory image paths are relative to (defaults to the catalog file's directory).",
+        )
+        parser.add_argument("--images-zip", help="Zip archive holding the referenced images.")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Rows per transaction.")
+        parser.add_argument(
+            "--create-categories",
+            action="store_true",
+            help="Create categories that do not exist instead of rejecting their rows.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Validate the file without writing anything.")
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the rows an interrupted import of the same file already committed.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Checkpoint file (defaults to <path>.checkpoint next to the catalog file).",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.is_file():
+            raise CommandError(f"No such file: {path}")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        fmt = options["format"] or detect_format(path)
+        images = ImageSource(
+            directory=options["images_dir"] or path.parent,
+            archive=options["images_zip"],
+        )
+        checkpoint = Checkpoint(options["checkpoint"] or f"{path}.checkpoint", path)
+        dry_run = options["dry_run"]
+
+        importer = CatalogImporter(
+            images=images,
+            batch_size=options["batch_size"],
+            dry_run=dry_run,
+            create_categories=options["create_categories"],
+        )
+        rows = read_rows(path, fmt)
+        skip = checkpoint.load() if options["resume"] else 0
+        if skip:
+            self.stdout.write(f"Resuming after {skip} committed rows.")
+            rows = islice(rows, skip, None)
+            importer.stats.rows = skip
+
+        def on_chunk(stats):
+            if not dry_run:
+                checkpoint.save(stats.rows)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{stats.rows} rows: {stats.created} created, {stats.updated} updated")
+
+        try:
+            stats = importer.run(rows, on_chunk=on_chunk)
+        finally:
+            images.close()
+
+        for line, message in stats.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if stats.error_count > len(stats.errors):
+            self.stderr.write(f"... and {stats.error_count - len(stats.errors)} more errors")
+
+        created, updated = ("Would create", "update") if dry_run else ("Created", "updated")
+        summary = (
+            f"{created} {stats.created} and {updated} {stats.updated} products with {stats.images}"
+            f" images from {stats.rows} rows; {stats.error_count} rows rejected."
+        )
+        if importer.lookups.created_categories:
+            summary += f" {importer.lookups.created_categories} new categories."
+        self.stdout.write(self.style.SUCCESS(summary) if not stats.error_count else summary)
+        if not dry_run:
+            checkpoint.clear()
+            if stats.images:
+                self.stdout.write("Run `manage.py build_image_derivatives` to build responsive images.")
@@ -0,0 +1,18 @@
+"""Rebuild the full-text product search index from scratch."""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.search import fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the FTS5 product search index in bulk."
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write("Full-text search is only available on SQLite; nothing to do.")
+            return
+        with transaction.atomic():
+            total = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} products."))
@@ -0,0 +1,67 @@
+"""Delete product photos and derivatives that no ``ProductImage`` references."""
+
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.models import ProductImage
+
+ROOT = "products"
+
+
+def walk(storage, directory: str):
+    """Every file name under ``directory``, recursively."""
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f"{directory}/{name}"
+    for name in directories:
+        yield from walk(storage, f"{directory}/{name}")
+
+
+def referenced_names() -> set[str]:
+    names = set()
+    rows = ProductImage.objects.values_list("image", "derivatives")
+    for image, manifest in rows.iterator(chunk_size=2000):
+        names.add(image)
+        for sources in (manifest or {}).get("sources", {}).values():
+            names.update(name for _, name in sources)
+    return names
+
+
+class Command(BaseCommand):
+    help = "Reclaim disk space from product photos and derivatives no product image uses."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=float,
+            default=24.0,
+            help="Only delete files older than this many hours (default 24), so uploads "
+            "and derivative builds in progress are left alone.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Report orphans without deleting them.")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not storage.exists(ROOT):
+            self.stdout.write("No product media.")
+            return
+        # Load references before listing files, so a file uploaded in between
+        # is at worst kept until the next run.
+        referenced = referenced_names()
+        cutoff = timezone.now() - timedelta(hours=options["min_age"])
+        orphans = reclaimed = 0
+        for name in walk(storage, ROOT):
+            if name in referenced or storage.get_modified_time(name) > cutoff:
+                continue
+            orphans += 1
+            reclaimed += storage.size(name)
+            if not options["dry_run"]:
+                storage.delete(name)
+
+        verb = "Would reclaim" if options["dry_run"] else "Reclaimed"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {orphans} files, {reclaimed / 1024 / 1024:.1f} MiB.")
+        )
@@ -0,0 +1,41 @@
+"""Fill the database with a synthetic catalog for development and benchmarks."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from shop.seed import CATEGORY_NAMES, seed_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Create realistic categories, wage tiers, products and placeholder images "
+        "deterministically from a random seed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000, help="Number of products to create.")
+        parser.add_argument(
+            "--categories",
+            type=int,
+            default=len(CATEGORY_NAMES),
+            help="Number of categories to spread products over.",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Random seed.")
+        parser.add_argument("--no-images", action="store_true", help="Do not attach placeholder images.")
+
+    def handle(self, *args, **options):
+        if options["products"] < 0 or options["categories"] < 1:
+            raise CommandError("--products must be >= 0 and --categories >= 1.")
+        with transaction.atomic():
+            created = seed_catalog(
+                options["products"],
+                categories=options["categories"],
+                seed=options["seed"],
+                images=not options["no_images"],
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Created {products} products, {images} images, {categories} categories "
+                "and {wage_tiers} wage tiers.".format(**created)
+            )
+        )
@@ -0,0 +1,28 @@
+"""Record a new gold rate and reprice the catalog."""
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.pricing import update_rate, update_rate_from_feed
+
+
+class Command(BaseCommand):
+    help = "Fetch the per-gram gold rate from SHOP_GOLD_RATE_FEED (or --rate) and reprice products."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", help="Set this rate manually instead of using the feed.")
+        parser.add_argument("--source", default="manual", help="Source label for a manual rate.")
+
+    def handle(self, *args, **options):
+        try:
+            if options["rate"]:
+                gold_rate = update_rate(options["rate"], source=options["source"])
+            else:
+                gold_rate = update_rate_from_feed()
+        except ValidationError as exc:
+            raise CommandError(exc.messages[0]) from exc
+        except Exception as exc:
+            raise CommandError(f"Could not fetch the gold rate: {exc}") from exc
+        self.stdout.write(
+            self.style.SUCCESS(f"Gold rate set to {gold_rate.rate_per_gram} ({gold_rate.source}).")
+        )
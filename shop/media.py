@@ -0,0 +1,159 @@
+"""
+Serving uploaded product photos.
+
+:func:`serve_media` streams files under ``MEDIA_ROOT/products/`` with
+``FileResponse`` (``sendfile`` on WSGI servers with ``wsgi.file_wrapper``),
+answers ``If-None-Match``/``If-Modified-Since`` from the file's mtime and
+size, and supports single ``Range`` requests so browsers and crawlers can
+resume large downloads.
+
+With ``SHOP_MEDIA_ACCEL`` set, the view only checks the file and its
+validators and hands the transfer to the front proxy: ``"nginx"`` emits
+``X-Accel-Redirect`` to ``SHOP_MEDIA_ACCEL_PREFIX`` (an ``internal``
+location aliased to ``MEDIA_ROOT``), ``"sendfile"`` emits ``X-Sendfile``
+with the absolute path for Apache ``mod_xsendfile`` or lighttpd.
+"""
+
+from __future__ import annotations
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .uploads import is_content_addressed
+
+# Derivatives are rebuilt under the same name, so photos are revalidated
+# rather than cached as immutable; content-addressed originals never change.
+DEFAULT_MAX_AGE = 60 * 60
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """``(start, end)`` inclusive for a single byte range, or ``None`` to ignore it.
+
+    Raises ``ValueError`` for a syntactically valid range that lies outside
+    the file. Multiple ranges are ignored and the whole file is sent.
+    """
+    match = _RANGE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+class RangeFile:
+    """Reads ``length`` bytes of ``file`` from its current position, then EOF.
+
+    Deliberately has no ``fileno`` so servers do not ``sendfile`` past the range.
+    """
+
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _content_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def _offload(path: str, relative: str) -> HttpResponse | None:
+    mode = getattr(settings, "SHOP_MEDIA_ACCEL", None)
+    if not mode:
+        return None
+    response = HttpResponse(content_type=_content_type(path))
+    if mode == "nginx":
+        prefix = getattr(settings, "SHOP_MEDIA_ACCEL_PREFIX", "/protected-media/")
+        response.headers["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(relative)
+    elif mode == "sendfile":
+        response.headers["X-Sendfile"] = path
+    else:
+        raise ImproperlyConfigured(f"Unknown SHOP_MEDIA_ACCEL mode {mode!r}; use 'nginx' or 'sendfile'.")
+    return response
+
+
+@require_safe
+def serve_media(request, path: str):
+    """Serve ``MEDIA_ROOT/<path>`` with validators, ranges and optional proxy offload."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404("No such file")
+    if not os.path.isfile(full_path):
+        raise Http404("No such file")
+
+    etag = quote_etag(f"{int(stat.st_mtime):x}-{stat.st_size:x}")
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _offload(full_path, path) or _file_response(request, full_path, stat.st_size, etag)
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = http_date(last_modified)
+    if is_content_addressed(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=getattr(settings, "SHOP_MEDIA_MAX_AGE", DEFAULT_MAX_AGE)
+        )
+    return response
+
+
+def _file_response(request, path: str, size: int, etag: str) -> HttpResponse:
+    content_type = _content_type(path)
+    byte_range = None
+    header = request.headers.get("Range")
+    # A stale If-Range means the client's partial copy is outdated: send it all.
+    if header and request.headers.get("If-Range", etag) == etag:
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+
+    file = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response.headers["Content-Length"] = str(size)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        response.headers["Content-Length"] = str(end - start + 1)
+    response.block_size = STREAM_CHUNK_SIZE
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,369 @@
+"""
+Per-request instrumentation, ``Server-Timing`` headers and Prometheus metrics.
+
+``InstrumentationMiddleware`` measures every request it sees:
+
+* database queries and their time, through an ``execute_wrapper`` installed
+  on each connection as it is created;
+* template rendering, from ``process_template_response`` to the end of
+  ``TemplateResponse.render()``;
+* time spent loading the navigation (:func:`timed` in the context processor);
+* response size and total duration.
+
+With ``SHOP_SERVER_TIMING`` on, the numbers are sent to the browser as a
+``Server-Timing`` header (shown in the devtools network panel); it is off by
+default because it tells anyone how long the database took. They are always
+aggregated per URL name in a process-local
+:class:`Registry` guarded by a lock. :func:`metrics_view` serves them in the
+Prometheus text format. Under a multi-process server each worker also writes
+its snapshot to ``SHOP_METRICS_DIR`` every few seconds and ``/metrics`` sums
+the snapshots of all workers. Snapshots of workers that have exited are
+deleted instead, so recycled workers do not pile up files.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
+
+# Upper bounds in seconds, as in the Prometheus client defaults.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SNAPSHOT_INTERVAL = 5.0
+UNRESOLVED = "<unresolved>"
+
+
+@dataclass
+class RequestTimings:
+    """Counters for the request running in the current context."""
+
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    template_seconds: float = 0.0
+    navigation_seconds: float = 0.0
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("shop_request_timings", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_seconds += time.perf_counter() - start
+        timings.db_queries += 1
+
+
+def _install_query_recorder(connection, **kwargs) -> None:
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install_query_recorder() -> None:
+    """Time queries on every connection, including those already open."""
+    connection_created.connect(_install_query_recorder, dispatch_uid="shop.metrics")
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(connection)
+
+
+@contextmanager
+def timed(field: str):
+    """Add the time spent in the block to ``field`` of the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, field, getattr(timings, field) + time.perf_counter() - start)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def as_dict(self) -> dict:
+        return {"counts": list(self.counts), "sum": self.sum, "count": self.count}
+
+
+class Registry:
+    """Per-view aggregates for this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.requests: dict[str, dict[str, int]] = {}
+        self.duration: dict[str, Histogram] = {}
+        self.queries: dict[str, Histogram] = {}
+        self.totals: dict[str, dict[str, float]] = {}
+        self.last_snapshot = 0.0
+
+    def record(self, view: str, status: int, duration: float, timings: RequestTimings, size: int) -> None:
+        with self.lock:
+            statuses = self.requests.setdefault(view, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if view not in self.duration:
+                self.duration[view] = Histogram(DURATION_BUCKETS)
+                self.queries[view] = Histogram(QUERY_BUCKETS)
+                self.totals[view] = dict.fromkeys(
+                    ("db_seconds", "template_seconds", "navigation_seconds", "response_bytes"), 0.0
+                )
+            self.duration[view].observe(duration)
+            self.queries[view].observe(timings.db_queries)
+            totals = self.totals[view]
+            totals["db_seconds"] += timings.db_seconds
+            totals["template_seconds"] += timings.template_seconds
+            totals["navigation_seconds"] += timings.navigation_seconds
+            totals["response_bytes"] += size
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": {view: dict(statuses) for view, statuses in self.requests.items()},
+                "duration": {view: hist.as_dict() for view, hist in self.duration.items()},
+                "queries": {view: hist.as_dict() for view, hist in self.queries.items()},
+                "totals": {view: dict(totals) for view, totals in self.totals.items()},
+            }
+
+    def write_snapshot(self, directory: str, force: bool = False) -> None:
+        """Publish this process's snapshot for the other workers' ``/metrics``."""
+        now = time.monotonic()
+        if not force and now - self.last_snapshot < SNAPSHOT_INTERVAL:
+            return
+        self.last_snapshot = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(f"{path}.tmp", path)
+
+
+registry = Registry()
+
+
+def merge_snapshots(snapshots) -> dict:
+    """Sum snapshots of several processes."""
+    merged: dict = {"requests": {}, "duration": {}, "queries": {}, "totals": {}}
+    for snapshot in snapshots:
+        for view, statuses in snapshot["requests"].items():
+            target = merged["requests"].setdefault(view, {})
+            for status, count in statuses.items():
+                target[status] = target.get(status, 0) + count
+        for kind in ("duration", "queries"):
+            for view, hist in snapshot[kind].items():
+                target = merged[kind].get(view)
+                if target is None:
+                    merged[kind][view] = {"counts": list(hist["counts"]), "sum": hist["sum"], "count": hist["count"]}
+                    continue
+                target["counts"] = [a + b for a, b in zip(target["counts"], hist["counts"])]
+                target["sum"] += hist["sum"]
+                target["count"] += hist["count"]
+        for view, totals in snapshot["totals"].items():
+            target = merged["totals"].setdefault(view, dict.fromkeys(totals, 0.0))
+            for key, value in totals.items():
+                target[key] = target.get(key, 0.0) + value
+    return merged
+
+
+def _exited(pid: str) -> bool:
+    """True when the worker that wrote snapshot ``pid`` is known to be gone."""
+    # Signal 0 only probes on POSIX; on Windows os.kill() would stop the process.
+    if os.name != "posix" or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass  # alive, but owned by another user
+    return False
+
+
+def collect() -> dict:
+    """This process's metrics merged with the snapshots of the other workers."""
+    directory = getattr(settings, "SHOP_METRICS_DIR", None)
+    snapshots = [registry.snapshot()]
+    if directory and os.path.isdir(directory):
+        own = f"{os.getpid()}.json"
+        for filename in os.listdir(directory):
+            if not filename.endswith(".json") or filename == own:
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                if _exited(filename[: -len(".json")]):
+                    os.remove(path)
+                    continue
+                with open(path, encoding="utf-8") as handle:
+                    snapshots.append(json.load(handle))
+            except (OSError, ValueError):
+                continue
+    return merge_snapshots(snapshots)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name: str, view: str, buckets, hist: dict) -> list[str]:
+    lines, cumulative = [], 0
+    for bound, count in zip(buckets, hist["counts"]):
+        cumulative += count
+        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {hist["count"]}')
+    lines.append(f'{name}_sum{{view="{view}"}} {hist["sum"]}')
+    lines.append(f'{name}_count{{view="{view}"}} {hist["count"]}')
+    return lines
+
+
+def render_prometheus(data: dict) -> str:
+    lines = [
+        "# HELP shop_requests_total Requests by view and status code.",
+        "# TYPE shop_requests_total counter",
+    ]
+    for view, statuses in sorted(data["requests"].items()):
+        for status, count in sorted(statuses.items()):
+            lines.append(f'shop_requests_total{{view="{_label(view)}",status="{status}"}} {count}')
+    for name, kind, buckets, help_text in (
+        ("shop_request_duration_seconds", "duration", DURATION_BUCKETS, "Request duration."),
+        ("shop_request_db_queries", "queries", QUERY_BUCKETS, "Database queries per request."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for view, hist in sorted(data[kind].items()):
+            lines += _histogram_lines(name, _label(view), buckets, hist)
+    for key, name, help_text in (
+        ("db_seconds", "shop_request_db_seconds_total", "Time spent in database queries."),
+        ("template_seconds", "shop_request_template_seconds_total", "Time spent rendering templates."),
+        ("navigation_seconds", "shop_request_navigation_seconds_total", "Time spent loading the navigation."),
+        ("response_bytes", "shop_response_bytes_total", "Response body bytes."),
+    ):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for view, totals in sorted(data["totals"].items()):
+            lines.append(f'{name}{{view="{_label(view)}"}} {totals[key]}')
+    return "\n".join(lines) + "\n"
+
+
+@require_safe
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires ``SHOP_METRICS_TOKEN`` as a bearer token.
+
+    Without a token the endpoint is only open when ``DEBUG`` is on.
+    """
+    token = getattr(settings, "SHOP_METRICS_TOKEN", None)
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(collect()), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def _response_size(response) -> int:
+    if response.has_header("Content-Length"):
+        return int(response["Content-Length"])
+    return 0 if response.streaming else len(response.content)
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    return ", ".join(
+        (
+            f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_queries} queries"',
+            f"tpl;dur={timings.template_seconds * 1000:.1f}",
+            f"nav;dur={timings.navigation_seconds * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        )
+    )
+
+
+class InstrumentationMiddleware:
+    """Time each request and publish it in :data:`registry` and, if enabled, ``Server-Timing``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install_query_recorder()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings, start)
+
+    def process_template_response(self, request, response):
+        timings = _current.get()
+        if timings is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                timings.template_seconds += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, timings: RequestTimings, start: float):
+        duration = time.perf_counter() - start
+        if getattr(settings, "SHOP_SERVER_TIMING", False):
+            response.headers["Server-Timing"] = server_timing(timings, duration)
+        match = getattr(request, "resolver_match", None)
+        view = (match.view_name or UNRESOLVED) if match else UNRESOLVED
+        registry.record(view, response.status_code, duration, timings, _response_size(response))
+        directory = getattr(settings, "SHOP_METRICS_DIR", None)
+        if directory:
+            registry.write_snapshot(directory)
+        return response
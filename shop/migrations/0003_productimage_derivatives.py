@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-16 22:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0002_alter_product_weight_gram"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productimage",
+            name="derivatives",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name="نسخه\u200cهای بهینه\u200cشده",
+            ),
+        ),
+    ]
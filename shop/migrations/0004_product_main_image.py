@@ -0,0 +1,45 @@
+# Generated by Django 4.2.27 on 2026-10-16 22:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_main_images(apps, schema_editor):
+    """Mark exactly one main image per product and point the product at it."""
+    Product = apps.get_model("shop", "Product")
+    ProductImage = apps.get_model("shop", "ProductImage")
+    rows = ProductImage.objects.order_by("product_id", "-is_main", "sort_order", "id")
+    current = None
+    for image_id, product_id in rows.values_list("id", "product_id").iterator():
+        if product_id == current:
+            continue
+        current = product_id
+        ProductImage.objects.filter(product_id=product_id).exclude(id=image_id).update(
+            is_main=False
+        )
+        ProductImage.objects.filter(id=image_id).update(is_main=True)
+        Product.objects.filter(id=product_id).update(main_image_id=image_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0003_productimage_derivatives"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="main_image",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="shop.productimage",
+                verbose_name="عکس اصلی",
+            ),
+        ),
+        migrations.RunPython(backfill_main_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+import re
+
+from django.db import migrations
+
+# Frozen copies of shop.search as of this migration, so later changes to the
+# live module (or its model imports) cannot change what this migration does.
+FTS_TABLE = "shop_product_fts"
+
+_CHAR_MAP = {
+    "ي": "ی",
+    "ى": "ی",
+    "ئ": "ی",
+    "ك": "ک",
+    "ة": "ه",
+    "ۀ": "ه",
+    "أ": "ا",
+    "إ": "ا",
+    "ٱ": "ا",
+    "\u200c": "",
+    "\u200d": "",
+    "\u0640": "",
+}
+_CHAR_MAP.update({chr(0x06F0 + i): str(i) for i in range(10)})
+_CHAR_MAP.update({chr(0x0660 + i): str(i) for i in range(10)})
+_TRANSLATION = str.maketrans(_CHAR_MAP)
+_DIACRITICS = re.compile("[\\u064B-\\u065F\\u0670\\u06D6-\\u06ED]")
+
+
+def normalize(text):
+    if not text:
+        return ""
+    return _DIACRITICS.sub("", text.translate(_TRANSLATION)).lower()
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    Product = apps.get_model("shop", "Product")
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "name, code, description, category, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    rows = (
+        Product.objects.filter(is_active=True)
+        .values_list("pk", "name", "code", "description", "category__name")
+        .iterator()
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, code, description, category) "
+            "VALUES (%s, %s, %s, %s, %s)",
+            ((pk, *map(normalize, values)) for pk, *values in rows),
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0004_product_main_image"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.27 on 2026-10-16 22:44
+
+import django.core.validators
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0005_product_search_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GoldRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "rate_per_gram",
+                    models.DecimalField(
+                        decimal_places=0,
+                        max_digits=14,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                        verbose_name="نرخ هر گرم (تومان)",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(blank=True, max_length=100, verbose_name="منبع"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="زمان ثبت"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "نرخ طلا",
+                "verbose_name_plural": "نرخ\u200cهای طلا",
+                "ordering": ["-created_at", "-id"],
+            },
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="computed_price",
+            field=models.DecimalField(
+                blank=True,
+                db_index=True,
+                decimal_places=0,
+                editable=False,
+                max_digits=14,
+                null=True,
+                verbose_name="قیمت محاسبه\u200cشده (تومان)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="wagetier",
+            name="wage_percent",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                max_digits=5,
+                validators=[django.core.validators.MinValueValidator(0)],
+                verbose_name="درصد اجرت",
+            ),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.27 on 2026-10-16 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0006_pricing"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="product",
+            name="computed_price",
+            field=models.DecimalField(
+                blank=True,
+                decimal_places=0,
+                editable=False,
+                max_digits=14,
+                null=True,
+                verbose_name="قیمت محاسبه\u200cشده (تومان)",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["sort_order", "name"],
+                name="category_active_order_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["-created_at", "-id"],
+                name="product_active_newest_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_active", True), ("is_featured", True)),
+                fields=["-created_at"],
+                name="product_featured_newest_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "-created_at", "-id"],
+                name="product_cat_newest_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "weight_gram", "id"],
+                name="product_cat_weight_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["category", "computed_price", "id"],
+                name="product_cat_price_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["code"], name="product_code_idx"),
+        ),
+    ]
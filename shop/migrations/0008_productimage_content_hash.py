@@ -0,0 +1,24 @@
+# Generated by Django 4.2.27 on 2026-10-16 23:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0007_catalog_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="productimage",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=64,
+                verbose_name="هش محتوا",
+            ),
+        ),
+    ]
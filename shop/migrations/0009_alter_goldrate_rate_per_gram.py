@@ -0,0 +1,24 @@
+# Generated by Django 4.2.27 on 2026-10-17 00:19
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0008_productimage_content_hash"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="goldrate",
+            name="rate_per_gram",
+            field=models.DecimalField(
+                decimal_places=0,
+                max_digits=14,
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="نرخ هر گرم (تومان)",
+            ),
+        ),
+    ]
@@ -8,9 +8,10 @@ validation to ensure clean URLs and positive weights.
 
 from django.db import models
 from django.utils import timezone
-from django.utils.text import slugify
 from django.core.validators import MinValueValidator
 
+from .slugs import save_with_unique_slug
+
 
 class Category(models.Model):
     """A group of products such as rings, necklaces or bracelets."""
@@ -25,22 +26,24 @@ class Category(models.Model):
         verbose_name = "دسته‌بندی"
         verbose_name_plural = "دسته‌بندی‌ها"
         ordering = ["sort_order", "name"]
+        indexes = [
+            # Navbar and home page: active categories in display order.
+            models.Index(
+                fields=["sort_order", "name"],
+                condition=models.Q(is_active=True),
+                name="category_active_order_idx",
+            ),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - trivial
         return self.name
 
     def save(self, *args, **kwargs) -> None:
         """Automatically generate a unique slug from the name if none is set."""
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            idx = 1
-            # Ensure uniqueness by appending a numeric suffix if necessary
-            while Category.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{idx}"
-                idx += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            save_with_unique_slug(self, super().save, self.name, *args, **kwargs)
 
 
 class WageTier(models.Model):
@@ -48,6 +51,13 @@ class WageTier(models.Model):
 
     name = models.CharField(max_length=50, verbose_name="نام اجرت")
     description = models.CharField(max_length=255, blank=True, verbose_name="توضیحات")
+    wage_percent = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        default=0,
+        validators=[MinValueValidator(0)],
+        verbose_name="درصد اجرت",
+    )
     sort_order = models.PositiveIntegerField(default=0, verbose_name="ترتیب نمایش")
     is_active = models.BooleanField(default=True, verbose_name="فعال")
 
@@ -60,6 +70,21 @@ class WageTier(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    """Reusable query shapes for products."""
+
+    def active(self) -> "ProductQuerySet":
+        return self.filter(is_active=True)
+
+    def cards(self) -> "ProductQuerySet":
+        """Everything a listing card renders, loaded with a single JOIN.
+
+        ``main_image`` is a denormalised pointer kept in sync by signals, so
+        cards never need to query ``images`` per product.
+        """
+        return self.select_related("category", "wage_tier", "main_image")
+
+
 class Product(models.Model):
     """A purchasable item in the shop with optional images and metadata."""
 
@@ -86,6 +111,23 @@ class Product(models.Model):
         verbose_name="وزن (گرم)",
     )
     description = models.TextField(blank=True, verbose_name="توضیحات")
+    computed_price = models.DecimalField(
+        max_digits=14,
+        decimal_places=0,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="قیمت محاسبه‌شده (تومان)",
+    )
+    main_image = models.ForeignKey(
+        "ProductImage",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        verbose_name="عکس اصلی",
+    )
     is_active = models.BooleanField(default=True, verbose_name="فعال")
     is_featured = models.BooleanField(
         default=False,
@@ -100,26 +142,56 @@ class Product(models.Model):
         verbose_name="آخرین بروزرسانی",
     )
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "محصول"
         verbose_name_plural = "محصولات"
         ordering = ["-created_at"]
+        # Public queries always filter on is_active, so most indexes are
+        # partial on it; each one serves a listing's ORDER BY without a sort.
+        indexes = [
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=models.Q(is_active=True),
+                name="product_active_newest_idx",
+            ),
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(is_active=True, is_featured=True),
+                name="product_featured_newest_idx",
+            ),
+            models.Index(
+                fields=["category", "-created_at", "-id"],
+                condition=models.Q(is_active=True),
+                name="product_cat_newest_idx",
+            ),
+            models.Index(
+                fields=["category", "weight_gram", "id"],
+                condition=models.Q(is_active=True),
+                name="product_cat_weight_idx",
+            ),
+            models.Index(
+                fields=["category", "computed_price", "id"],
+                condition=models.Q(is_active=True),
+                name="product_cat_price_idx",
+            ),
+            # Exact matches for import_catalog; admin's code__icontains cannot use it.
+            models.Index(fields=["code"], name="product_code_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - trivial
         return self.name
 
     def save(self, *args, **kwargs) -> None:
-        """Automatically generate a unique slug from the product name if none is set."""
-        if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            idx = 1
-            # Ensure uniqueness by appending a numeric suffix if necessary
-            while Product.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{idx}"
-                idx += 1
-            self.slug = slug
-        super().save(*args, **kwargs)
+        """Generate a unique slug if none is set and refresh the computed price."""
+        from .pricing import price_for_product
+
+        self.computed_price = price_for_product(self)
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            save_with_unique_slug(self, super().save, self.name, *args, **kwargs)
 
 
 def product_image_upload_path(instance: "ProductImage", filename: str) -> str:
@@ -142,6 +214,19 @@ class ProductImage(models.Model):
     )
     is_main = models.BooleanField(default=False, verbose_name="عکس اصلی")
     sort_order = models.PositiveIntegerField(default=0, verbose_name="ترتیب")
+    derivatives = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="نسخه‌های بهینه‌شده",
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="هش محتوا",
+    )
 
     class Meta:
         verbose_name = "عکس محصول"
@@ -151,6 +236,60 @@ class ProductImage(models.Model):
     def __str__(self) -> str:  # pragma: no cover - trivial
         return f"عکس {self.product.name}"
 
+    def save(self, *args, **kwargs) -> None:
+        """Keep exactly one main image per product.
+
+        The first image of a product always becomes its main image, and
+        marking an image as main clears the flag on its siblings. A newly
+        uploaded file is stored by content, and reuses the derivatives of
+        another row with the same file.
+        """
+        if self.image and not self.image._committed:
+            from .images import needs_derivatives
+            from .uploads import store_content
+
+            self.content_hash, name = store_content(self.image.file, self.image.name)
+            self.image = name
+            if needs_derivatives(name, self.derivatives):
+                shared = (
+                    ProductImage.objects.filter(image=name)
+                    .exclude(pk=self.pk)
+                    .values_list("derivatives", flat=True)
+                    .first()
+                )
+                if shared and not needs_derivatives(name, shared):
+                    self.derivatives = shared
+        main_siblings = ProductImage.objects.filter(
+            product_id=self.product_id, is_main=True
+        ).exclude(pk=self.pk)
+        if self.is_main:
+            # Clear siblings first so post_save handlers see a single main image.
+            main_siblings.update(is_main=False)
+        elif not main_siblings.exists():
+            self.is_main = True
+        super().save(*args, **kwargs)
+
+
+class GoldRate(models.Model):
+    """A per-gram gold rate; the newest row prices the whole catalog."""
+
+    rate_per_gram = models.DecimalField(
+        max_digits=14,
+        decimal_places=0,
+        validators=[MinValueValidator(1)],
+        verbose_name="نرخ هر گرم (تومان)",
+    )
+    source = models.CharField(max_length=100, blank=True, verbose_name="منبع")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="زمان ثبت")
+
+    class Meta:
+        verbose_name = "نرخ طلا"
+        verbose_name_plural = "نرخ‌های طلا"
+        ordering = ["-created_at", "-id"]
+
+    def __str__(self) -> str:  # pragma: no cover - trivial
+        return f"{self.rate_per_gram} ({self.created_at:%Y-%m-%d %H:%M})"
+
 
 class SiteConfig(models.Model):
     """Singleton configuration model storing global site information."""
@@ -0,0 +1,210 @@
+"""
+Pagination helpers for catalog listings.
+
+``CachedCountPaginator`` is a drop-in Django paginator whose ``COUNT(*)`` is
+cached under the ``catalog`` cache version, so numbered page links cost a
+cache hit instead of a table scan.
+
+``CursorPaginator`` implements keyset pagination: pages are addressed by
+opaque tokens encoding the sort key of the first/last row, and each page is a
+``WHERE (key) > (cursor) ORDER BY key LIMIT n`` query that costs the same on
+page 500 as on page 1. Keys always end with the primary key so they are
+unique; NULL sorts as the smallest value of a nullable key.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Q
+from django.utils.functional import cached_property
+
+from .cache import cached_aggregate
+
+# SQLite's integer range; SQLite's backend reports no range to the validators.
+INT64_RANGE = range(-(2**63), 2**63)
+
+
+class CachedCountPaginator(Paginator):
+    """A ``Paginator`` that caches its count per catalog version."""
+
+    @cached_property
+    def count(self) -> int:
+        if hasattr(self.object_list, "query"):
+            return cached_aggregate(self.object_list.order_by(), total=Count("pk"))["total"]
+        return super().count
+
+
+def keyset_ordering(model, keys, reverse: bool = False) -> list:
+    """``order_by()`` arguments for ``keys``; NULL sorts as the smallest value.
+
+    That is SQLite's native NULL ordering, so ``(col, id)`` indexes can serve
+    these orderings in both directions without a temporary B-tree.
+    """
+    ordering = []
+    for key in keys:
+        field = model._meta.get_field(key.lstrip("-"))
+        descending = key.startswith("-") != reverse
+        expression = F(field.name)
+        if not field.null:
+            ordering.append(expression.desc() if descending else expression.asc())
+        elif descending:
+            ordering.append(expression.desc(nulls_last=True))
+        else:
+            ordering.append(expression.asc(nulls_first=True))
+    return ordering
+
+
+def _encode(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(token: str) -> dict | None:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError):
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+class CursorPage:
+    """One page of a :class:`CursorPaginator`; mirrors the ``Page`` API templates use."""
+
+    cursor_based = True
+
+    def __init__(self, object_list, paginator, number, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.number = number
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Keyset paginator over ``queryset`` ordered by ``keys``.
+
+    ``keys`` are field names with an optional ``-`` prefix, ending with the
+    primary key, e.g. ``("-created_at", "-id")``.
+    """
+
+    def __init__(self, queryset, per_page: int, keys: tuple[str, ...]):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+        self._fields = [
+            queryset.model._meta.get_field(key.lstrip("-")) for key in self.keys
+        ]
+
+    @cached_property
+    def count(self) -> int:
+        """Approximate total; cached, so it may lag behind by a few rows."""
+        return cached_aggregate(self.queryset.order_by(), total=Count("pk"))["total"]
+
+    @property
+    def num_pages(self) -> int:
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def _after(self, values: list, reverse: bool) -> Q | None:
+        """Rows strictly after ``values`` in the (possibly reversed) order."""
+        condition = None
+        equal = Q()
+        for key, field, value in zip(self.keys, self._fields, values):
+            descending = key.startswith("-") != reverse
+            name = field.name
+            if value is None:
+                # NULL is the smallest value: only non-NULLs follow it ascending.
+                later = None if descending else Q(**{f"{name}__isnull": False})
+                same = Q(**{f"{name}__isnull": True})
+            else:
+                later = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+                if descending and field.null:
+                    later |= Q(**{f"{name}__isnull": True})
+                same = Q(**{name: value})
+            if later is not None:
+                term = equal & later
+                condition = term if condition is None else condition | term
+            equal &= same
+        return condition
+
+    def _key_of(self, row) -> list:
+        if isinstance(row, dict):
+            return [row[field.attname if field.attname in row else field.name] for field in self._fields]
+        return [getattr(row, field.attname) for field in self._fields]
+
+    def _parse(self, token: str | None):
+        payload = _decode(token) if token else None
+        keys = payload.get("k") if payload else None
+        if not isinstance(keys, list) or len(keys) != len(self._fields):
+            return None, False, 1
+        try:
+            values = [
+                None if value is None else field.to_python(value)
+                for field, value in zip(self._fields, keys)
+            ]
+            # Decimals are held to their column's digits, so a forged key
+            # cannot fail inside the query.
+            for field, value in zip(self._fields, values):
+                if value is not None:
+                    field.run_validators(value)
+            number = max(1, int(payload.get("n", 1)))
+        except (TypeError, ValueError, OverflowError, ValidationError):
+            return None, False, 1
+        if any(isinstance(value, int) and value not in INT64_RANGE for value in (*values, number)):
+            return None, False, 1
+        return values, payload.get("d") == "p", number
+
+    def is_valid_cursor(self, token: str) -> bool:
+        """Whether ``token`` is a cursor this paginator issued; others show page one."""
+        return self._parse(token)[0] is not None
+
+    def cursor_after(self, row, number: int = 2) -> str:
+        """Cursor of page ``number``, which starts right after ``row``."""
+        return _encode({"k": self._key_of(row), "d": "n", "n": number})
+
+    def page(self, token: str | None) -> CursorPage:
+        values, backwards, number = self._parse(token)
+        queryset = self.queryset.order_by(
+            *keyset_ordering(self.queryset.model, self.keys, reverse=backwards)
+        )
+        if values is not None:
+            condition = self._after(values, reverse=backwards)
+            queryset = queryset.filter(condition) if condition is not None else queryset.none()
+        rows = list(queryset[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        if values is None:
+            number = 1
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.cursor_after(rows[-1], number + 1)
+        if rows and has_previous and number > 1:
+            previous_cursor = _encode({"k": self._key_of(rows[0]), "d": "p", "n": number - 1})
+        return CursorPage(rows, self, number, next_cursor, previous_cursor)
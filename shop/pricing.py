@@ -0,0 +1,197 @@
+"""
+Gold-rate pricing for the catalog.
+
+A product's price is ``weight_gram * rate_per_gram * (1 + wage_percent / 100)``
+where the rate is the newest ``GoldRate`` and the wage percentage comes from
+the product's ``WageTier``. Prices are stored on ``Product.computed_price`` so
+listings can sort by price through an index.
+
+When the rate changes the whole catalog is repriced with one set-based
+``UPDATE`` per wage tier rather than a ``save()`` per product. Both paths
+compute in integers (hundredths of a gram, hundredths of a percent) and round
+halves up, so SQL and Python always agree on the price. Rates arrive
+through a pluggable :class:`RateFeed` configured by ``SHOP_GOLD_RATE_FEED``::
+
+    SHOP_GOLD_RATE_FEED = {
+        "BACKEND": "shop.pricing.HTTPRateFeed",
+        "OPTIONS": {"url": "https://example.com/gold.json", "field": "gram_18"},
+    }
+"""
+
+from __future__ import annotations
+
+import json
+import urllib.request
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Cast, Round
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import PRICING, versioned_key
+from .models import GoldRate, Product, WageTier
+
+
+def current_rate() -> Decimal | None:
+    """The newest per-gram rate, cached until the next ``GoldRate`` is saved."""
+    key = versioned_key(PRICING, "rate")
+    cached = cache.get(key)
+    if cached is None:
+        rate = GoldRate.objects.values_list("rate_per_gram", flat=True).first()
+        cached = ("rate", rate)
+        cache.set(key, cached, None)
+    return cached[1]
+
+
+# Price = centigrams * multiplier / PRICE_SCALE, where the multiplier is the
+# rate times (100% + wage) in hundredths of a percent.
+PRICE_SCALE = 100 * 10_000
+
+
+def _hundredths(value) -> int:
+    return int((Decimal(str(value)) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _multiplier(rate: Decimal, wage_percent: Decimal | None) -> int:
+    rate = Decimal(str(rate)).to_integral_value(rounding=ROUND_HALF_UP)
+    return int(rate) * (10_000 + _hundredths(wage_percent or 0))
+
+
+def price_for_product(product: Product, rate: Decimal | None = None) -> Decimal | None:
+    """Price of a single (possibly unsaved) product at ``rate``."""
+    rate = current_rate() if rate is None else rate
+    if rate is None or product.weight_gram is None:
+        return None
+    wage_percent = product.wage_tier.wage_percent if product.wage_tier_id else None
+    scaled = _hundredths(product.weight_gram) * _multiplier(rate, wage_percent)
+    # Halves round up, exactly like the integer division in recompute_prices().
+    return Decimal((scaled + PRICE_SCALE // 2) // PRICE_SCALE)
+
+
+def recompute_prices(rate: Decimal | None = None, wage_tier_ids=None, product_ids=None) -> int:
+    """Reprice products with one ``UPDATE`` per wage tier; return rows changed.
+
+    ``wage_tier_ids`` limits the work to those tiers (``None`` in the list
+    means products without a tier); ``product_ids`` limits it to a set of
+    products. Only rows whose price actually changes are written, and their
+    ``updated_at`` is bumped so page validators and caches notice.
+    """
+    rate = current_rate() if rate is None else rate
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    now = timezone.now()
+
+    if rate is None:
+        return products.filter(computed_price__isnull=False).update(
+            computed_price=None, updated_at=now
+        )
+
+    tiers = dict(WageTier.objects.values_list("pk", "wage_percent"))
+    tiers[None] = None
+    if wage_tier_ids is not None:
+        wanted = set(wage_tier_ids)
+        tiers = {pk: pct for pk, pct in tiers.items() if pk in wanted}
+
+    changed = 0
+    for tier_id, wage_percent in tiers.items():
+        # SQLite stores decimals as floats; rounding weight * 100 recovers
+        # the exact centigrams, and the rest is integer arithmetic.
+        centigrams = Cast(Round(F("weight_gram") * 100), IntegerField())
+        price = (
+            centigrams * Value(_multiplier(rate, wage_percent)) + Value(PRICE_SCALE // 2)
+        ) / Value(PRICE_SCALE)
+        if tier_id is None:
+            scope = products.filter(wage_tier__isnull=True)
+        else:
+            scope = products.filter(wage_tier_id=tier_id)
+        changed += scope.filter(Q(computed_price__isnull=True) | ~Q(computed_price=price)).update(
+            computed_price=price, updated_at=now
+        )
+    return changed
+
+
+class RateFeed:
+    """Source of the current per-gram gold rate."""
+
+    #: Stored on ``GoldRate.source`` for auditing.
+    source_name = "feed"
+
+    def fetch(self) -> Decimal:
+        raise NotImplementedError
+
+
+def _extract(payload, field: str | None) -> Decimal:
+    if field:
+        for part in field.split("."):
+            payload = payload[part]
+    return Decimal(str(payload))
+
+
+class FileRateFeed(RateFeed):
+    """Reads the rate from a local file containing a number or a JSON object."""
+
+    def __init__(self, path: str, field: str | None = None):
+        self.path = Path(path)
+        self.field = field
+        self.source_name = f"file:{self.path.name}"
+
+    def fetch(self) -> Decimal:
+        text = self.path.read_text(encoding="utf-8").strip()
+        payload = json.loads(text) if text.startswith(("{", "[")) else text
+        return _extract(payload, self.field)
+
+
+class HTTPRateFeed(RateFeed):
+    """Fetches the rate from an HTTP endpoint returning JSON."""
+
+    def __init__(self, url: str, field: str | None = None, timeout: float = 10.0):
+        self.url = url
+        self.field = field
+        self.timeout = timeout
+        self.source_name = f"http:{url}"[:100]
+
+    def fetch(self) -> Decimal:
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            payload = json.load(response)
+        return _extract(payload, self.field)
+
+
+def get_feed() -> RateFeed:
+    config = getattr(settings, "SHOP_GOLD_RATE_FEED", None)
+    if not config:
+        raise ImproperlyConfigured("SHOP_GOLD_RATE_FEED is not configured.")
+    return import_string(config["BACKEND"])(**config.get("OPTIONS", {}))
+
+
+def validate_rate(rate) -> Decimal:
+    """``rate`` as a whole positive number of toman, or ``ValidationError``."""
+    try:
+        value = Decimal(str(rate))
+    except ArithmeticError:
+        value = None
+    if value is None or not value.is_finite():
+        raise ValidationError(f"Invalid gold rate: {rate}.")
+    value = value.to_integral_value(rounding=ROUND_HALF_UP)
+    if value <= 0:
+        raise ValidationError(f"The gold rate must be positive, not {rate}.")
+    return value
+
+
+def update_rate(rate: Decimal, source: str = "") -> GoldRate:
+    """Record a new rate; saving it reprices the catalog through signals.
+
+    ``objects.create()`` skips model validators, so the rate is checked here:
+    a zero, negative or NaN rate would otherwise reprice every product.
+    """
+    return GoldRate.objects.create(rate_per_gram=validate_rate(rate), source=source)
+
+
+def update_rate_from_feed(feed: RateFeed | None = None) -> GoldRate:
+    feed = feed or get_feed()
+    return update_rate(feed.fetch(), source=feed.source_name)
@@ -0,0 +1,391 @@
+"""
+Opt-in profiling of sampled and slow requests.
+
+``ProfilingMiddleware`` is enabled by ``SHOP_PROFILE_SAMPLE_RATE`` (the
+fraction of requests to run under ``cProfile``) and/or ``SHOP_PROFILE_SLOW_MS``
+(a latency threshold). Slow requests cannot be recognised in advance, so
+with a threshold every request is watched by :class:`StackSampler`, a single
+daemon thread that snapshots the request thread's stack every
+``SHOP_PROFILE_INTERVAL_MS``; that costs next to nothing and the samples are
+kept only when the request turns out slow.
+
+Each kept profile records the request, the SQL it ran, a top-N table by
+cumulative time (from ``cProfile`` when the request was sampled, otherwise
+estimated from the stack samples) and the samples as collapsed stacks for
+``flamegraph.pl``/speedscope. Profiles are gzip-compressed JSON files in
+``SHOP_PROFILE_DIR``; the oldest are evicted once the directory exceeds
+``SHOP_PROFILE_MAX_BYTES``. Superusers browse them in the admin.
+
+Stacks are sampled per thread, so the middleware is sync-only: under ASGI,
+enabling it runs the views through Django's sync adapter.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import gzip
+import itertools
+import json
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib import admin
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
+DEFAULT_INTERVAL_MS = 5
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_TOP = 40
+MAX_QUERIES = 500
+MAX_SQL_LENGTH = 2000
+
+# Microsecond timestamp, then a per-process sequence number and random bits,
+# so ids sort by creation time.
+_PROFILE_ID = re.compile(r"^\d{16}-[0-9a-f]{8}$")
+_sequence = itertools.count()
+
+
+def _prefixes() -> list[str]:
+    # Longest first, so site-packages wins over the stdlib directory above it.
+    paths = {os.path.abspath(entry) for entry in sys.path if entry}
+    paths.add(str(settings.BASE_DIR))
+    return sorted((p.rstrip(os.sep) + os.sep for p in paths), key=len, reverse=True)
+
+
+def _label(filename: str, name: str, prefixes: list[str]) -> str:
+    for prefix in prefixes:
+        if filename.startswith(prefix):
+            filename = filename[len(prefix) :]
+            break
+    return f"{filename}:{name}".replace(";", ",")
+
+
+class StackSampler:
+    """One daemon thread sampling the stacks of registered threads."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+        self.targets: dict[int, Counter] = {}
+        self.thread: threading.Thread | None = None
+        self.prefixes = _prefixes()
+        self.labels: dict = {}
+
+    def start(self, thread_id: int) -> Counter:
+        samples: Counter = Counter()
+        with self.lock:
+            self.targets[thread_id] = samples
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="shop-stack-sampler", daemon=True)
+                self.thread.start()
+            self.active.set()
+        return samples
+
+    def stop(self, thread_id: int) -> Counter:
+        with self.lock:
+            samples = self.targets.pop(thread_id, Counter())
+            if not self.targets:
+                self.active.clear()
+        return samples
+
+    def collapse(self, frame) -> str:
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self.labels.get(code)
+            if label is None:
+                label = self.labels[code] = _label(code.co_filename, code.co_name, self.prefixes)
+            labels.append(label)
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def run(self) -> None:
+        while True:
+            self.active.wait()
+            time.sleep(self.interval)
+            with self.lock:
+                if not self.targets:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self.targets.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[self.collapse(frame)] += 1
+
+
+def top_from_samples(samples: Counter, interval: float, limit: int) -> list[dict]:
+    """Cumulative and own time per function, estimated from stack samples."""
+    cumulative: Counter = Counter()
+    own: Counter = Counter()
+    for stack, count in samples.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for frame in set(frames):
+            cumulative[frame] += count
+    return [
+        {
+            "function": function,
+            "calls": None,
+            "own_ms": round(own[function] * interval * 1000, 1),
+            "cumulative_ms": round(count * interval * 1000, 1),
+        }
+        for function, count in cumulative.most_common(limit)
+    ]
+
+
+def top_from_profile(profiler: cProfile.Profile, limit: int, prefixes: list[str]) -> list[dict]:
+    """The ``limit`` functions with the highest cumulative time in ``profiler``."""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": _label(filename, f"{name}:{line}", prefixes),
+            "calls": calls,
+            "own_ms": round(own * 1000, 1),
+            "cumulative_ms": round(cumulative * 1000, 1),
+        }
+        for (filename, line, name), (_, calls, own, cumulative, _) in rows
+    ]
+
+
+class QueryLog:
+    """``execute_wrapper`` keeping the SQL and duration of each statement."""
+
+    def __init__(self):
+        self.queries: list[dict] = []
+        self.dropped = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append(
+                    {"sql": sql[:MAX_SQL_LENGTH], "ms": round((time.perf_counter() - start) * 1000, 3)}
+                )
+            else:
+                self.dropped += 1
+
+
+class ProfileStore:
+    """A directory of compressed profiles bounded by total size."""
+
+    def __init__(self, directory, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+
+    def path(self, profile_id: str) -> str:
+        if not _PROFILE_ID.match(profile_id):
+            raise Http404("No such profile")
+        return os.path.join(self.directory, f"{profile_id}.json.gz")
+
+    def save(self, entry: dict) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.time_ns() // 1000:016d}-{next(_sequence) % 0x10000:04x}{secrets.token_hex(2)}"
+        entry["id"] = profile_id
+        path = self.path(profile_id)
+        with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as handle:
+            json.dump(entry, handle, ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+        self.evict()
+        return profile_id
+
+    def ids(self) -> list[str]:
+        """Stored profile ids, newest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted((name[: -len(".json.gz")] for name in names if name.endswith(".json.gz")), reverse=True)
+
+    def load(self, profile_id: str) -> dict:
+        try:
+            with gzip.open(self.path(profile_id), "rt", encoding="utf-8") as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            raise Http404("No such profile")
+
+    def evict(self) -> None:
+        """Delete the oldest profiles until the directory fits in ``max_bytes``."""
+        sizes = []
+        for profile_id in self.ids():
+            try:
+                sizes.append((profile_id, os.path.getsize(self.path(profile_id))))
+            except OSError:
+                continue
+        total = sum(size for _, size in sizes)
+        for profile_id, size in reversed(sizes):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path(profile_id))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def get_store() -> ProfileStore:
+    return ProfileStore(
+        getattr(settings, "SHOP_PROFILE_DIR", settings.BASE_DIR / "profiles"),
+        getattr(settings, "SHOP_PROFILE_MAX_BYTES", DEFAULT_MAX_BYTES),
+    )
+
+
+_sampler: StackSampler | None = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler() -> StackSampler:
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            interval = getattr(settings, "SHOP_PROFILE_INTERVAL_MS", DEFAULT_INTERVAL_MS) / 1000
+            _sampler = StackSampler(interval)
+        return _sampler
+
+
+class ProfilingMiddleware:
+    """Profile a sample of requests plus every request slower than a threshold."""
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, "SHOP_PROFILE_SAMPLE_RATE", 0)
+        self.slow_ms = getattr(settings, "SHOP_PROFILE_SLOW_MS", None)
+        if not self.sample_rate and self.slow_ms is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.store = get_store()
+        self.sampler = get_sampler()
+        self.top = getattr(settings, "SHOP_PROFILE_TOP", DEFAULT_TOP)
+
+    def __call__(self, request):
+        sampled = random.random() < self.sample_rate
+        if not sampled and self.slow_ms is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile() if sampled else None
+        query_log = QueryLog()
+        thread_id = threading.get_ident()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            samples = self.sampler.start(thread_id)
+            stack.callback(self.sampler.stop, thread_id)
+            if profiler is not None:
+                profiler.enable()
+                stack.callback(profiler.disable)
+            response = self.get_response(request)
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        slow = self.slow_ms is not None and duration_ms >= self.slow_ms
+        if sampled or slow:
+            self.save(request, response, duration_ms, "slow" if slow else "sampled", profiler, samples, query_log)
+        return response
+
+    def save(self, request, response, duration_ms, trigger, profiler, samples, query_log) -> None:
+        if profiler is not None:
+            top = top_from_profile(profiler, self.top, self.sampler.prefixes)
+        else:
+            top = top_from_samples(samples, self.sampler.interval, self.top)
+        match = getattr(request, "resolver_match", None)
+        self.store.save(
+            {
+                "created": timezone.now().isoformat(timespec="seconds"),
+                "method": request.method,
+                "path": request.get_full_path(),
+                "view": match.view_name if match else None,
+                "status": response.status_code,
+                "duration_ms": round(duration_ms, 1),
+                "trigger": trigger,
+                "source": "cprofile" if profiler is not None else "samples",
+                "interval_ms": round(self.sampler.interval * 1000, 3),
+                "top": top,
+                "collapsed": dict(samples),
+                "queries": query_log.queries,
+                "queries_dropped": query_log.dropped,
+                "query_ms": round(sum(query["ms"] for query in query_log.queries), 1),
+            }
+        )
+
+
+# Admin pages. They are plain views wrapped in ``admin.site.admin_view`` and
+# linked from the admin index; only superusers may see them, since profiles
+# contain SQL.
+
+
+def _superuser_only(request) -> None:
+    if not request.user.is_superuser:
+        raise PermissionDenied
+
+
+def profile_list_view(request):
+    _superuser_only(request)
+    store = get_store()
+    page = Paginator(store.ids(), 50).get_page(request.GET.get("page"))
+    entries = []
+    for profile_id in page.object_list:
+        try:
+            entry = store.load(profile_id)
+        except Http404:
+            continue  # evicted meanwhile
+        entries.append({key: value for key, value in entry.items() if key not in ("top", "collapsed", "queries")})
+    context = {
+        **admin.site.each_context(request),
+        "title": "پروفایل درخواست‌ها",
+        "page_obj": page,
+        "entries": entries,
+        "enabled": bool(getattr(settings, "SHOP_PROFILE_SAMPLE_RATE", 0))
+        or getattr(settings, "SHOP_PROFILE_SLOW_MS", None) is not None,
+    }
+    return TemplateResponse(request, "admin/shop/profiles.html", context)
+
+
+def profile_detail_view(request, profile_id: str):
+    _superuser_only(request)
+    entry = get_store().load(profile_id)
+    context = {
+        **admin.site.each_context(request),
+        "title": f"{entry['method']} {entry['path']}",
+        "entry": entry,
+        "samples": sum(entry["collapsed"].values()),
+    }
+    return TemplateResponse(request, "admin/shop/profile_detail.html", context)
+
+
+def profile_collapsed_view(request, profile_id: str):
+    """The stack samples in the collapsed format of ``flamegraph.pl`` and speedscope."""
+    _superuser_only(request)
+    entry = get_store().load(profile_id)
+    body = "".join(f"{stack} {count}\n" for stack, count in sorted(entry["collapsed"].items()))
+    response = HttpResponse(body, content_type="text/plain; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{profile_id}.collapsed.txt"'
+    return response
+
+
+def get_admin_urls() -> list:
+    """URL patterns to include under ``admin/`` ahead of ``admin.site.urls``."""
+    return [
+        path("profiles/", admin.site.admin_view(profile_list_view), name="shop_profiles"),
+        path("profiles/<str:profile_id>/", admin.site.admin_view(profile_detail_view), name="shop_profile"),
+        path(
+            "profiles/<str:profile_id>/collapsed.txt",
+            admin.site.admin_view(profile_collapsed_view),
+            name="shop_profile_collapsed",
+        ),
+    ]
@@ -0,0 +1,191 @@
+"""
+Synthetic catalog data for development and benchmarks.
+
+:func:`seed_catalog` generates categories, wage tiers and products with
+Persian names, plausible weights and creation dates spread over two years,
+deterministically from a random seed. Product photos reuse a small pool of
+generated placeholder images whose derivatives are built once, so listing
+pages render real ``<picture>`` elements.
+
+Rows are written with ``bulk_create`` so large catalogs are produced quickly.
+Signals do not run for bulk inserts; the search index, prices, main images
+and cache versions are brought up to date at the end instead.
+"""
+
+from __future__ import annotations
+
+import random
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import cache, pricing, search
+from .images import build_derivatives
+from .models import Category, Product, ProductImage, SiteConfig, WageTier
+from .slugs import assign_slugs
+
+BATCH_SIZE = 2000
+DEFAULT_RATE = Decimal(4_500_000)
+PLACEHOLDER_COUNT = 12
+PLACEHOLDER_SIZE = 800
+
+CATEGORY_NAMES = (
+    "انگشتر",
+    "گردنبند",
+    "دستبند",
+    "گوشواره",
+    "آویز",
+    "النگو",
+    "پابند",
+    "سرویس",
+    "نیم‌ست",
+    "زنجیر",
+    "سکه",
+    "ساعت",
+)
+STYLES = (
+    "ونیزی",
+    "کارتیه",
+    "مینیمال",
+    "فرانسوی",
+    "ایتالیایی",
+    "رولکسی",
+    "نگین‌دار",
+    "طرح برگ",
+    "طرح قلب",
+    "اسم",
+    "هندسی",
+    "بی‌نهایت",
+    "طرح گل",
+    "ماری",
+)
+FINISHES = ("طلای زرد", "طلای سفید", "رزگلد", "دو رنگ")
+WAGE_TIERS = (("کم‌اجرت", 7), ("معمولی", 12), ("ویژه", 18), ("دست‌ساز", 25))
+GOLD_COLOURS = ((212, 175, 55), (229, 228, 226), (183, 110, 121), (207, 181, 59))
+
+
+def _placeholder(index: int) -> bytes:
+    rng = random.Random(index)
+    background = tuple(rng.randint(235, 250) for _ in range(3))
+    image = Image.new("RGB", (PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), background)
+    draw = ImageDraw.Draw(image)
+    colour = GOLD_COLOURS[index % len(GOLD_COLOURS)]
+    margin = rng.randint(150, 250)
+    draw.ellipse(
+        (margin, margin, PLACEHOLDER_SIZE - margin, PLACEHOLDER_SIZE - margin),
+        outline=colour,
+        width=rng.randint(30, 70),
+    )
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def placeholder_images() -> list[tuple[str, dict]]:
+    """Storage names and derivative manifests of the shared placeholder photos."""
+    placeholders = []
+    for index in range(PLACEHOLDER_COUNT):
+        name = f"products/seed/placeholder-{index:02d}.jpg"
+        if not default_storage.exists(name):
+            name = default_storage.save(name, ContentFile(_placeholder(index)))
+        placeholders.append((name, build_derivatives(name)))
+    return placeholders
+
+
+def _description(rng: random.Random, name: str, weight: Decimal) -> str:
+    return (
+        f"{name} با وزن تقریبی {weight} گرم، "
+        f"{rng.choice(('ساخت ایران', 'ساخت ایتالیا', 'ساخت ترکیه'))}، "
+        f"{rng.choice(('مناسب استفاده روزمره', 'مناسب هدیه', 'مناسب مجالس'))}."
+    )
+
+
+def _products(rng, count, categories, tiers):
+    now = timezone.now()
+    for index in range(count):
+        category = rng.choice(categories)
+        name = f"{category.name} {rng.choice(STYLES)} {rng.choice(FINISHES)}"
+        weight = Decimal(str(round(min(max(rng.lognormvariate(1.2, 0.7), 0.3), 150), 2)))
+        yield Product(
+            name=name,
+            code=f"S{index:07d}",
+            category=category,
+            wage_tier=rng.choice(tiers) if rng.random() > 0.1 else None,
+            weight_gram=weight,
+            description=_description(rng, name, weight),
+            is_active=rng.random() > 0.05,
+            is_featured=rng.random() < 0.02,
+            created_at=now - timedelta(minutes=rng.randrange(60 * 24 * 730)),
+        )
+
+
+def _images(rng, products, placeholders):
+    for product in products:
+        for sort_order, (name, manifest) in enumerate(rng.sample(placeholders, rng.randint(1, 3))):
+            yield ProductImage(
+                product_id=product.pk,
+                image=name,
+                is_main=sort_order == 0,
+                sort_order=sort_order,
+                derivatives=manifest,
+            )
+
+
+def seed_catalog(
+    products: int,
+    categories: int = len(CATEGORY_NAMES),
+    seed: int = 42,
+    images: bool = True,
+) -> dict:
+    """Insert ``products`` synthetic products into new categories and wage tiers.
+
+    Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    # A separate stream keeps products identical with and without images.
+    image_rng = random.Random(seed + 1)
+    category_objs = Category.objects.bulk_create(
+        assign_slugs(
+            Category(name=CATEGORY_NAMES[index % len(CATEGORY_NAMES)], sort_order=index)
+            for index in range(categories)
+        )
+    )
+    tier_objs = WageTier.objects.bulk_create(
+        WageTier(name=name, wage_percent=Decimal(percent), sort_order=index)
+        for index, (name, percent) in enumerate(WAGE_TIERS)
+    )
+    placeholders = placeholder_images() if images else []
+
+    created = {"categories": len(category_objs), "wage_tiers": len(tier_objs), "products": 0, "images": 0}
+    generator = _products(rng, products, category_objs, tier_objs)
+    while batch := [product for _, product in zip(range(BATCH_SIZE), generator)]:
+        Product.objects.bulk_create(assign_slugs(batch))
+        created["products"] += len(batch)
+        if placeholders:
+            created["images"] += len(
+                ProductImage.objects.bulk_create(_images(image_rng, batch, placeholders))
+            )
+            Product.objects.filter(pk__in=[product.pk for product in batch]).update(
+                main_image_id=Subquery(
+                    ProductImage.objects.filter(product_id=OuterRef("pk"), is_main=True).values("pk")[:1]
+                )
+            )
+
+    if not SiteConfig.objects.exists():
+        SiteConfig.objects.create(whatsapp_number="989120000000")
+    if pricing.current_rate() is None:
+        # Saving the first rate prices the whole catalog through signals.
+        pricing.update_rate(DEFAULT_RATE, source="seed")
+    else:
+        pricing.recompute_prices()
+    search.rebuild_index()
+    cache.invalidate(cache.NAVIGATION)
+    cache.invalidate(cache.CATALOG)
+    cache.invalidate(cache.SIMILAR)
+    return created
@@ -0,0 +1,154 @@
+"""
+Signal handlers for the shop application.
+
+Handlers are connected in ``ShopConfig.ready`` so that importing the models
+module never has side effects.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, pricing, search, similar
+from .images import needs_derivatives, schedule_derivatives
+from .models import Category, GoldRate, Product, ProductImage, SiteConfig, WageTier
+
+
+def sync_main_image(product_id: int) -> None:
+    """Point ``Product.main_image`` at the product's single main image.
+
+    If the main image was removed, the next image by ``sort_order`` is
+    promoted. ``updated_at`` is bumped as well because the product's cards and
+    pages render differently now.
+    """
+    main = (
+        ProductImage.objects.filter(product_id=product_id)
+        .order_by("-is_main", "sort_order", "id")
+        .values_list("pk", "is_main")
+        .first()
+    )
+    if main and not main[1]:
+        ProductImage.objects.filter(pk=main[0]).update(is_main=True)
+    Product.objects.filter(pk=product_id).update(
+        main_image_id=main[0] if main else None,
+        updated_at=timezone.now(),
+    )
+    cache.invalidate(cache.CATALOG)
+
+
+@receiver(post_save, sender=ProductImage, dispatch_uid="shop_image_saved")
+def product_image_saved(sender, instance: ProductImage, raw=False, **kwargs) -> None:
+    if raw:
+        return
+    sync_main_image(instance.product_id)
+    if needs_derivatives(instance.image.name, instance.derivatives):
+        image_id = instance.pk
+        transaction.on_commit(lambda: schedule_derivatives(image_id))
+
+
+@receiver(post_delete, sender=ProductImage, dispatch_uid="shop_image_deleted")
+def product_image_deleted(sender, instance: ProductImage, **kwargs) -> None:
+    sync_main_image(instance.product_id)
+
+
+@receiver(post_save, sender=Category, dispatch_uid="shop_category_nav_saved")
+@receiver(post_delete, sender=Category, dispatch_uid="shop_category_nav_deleted")
+@receiver(post_save, sender=SiteConfig, dispatch_uid="shop_site_config_saved")
+@receiver(post_delete, sender=SiteConfig, dispatch_uid="shop_site_config_deleted")
+def navigation_changed(sender, raw=False, **kwargs) -> None:
+    """Drop the cached navbar and site configuration in every worker."""
+    if not raw:
+        cache.invalidate(cache.NAVIGATION)
+
+
+@receiver(post_save, sender=Product, dispatch_uid="shop_product_search_saved")
+def product_saved_search(sender, instance: Product, raw=False, **kwargs) -> None:
+    if not raw:
+        search.index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product, dispatch_uid="shop_product_search_deleted")
+def product_deleted_search(sender, instance: Product, **kwargs) -> None:
+    search.remove_products([instance.pk])
+
+
+@receiver(post_save, sender=Category, dispatch_uid="shop_category_search_saved")
+def category_saved_search(sender, instance: Category, raw=False, **kwargs) -> None:
+    """Category names are indexed with their products, so reindex them."""
+    if not raw and not kwargs.get("created"):
+        search.index_products(instance.products.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Product, dispatch_uid="shop_product_catalog_saved")
+@receiver(post_delete, sender=Product, dispatch_uid="shop_product_catalog_deleted")
+@receiver(post_save, sender=WageTier, dispatch_uid="shop_wage_tier_catalog_saved")
+@receiver(post_delete, sender=WageTier, dispatch_uid="shop_wage_tier_catalog_deleted")
+def catalog_changed(sender, raw=False, **kwargs) -> None:
+    """Drop cached catalog aggregates such as facet counts."""
+    if not raw:
+        cache.invalidate(cache.CATALOG)
+
+
+@receiver(post_save, sender=WageTier, dispatch_uid="shop_wage_tier_options_saved")
+@receiver(post_delete, sender=WageTier, dispatch_uid="shop_wage_tier_options_deleted")
+def wage_tiers_changed(sender, raw=False, **kwargs) -> None:
+    """Drop cached facet options, which list every active tier."""
+    if not raw:
+        cache.invalidate(cache.WAGE_TIERS)
+
+
+@receiver(post_save, sender=WageTier, dispatch_uid="shop_wage_tier_products_saved")
+@receiver(pre_delete, sender=WageTier, dispatch_uid="shop_wage_tier_products_deleting")
+def wage_tier_products_touched(sender, instance: WageTier, raw=False, **kwargs) -> None:
+    """Cards and pages show the tier's name, so its products count as changed.
+
+    On delete this runs before the products' tier is cleared.
+    """
+    if not raw:
+        Product.objects.filter(wage_tier_id=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=GoldRate, dispatch_uid="shop_gold_rate_saved")
+@receiver(post_delete, sender=GoldRate, dispatch_uid="shop_gold_rate_deleted")
+def gold_rate_changed(sender, raw=False, **kwargs) -> None:
+    """Reprice the whole catalog with set-based updates."""
+    if raw:
+        return
+    cache.invalidate(cache.PRICING)
+    if pricing.recompute_prices():
+        cache.invalidate(cache.CATALOG)
+
+
+@receiver(post_save, sender=WageTier, dispatch_uid="shop_wage_tier_pricing_saved")
+def wage_tier_saved_pricing(sender, instance: WageTier, raw=False, **kwargs) -> None:
+    if not raw:
+        pricing.recompute_prices(wage_tier_ids=[instance.pk])
+
+
+@receiver(post_delete, sender=WageTier, dispatch_uid="shop_wage_tier_pricing_deleted")
+def wage_tier_deleted_pricing(sender, instance: WageTier, **kwargs) -> None:
+    # Products of a deleted tier fall back to no wage at all.
+    pricing.recompute_prices(wage_tier_ids=[None])
+    cache.invalidate(cache.SIMILAR)
+
+
+@receiver(pre_save, sender=Product, dispatch_uid="shop_product_similar_pre_save")
+def product_category_before_save(sender, instance: Product, raw=False, **kwargs) -> None:
+    """Remember the stored category, whose similar index loses the product if it moves."""
+    if raw or instance._state.adding:
+        instance._previous_category_id = None
+        return
+    instance._previous_category_id = (
+        Product.objects.filter(pk=instance.pk).values_list("category_id", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product, dispatch_uid="shop_product_similar_saved")
+@receiver(post_delete, sender=Product, dispatch_uid="shop_product_similar_deleted")
+def product_changed_similar(sender, instance: Product, raw=False, **kwargs) -> None:
+    if raw:
+        return
+    pk = instance.pk
+    categories = {instance.category_id, getattr(instance, "_previous_category_id", None)}
+    transaction.on_commit(lambda: similar.update_product(pk, categories))
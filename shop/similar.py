@@ -0,0 +1,165 @@
+"""
+"Similar pieces" for the product page.
+
+For every category :class:`CategoryIndex` keeps the active products sorted
+by weight, as parallel lists of weights, ids and wage tiers. The neighbours
+of a product are found with ``bisect`` and a short walk outwards that
+prefers products of the same wage tier, so no request ever runs an
+``ORDER BY ABS(weight_gram - x)`` scan.
+
+Indexes live in the shared cache under the ``similar`` namespace, next to a
+revision stamp that lets each process reuse its unpickled copy until the
+index changes. Saving or deleting a product updates its category's index in
+place once the transaction commits, under a per-category lock; bulk writes that bypass signals
+invalidate the namespace, and each category is then rebuilt on its next
+lookup from one query over ``product_cat_weight_idx``.
+"""
+
+from __future__ import annotations
+
+import bisect
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import SIMILAR, get_version
+from .models import Product
+
+DEFAULT_COUNT = 4
+INDEX_TIMEOUT = 60 * 60 * 24
+# Longest an index update may hold its category's lock.
+LOCK_TIMEOUT = 10
+# Neighbours looked at, per requested product, before giving up on
+# finding enough of the same wage tier.
+WALK_FACTOR = 8
+
+# Process-local copies of the last loaded indexes, tagged with their revision.
+_local: dict[int, tuple[tuple[int, int], "CategoryIndex"]] = {}
+
+
+@dataclass
+class CategoryIndex:
+    weights: list[float] = field(default_factory=list)
+    ids: list[int] = field(default_factory=list)
+    tiers: list[int | None] = field(default_factory=list)
+    revision: int = 0
+
+    def copy(self) -> "CategoryIndex":
+        return CategoryIndex(list(self.weights), list(self.ids), list(self.tiers), self.revision)
+
+    def remove(self, pk: int) -> None:
+        try:
+            position = self.ids.index(pk)
+        except ValueError:
+            return
+        del self.weights[position], self.ids[position], self.tiers[position]
+
+    def insert(self, pk: int, weight: float, tier: int | None) -> None:
+        position = bisect.bisect_right(self.weights, weight)
+        self.weights.insert(position, weight)
+        self.ids.insert(position, pk)
+        self.tiers.insert(position, tier)
+
+    def neighbours(self, pk: int, weight: float, tier: int | None, count: int) -> list[int]:
+        """Up to ``count`` ids nearest in weight, same wage tier first."""
+        weights = self.weights
+        left = bisect.bisect_left(weights, weight) - 1
+        right = left + 1
+        same, other = [], []
+        budget = count * WALK_FACTOR
+        while budget and len(same) < count and (left >= 0 or right < len(weights)):
+            if right >= len(weights) or (left >= 0 and weight - weights[left] <= weights[right] - weight):
+                position, left = left, left - 1
+            else:
+                position, right = right, right + 1
+            if self.ids[position] == pk:
+                continue
+            budget -= 1
+            (same if self.tiers[position] == tier else other).append(self.ids[position])
+        return (same + other)[:count]
+
+
+def _keys(category_id: int) -> tuple[int, str, str]:
+    version = get_version(SIMILAR)
+    return version, f"shop:{SIMILAR}:{version}:index:{category_id}", f"shop:{SIMILAR}:{version}:rev:{category_id}"
+
+
+def build_index(category_id: int) -> CategoryIndex:
+    index = CategoryIndex()
+    rows = (
+        Product.objects.active()
+        .filter(category_id=category_id)
+        .order_by("weight_gram", "id")
+        .values_list("pk", "weight_gram", "wage_tier_id")
+    )
+    for pk, weight, tier in rows:
+        index.weights.append(float(weight))
+        index.ids.append(pk)
+        index.tiers.append(tier)
+    return index
+
+
+def _store(category_id: int, version: int, index_key: str, rev_key: str, index: CategoryIndex) -> None:
+    index.revision = time.time_ns()
+    cache.set_many({index_key: index, rev_key: index.revision}, INDEX_TIMEOUT)
+    _local[category_id] = ((version, index.revision), index)
+
+
+def get_index(category_id: int) -> CategoryIndex:
+    """The category's index; two cache reads when this process has it already."""
+    version, index_key, rev_key = _keys(category_id)
+    revision = cache.get(rev_key)
+    local = _local.get(category_id)
+    if revision is not None and local is not None and local[0] == (version, revision):
+        return local[1]
+    index = cache.get(index_key) if revision is not None else None
+    if index is None or index.revision != revision:
+        index = build_index(category_id)
+        _store(category_id, version, index_key, rev_key, index)
+    else:
+        _local[category_id] = ((version, revision), index)
+    return index
+
+
+def similar_ids(pk: int, category_id: int, weight, wage_tier_id: int | None) -> tuple[int, list[int]]:
+    """``(index revision, ids)`` of the products to show next to ``pk``."""
+    index = get_index(category_id)
+    count = getattr(settings, "SHOP_SIMILAR_COUNT", DEFAULT_COUNT)
+    return index.revision, index.neighbours(pk, float(weight), wage_tier_id, count)
+
+
+def load_similar(ids: list[int], category_id: int) -> list[Product]:
+    """Cards for ``ids`` in index order, with one query (none for no ids)."""
+    if not ids:
+        return []
+    # Filtering again keeps a stale index from showing a moved or hidden product.
+    products = Product.objects.active().cards().filter(pk__in=ids, category_id=category_id).in_bulk()
+    return [products[pk] for pk in ids if pk in products]
+
+
+def update_product(pk: int, categories) -> None:
+    """Re-read product ``pk`` into the index of each of ``categories``.
+
+    The read-modify-write of the shared index holds a short ``cache.add``
+    lock, so two workers saving products of one category cannot drop each
+    other's change. A worker that does not get the lock deletes the index
+    instead, and the next lookup rebuilds it from the database.
+    """
+    row = Product.objects.active().filter(pk=pk).values_list("category_id", "weight_gram", "wage_tier_id").first()
+    for category_id in {category for category in categories if category is not None}:
+        version, index_key, rev_key = _keys(category_id)
+        lock_key = f"{index_key}:lock"
+        if not cache.add(lock_key, pk, LOCK_TIMEOUT):
+            cache.delete_many([rev_key, index_key])
+            _local.pop(category_id, None)
+            continue
+        try:
+            index = get_index(category_id).copy()
+            index.remove(pk)
+            if row is not None and row[0] == category_id:
+                index.insert(pk, float(row[1]), row[2])
+            _store(category_id, version, index_key, rev_key, index)
+        finally:
+            cache.delete(lock_key)
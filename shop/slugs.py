@@ -0,0 +1,138 @@
+"""
+Unique slug allocation for catalog models.
+
+A slug is derived from the object's name; when it is taken, the next free
+numeric suffix is appended (``ring``, ``ring-1``, ``ring-2``, ...). The
+highest suffix in use for a base is read with one aggregate over a range of
+the unique slug index instead of probing suffixes one by one, and suffixes freed by deletions are
+not reused so old links never point at a different product.
+
+Names without any ASCII letters (e.g. Persian names) fall back to the model
+name as the base, since URL patterns only accept ASCII slugs.
+"""
+
+from __future__ import annotations
+
+import re
+
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Count, IntegerField, Max, Q, Value
+from django.db.models.functions import Cast, Concat, Substr
+from django.utils.text import slugify
+
+# Room kept at the end of ``max_length`` for a "-<n>" suffix.
+SUFFIX_LENGTH = 8
+# Bases per query when allocating slugs for a batch of objects.
+BASE_BATCH_SIZE = 100
+SAVE_ATTEMPTS = 5
+
+_SUFFIXED = re.compile(r"^(?P<base>.+)-(?P<number>[1-9][0-9]*)$")
+
+
+def base_slug(instance, value: str) -> str:
+    """The un-suffixed slug for ``value``, truncated to leave room for a suffix."""
+    max_length = instance._meta.get_field("slug").max_length
+    base = slugify(value) or instance._meta.model_name
+    return base[: max_length - SUFFIX_LENGTH].strip("-") or instance._meta.model_name
+
+
+def _claim(taken: dict[str, int], slug: str) -> None:
+    """Record ``slug`` as used if it is one of the bases or ``base-<n>``."""
+    if slug in taken:
+        taken[slug] = max(taken[slug], 0)
+        return
+    match = _SUFFIXED.match(slug)
+    if match and match["base"] in taken:
+        taken[match["base"]] = max(taken[match["base"]], int(match["number"]))
+
+
+def taken_suffixes(model, bases, exclude_pk=None) -> dict[str, int]:
+    """Map each base to its highest suffix in use.
+
+    ``0`` means only the bare base is taken and ``-1`` that the base is free.
+    """
+    taken = {base: -1 for base in bases}
+    ordered = sorted(taken)
+    for start in range(0, len(ordered), BASE_BATCH_SIZE):
+        chunk = ordered[start : start + BASE_BATCH_SIZE]
+        rows = Q(slug__in=chunk)
+        aggregates = {}
+        for index, base in enumerate(chunk):
+            # "base-" < slug < "base." is slug__startswith=f"{base}-" in a form
+            # the unique index serves; SQLite's case-insensitive LIKE cannot.
+            suffixed = Q(slug__gt=f"{base}-", slug__lt=f"{base}.")
+            rows |= suffixed
+            number = Cast(Substr("slug", len(base) + 2), IntegerField())
+            aggregates[f"bare_{index}"] = Count("pk", filter=Q(slug=base))
+            # Only "base-<n>" with a canonical number counts: the suffix must
+            # read back unchanged from its integer value. This compares text
+            # in SQL, without a per-row regular expression callback.
+            aggregates[f"max_{index}"] = Max(
+                number,
+                filter=suffixed & Q(slug=Concat(Value(f"{base}-"), Cast(number, CharField()))),
+            )
+        slugs = model._default_manager.filter(rows)
+        if exclude_pk is not None:
+            slugs = slugs.exclude(pk=exclude_pk)
+        result = slugs.aggregate(**aggregates)
+        for index, base in enumerate(chunk):
+            if result[f"bare_{index}"]:
+                taken[base] = 0
+            if result[f"max_{index}"] is not None:
+                taken[base] = max(taken[base], result[f"max_{index}"])
+    return taken
+
+
+def _next_free(base: str, highest: int) -> str:
+    return base if highest < 0 else f"{base}-{highest + 1}"
+
+
+def allocate_slug(instance, value: str) -> str:
+    """A slug for ``value`` that is unused in the database, in one query."""
+    base = base_slug(instance, value)
+    highest = taken_suffixes(type(instance), [base], exclude_pk=instance.pk)[base]
+    return _next_free(base, highest)
+
+
+def assign_slugs(objs, value=lambda obj: obj.name) -> list:
+    """Give every object in ``objs`` without a slug a unique one, in memory.
+
+    Intended for unsaved objects ahead of ``bulk_create``: collisions with the
+    database and within the batch are resolved with one query per
+    ``BASE_BATCH_SIZE`` distinct bases. A concurrent writer can still claim a
+    slug before the insert, so callers should be ready to retry.
+    """
+    objs = list(objs)
+    pending = [(obj, base_slug(obj, value(obj))) for obj in objs if not obj.slug]
+    if not pending:
+        return objs
+    taken = taken_suffixes(type(pending[0][0]), {base for _, base in pending})
+    for obj in objs:
+        if obj.slug:
+            _claim(taken, obj.slug)
+    for obj, base in pending:
+        obj.slug = _next_free(base, taken[base])
+        _claim(taken, obj.slug)
+    return objs
+
+
+def save_with_unique_slug(instance, save, value: str, *args, **kwargs) -> None:
+    """Allocate a slug and call ``save``, retrying if another writer took it.
+
+    ``save`` is the model's underlying save method. Each attempt runs in a
+    savepoint so a unique-constraint violation does not break an enclosing
+    transaction.
+    """
+    for attempt in range(SAVE_ATTEMPTS):
+        instance.slug = allocate_slug(instance, value)
+        try:
+            with transaction.atomic():
+                save(*args, **kwargs)
+            return
+        except IntegrityError:
+            slug, instance.slug = instance.slug, ""
+            collided = (
+                type(instance)._default_manager.filter(slug=slug).exclude(pk=instance.pk).exists()
+            )
+            if not collided or attempt == SAVE_ATTEMPTS - 1:
+                raise
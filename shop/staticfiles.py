@@ -0,0 +1,193 @@
+"""
+Hashed, precompressed static files and a middleware that serves them.
+
+``CompressedManifestStaticFilesStorage`` extends Django's manifest storage:
+``collectstatic`` writes content-hashed copies of every file and, for
+compressible types, ``.gz`` and (with the optional ``brotli`` package)
+``.br`` siblings of the hashed copies, compressed once at maximum level.
+
+``StaticFilesMiddleware`` serves ``STATIC_ROOT`` from inside Django so no
+separate web server is needed. The directory is indexed at startup; each
+request is a dict lookup that picks the best precompressed variant for the
+client's ``Accept-Encoding``. Hashed names never change content, so they are
+sent with a one-year ``immutable`` ``Cache-Control``; anything else is
+revalidated. Files are returned as ``FileResponse`` so WSGI servers that
+provide ``wsgi.file_wrapper`` (gunicorn, uWSGI) send them with ``sendfile``.
+"""
+
+from __future__ import annotations
+
+import gzip
+import mimetypes
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = frozenset(
+    {".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".xml", ".html", ".ico", ".ttf", ".otf", ".eot"}
+)
+# Smaller files gain nothing worth a second request path.
+MIN_COMPRESS_SIZE = 256
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+# Preferred first; the suffix of each precompressed sibling.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_CODING = re.compile(r"\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def compress(path: str) -> list[str]:
+    """Write compressed siblings of ``path`` that are smaller than it; return their names."""
+    with open(path, "rb") as handle:
+        data = handle.read()
+    variants = [(".gz", lambda raw: gzip.compress(raw, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", lambda raw: brotli.compress(raw, quality=11)))
+    written = []
+    for suffix, compressor in variants:
+        compressed = compressor(data)
+        # Keep a variant only if it saves at least 5%.
+        if len(compressed) < len(data) * 0.95:
+            with open(path + suffix, "wb") as handle:
+                handle.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes ``.gz``/``.br`` siblings of hashed files."""
+
+    # Templates referencing a file that is not collected get its plain URL
+    # instead of a 500.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for hashed_name in set(self.hashed_files.values()):
+            path = self.path(hashed_name)
+            if (
+                os.path.splitext(hashed_name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+                and os.path.getsize(path) >= MIN_COMPRESS_SIZE
+            ):
+                compress(path)
+
+
+@dataclass(frozen=True)
+class StaticFile:
+    path: str
+    size: int
+    mtime: float
+    content_type: str
+    immutable: bool
+    # Content-Encoding -> (path, size) of the precompressed siblings.
+    variants: dict
+
+    def etag(self, encoding: str | None) -> str:
+        return quote_etag(f"{int(self.mtime):x}-{self.size:x}{'-' + encoding if encoding else ''}")
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Codings from an ``Accept-Encoding`` header with a non-zero quality."""
+    accepted = set()
+    for coding, quality in _CODING.findall(header.lower()):
+        try:
+            if float(quality or 1) > 0:
+                accepted.add(coding)
+        except ValueError:
+            continue
+    return accepted
+
+
+def build_index(root: Path, prefix: str, hashed_names: set[str]) -> dict[str, StaticFile]:
+    """URL path -> :class:`StaticFile` for every file under ``root``."""
+    suffixes = {suffix for _, suffix in ENCODINGS}
+    index = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if os.path.splitext(filename)[1] in suffixes:
+                continue
+            path = os.path.join(directory, filename)
+            name = Path(path).relative_to(root).as_posix()
+            stat = os.stat(path)
+            variants = {}
+            for encoding, suffix in ENCODINGS:
+                if os.path.exists(path + suffix):
+                    variants[encoding] = (path + suffix, os.path.getsize(path + suffix))
+            content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+            if content_type.startswith("text/") or content_type in ("application/javascript", "image/svg+xml"):
+                content_type += "; charset=utf-8"
+            index[prefix + name] = StaticFile(
+                path=path,
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                content_type=content_type,
+                immutable=name in hashed_names,
+                variants=variants,
+            )
+    return index
+
+
+class StaticFilesMiddleware(MiddlewareMixin):
+    """Serve collected files under ``STATIC_URL`` before the rest of the stack.
+
+    Disabled in ``DEBUG`` (``runserver`` serves the source files then) and when
+    ``STATIC_ROOT`` has not been collected.
+    """
+
+    def __init__(self, get_response):
+        root = Path(settings.STATIC_ROOT) if settings.STATIC_ROOT else None
+        if settings.DEBUG or root is None or not root.is_dir():
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.prefix = "/" + settings.STATIC_URL.lstrip("/")
+        hashed_names = set(getattr(staticfiles_storage, "hashed_files", {}).values())
+        self.files = build_index(root, self.prefix, hashed_names)
+
+    def process_request(self, request):
+        if request.method in ("GET", "HEAD") and request.path_info.startswith(self.prefix):
+            static_file = self.files.get(request.path_info)
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return None
+
+    def serve(self, request, static_file: StaticFile):
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        encoding = next(
+            (coding for coding, _ in ENCODINGS if coding in accepted and coding in static_file.variants),
+            None,
+        )
+        etag = static_file.etag(encoding)
+        timestamp = int(static_file.mtime)
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            path, size = static_file.variants[encoding] if encoding else (static_file.path, static_file.size)
+            response = FileResponse(open(path, "rb"))
+            response.headers["Content-Type"] = static_file.content_type
+            response.headers["Content-Length"] = str(size)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        if static_file.variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(timestamp)
+        if static_file.immutable:
+            response.headers["Cache-Control"] = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            response.headers["Cache-Control"] = "public, max-age=0, must-revalidate"
+        return response
@@ -0,0 +1,125 @@
+"""Template tags for the shop templates."""
+
+import hashlib
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.template.loader import get_template
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from ..images import MIME_TYPES
+
+register = template.Library()
+
+PLACEHOLDER_URL = "https://via.placeholder.com/400x400?text=No+Image"
+DEFAULT_SIZES = "(min-width: 768px) 25vw, 50vw"
+CARD_TEMPLATE = "includes/product_card.html"
+DEFAULT_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+@register.filter
+def toman(value) -> str:
+    """Format a price with thousands separators, e.g. ``12,500,000``."""
+    if value in (None, ""):
+        return ""
+    return f"{int(value):,}"
+
+
+def _srcset(entries) -> str:
+    return ", ".join(f"{default_storage.url(name)} {width}w" for width, name in entries)
+
+
+@register.simple_tag
+def responsive_image(image, alt="", sizes=DEFAULT_SIZES, css_class="", loading="lazy"):
+    """Render a ``<picture>`` with AVIF/WebP sources and a JPEG ``<img srcset>``.
+
+    ``image`` is a ``ProductImage`` (or ``None`` for the placeholder). When its
+    derivatives have not been built yet the original file is served as-is.
+    """
+    if not image:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">',
+            PLACEHOLDER_URL, alt, css_class, loading,
+        )
+
+    manifest = image.derivatives or {}
+    sources = manifest.get("sources") or {}
+    if manifest.get("source") != image.image.name or not sources:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            image.image.url, alt, css_class, loading,
+        )
+
+    fallback = sources.get("jpeg") or next(iter(sources.values()))
+    # The middle width is a sensible default for browsers without srcset.
+    fallback_url = default_storage.url(fallback[len(fallback) // 2][1])
+    modern = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (MIME_TYPES[fmt], _srcset(entries), sizes)
+            for fmt, entries in sources.items()
+            if fmt != "jpeg" and entries
+        ),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'alt="{}" class="{}" loading="{}" decoding="async"></picture>',
+        modern,
+        fallback_url,
+        _srcset(fallback),
+        sizes,
+        manifest.get("width", ""),
+        manifest.get("height", ""),
+        alt,
+        css_class,
+        loading,
+    )
+
+
+@lru_cache(maxsize=8)
+def _digest(text: str) -> str:
+    return hashlib.md5(text.encode(), usedforsecurity=False).hexdigest()[:8]
+
+
+def card_key(product, show_category: bool, template_digest: str) -> str:
+    """Cache key of a rendered card.
+
+    Every edit to what a card shows moves ``updated_at``, prices and photo
+    derivatives included; category and wage tier names are edited on their
+    own rows, so they are folded in from the already joined relations.
+    """
+    labels = f"{product.category.name}|{product.wage_tier.name if product.wage_tier else ''}"
+    return (
+        f"shop:card:{template_digest}:{int(show_category)}:{product.pk}:"
+        f"{product.updated_at.timestamp()}:{product.main_image_id}:{_digest(labels)}"
+    )
+
+
+@register.simple_tag
+def product_cards(products, show_category=True):
+    """Render ``includes/product_card.html`` for each product, from the fragment cache.
+
+    ``products`` must come from ``Product.objects.cards()``. A warm listing is
+    one ``get_many`` and a string join; missing cards are rendered and stored
+    with one ``set_many``. The template source is part of the key, so a
+    deploy that changes the card never serves the old markup.
+    """
+    products = list(products)
+    if not products:
+        return ""
+    card = get_template(CARD_TEMPLATE)
+    template_digest = _digest(card.template.source)
+    keys = [card_key(product, show_category, template_digest) for product in products]
+    cached = cache.get_many(keys)
+    rendered = {}
+    for key, product in zip(keys, products):
+        if key not in cached:
+            rendered[key] = card.render({"product": product, "show_category": show_category})
+    if rendered:
+        cache.set_many(rendered, getattr(settings, "SHOP_CARD_CACHE_TIMEOUT", DEFAULT_CARD_CACHE_TIMEOUT))
+    return mark_safe("".join(cached[key] if key in cached else rendered[key] for key in keys))
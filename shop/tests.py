@@ -1,3 +1,1579 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from collections import Counter
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections
+from django.db.utils import ConnectionHandler, OperationalError
+from django.http import Http404, HttpResponse, QueryDict
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import context_processors
+from .admin import bulk_update
+from .cache import CATALOG, SIMILAR, get_version
+from .catalog_io import Checkpoint
+from .db import DEFAULT_PRAGMAS, ReadReplicaRouter
+from .facets import FacetSelection, _bucket_label, compute_facet_counts
+from .images import build_derivatives, derivative_name
+from .models import Category, GoldRate, Product, ProductImage, SiteConfig, WageTier
+from .media import parse_range
+from .metrics import merge_snapshots, registry
+from .pagination import CursorPaginator, keyset_ordering
+from .pricing import current_rate, price_for_product, recompute_prices, update_rate
+from .profiling import ProfileStore
+from .search import normalize, search_products, tokenize
+from .seed import seed_catalog
+from .slugs import allocate_slug, assign_slugs
+from .similar import _keys as similar_keys, get_index as get_similar_index, similar_ids
+from .staticfiles import StaticFilesMiddleware, accepted_encodings
+from .uploads import HashingFileUploadHandler, cas_name, is_content_addressed
+from .views import (
+    AsyncCategoryDetailView,
+    AsyncHomeView,
+    AsyncProductDetailView,
+    AsyncProductListView,
+    CategoryDetailView,
+    HomeView,
+    ProductDetailView,
+    ProductListView,
+    SearchView,
+    gather_queries,
+)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\?, )*\?\)")
+
+
+def sql_fingerprint(sql: str) -> str:
+    """``sql`` with literals replaced, so N+1 statements share a fingerprint."""
+    sql = _NUMBER.sub("?", _STRING.sub("?", sql))
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+def format_queries(queries) -> str:
+    """Executed statements grouped by fingerprint, repeated ones first."""
+    counts = Counter(sql_fingerprint(query["sql"]) for query in queries)
+    lines = []
+    for fingerprint, count in counts.most_common():
+        marker = "REPEATED" if count > 1 else "once"
+        lines.append(f"  [{count}x {marker}] {fingerprint}")
+    return "\n".join(lines)
+
+
+class QueryBudgetMixin:
+    """Assertions that fail with the duplicated SQL grouped by fingerprint."""
+
+    @contextmanager
+    def assertQueryBudget(self, budget: int, label: str = ""):
+        with CaptureQueriesContext(connection) as captured:
+            yield captured
+        if len(captured) > budget:
+            self.fail(
+                f"{label or 'Block'} ran {len(captured)} queries, budget is {budget}:\n"
+                + format_queries(captured.captured_queries)
+            )
+
+    def get_query_count(self, url: str, **extra) -> tuple[int, list]:
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200, url)
+        return len(captured), captured.captured_queries
+
+    def assertPageSizeIndependent(self, view_class, url: str, sizes=(4, 40)):
+        """The query count of ``url`` must not change with ``paginate_by``."""
+        counts = {}
+        for size in sizes:
+            self.reset_caches()
+            with mock.patch.object(view_class, "paginate_by", size):
+                counts[size], queries = self.get_query_count(url)
+        if len(set(counts.values())) > 1:
+            self.fail(
+                f"{url} query count grows with page size {counts}; "
+                f"queries at page size {sizes[-1]}:\n" + format_queries(queries)
+            )
+
+    def reset_caches(self) -> None:
+        cache.clear()
+        context_processors._local.clear()
+
+
+class SqlFingerprintTests(TestCase):
+    def test_literals_are_normalised(self):
+        first = sql_fingerprint('SELECT * FROM "t" WHERE "id" = 12 AND "slug" = \'a\'')
+        second = sql_fingerprint('SELECT * FROM "t" WHERE "id" = 7 AND "slug" = \'it\'\'s\'')
+        self.assertEqual(first, second)
+        self.assertEqual(
+            sql_fingerprint('SELECT 1 FROM "t" WHERE "id" IN (1, 2, 3)'),
+            sql_fingerprint('SELECT 1 FROM "t" WHERE "id" IN (4)'),
+        )
+
+
+@override_settings(
+    SHOP_IMAGE_WIDTHS=(320,),
+    SHOP_IMAGE_FORMATS=("webp", "jpeg"),
+)
+class CatalogTestCase(QueryBudgetMixin, TestCase):
+    """Runs against a seeded catalog with placeholder photos in a temporary MEDIA_ROOT."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(90, categories=2)
+        cls.category = Category.objects.order_by("pk").first()
+        cls.product = Product.objects.active().order_by("-created_at").first()
+        cls.tier = WageTier.objects.order_by("pk").first()
+
+    def setUp(self):
+        self.reset_caches()
+
+
+class ViewQueryBudgetTests(CatalogTestCase):
+    """Cold-cache query budgets for every public view.
+
+    Budgets are totals per request including the context processor, so a
+    template that starts touching a relation per product fails here with
+    the repeated statement in the message.
+    """
+
+    def assertViewBudget(self, url: str, budget: int):
+        count, queries = self.get_query_count(url)
+        if count > budget:
+            self.fail(f"{url} ran {count} queries, budget is {budget}:\n" + format_queries(queries))
+
+    def test_home(self):
+        self.assertViewBudget(reverse("shop:home"), 6)
+
+    def test_product_list(self):
+        url = reverse("shop:product_list")
+        self.assertViewBudget(url, 5)
+        self.assertViewBudget(f"{url}?page=2", 5)
+        self.assertPageSizeIndependent(ProductListView, url)
+
+    def test_product_list_cursor_pagination(self):
+        url = reverse("shop:product_list")
+        with mock.patch.object(ProductListView, "cursor_pagination", True):
+            self.assertViewBudget(url, 5)
+            self.assertPageSizeIndependent(ProductListView, url)
+
+    def test_category_detail(self):
+        url = reverse("shop:category_detail", kwargs={"slug": self.category.slug})
+        self.assertViewBudget(url, 8)
+        self.assertViewBudget(f"{url}?sort=price_desc&wage={self.tier.pk}&min_weight=2", 8)
+        self.assertPageSizeIndependent(CategoryDetailView, url)
+
+    def test_search(self):
+        url = f"{reverse('shop:search')}?q={self.category.name}"
+        self.assertViewBudget(url, 5)
+        self.assertPageSizeIndependent(SearchView, url)
+
+    def test_product_detail(self):
+        url = reverse("shop:product_detail", kwargs={"slug": self.product.slug})
+        # Cold: building the category's similar index, then the strip's cards.
+        self.assertViewBudget(url, 7)
+        # Warm: the index is cached and the strip costs one query.
+        self.assertViewBudget(url, 4)
+
+    def test_warm_navigation_is_free(self):
+        self.client.get(reverse("shop:home"))
+        with self.assertQueryBudget(0, "global_context"):
+            context_processors.global_context(None)
+
+
+class ConditionalGetTests(CatalogTestCase):
+    def pages(self):
+        return [
+            reverse("shop:home"),
+            reverse("shop:product_list"),
+            reverse("shop:category_detail", kwargs={"slug": self.product.category.slug}),
+            reverse("shop:product_detail", kwargs={"slug": self.product.slug}),
+        ]
+
+    def etags(self) -> dict:
+        etags = {}
+        for url in self.pages():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            etags[url] = response["ETag"]
+        return etags
+
+    def assertRevalidates(self, etags: dict, status: int):
+        for url, etag in etags.items():
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status, url)
+
+    def test_unchanged_pages_answer_304(self):
+        etags = self.etags()
+        self.assertRevalidates(etags, 304)
+        response = self.client.get(self.pages()[1], HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_edit_changes_etags(self):
+        etags = self.etags()
+        self.product.name = "دستبند تازه"
+        self.product.save()
+        self.assertRevalidates(etags, 200)
+
+    def test_wage_tier_rename_changes_etags(self):
+        tier = self.product.wage_tier
+        etags = self.etags()
+        tier.name = "اجرت تازه"
+        tier.save()
+        self.assertRevalidates(etags, 200)
+        self.assertContains(self.client.get(self.pages()[3]), "اجرت تازه")
+
+    def test_site_config_edit_changes_etags(self):
+        etags = self.etags()
+        SiteConfig.objects.update_or_create(pk=1, defaults={"store_name": "نور گلد تازه"})
+        self.assertRevalidates(etags, 200)
+
+    def last_modified(self) -> dict:
+        return {url: self.client.get(url)["Last-Modified"] for url in self.pages()}
+
+    def assertModifiedSince(self, stamps: dict, status: int):
+        for url, stamp in stamps.items():
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=stamp).status_code, status, url)
+
+    def later(self):
+        # HTTP dates have whole seconds; record the next change a bit later.
+        return mock.patch("shop.cache.time.time", return_value=time.time() + 5)
+
+    def test_if_modified_since_sees_a_product_leave(self):
+        other = Product.objects.active().filter(category=self.product.category).exclude(pk=self.product.pk).first()
+        stamps = self.last_modified()
+        self.assertModifiedSince(stamps, 304)
+        with self.later():
+            other.is_active = False
+            other.save()
+        self.assertModifiedSince(stamps, 200)
+
+    def test_if_modified_since_sees_a_wage_tier_rename(self):
+        stamps = self.last_modified()
+        with self.later():
+            self.product.wage_tier.name = "اجرت تازه"
+            self.product.wage_tier.save()
+        self.assertModifiedSince(stamps, 200)
+
+    def test_edits_elsewhere_keep_etags(self):
+        category_page, product_page = self.pages()[2], self.pages()[3]
+        etags = self.etags()
+        elsewhere = Product.objects.exclude(category=self.product.category).first()
+        elsewhere.name = "نام تازه"
+        elsewhere.save()
+        self.assertRevalidates({category_page: etags[category_page]}, 304)
+        # The product page shows neighbours whose prices and photos can change
+        # without an index update, so it follows the whole catalog.
+        self.assertRevalidates({product_page: etags[product_page]}, 200)
+        self.assertRevalidates({url: etags[url] for url in self.pages()[:2]}, 200)
+
+
+class FacetTests(CatalogTestCase):
+    def test_malformed_wage_is_ignored(self):
+        url = reverse("shop:category_detail", kwargs={"slug": self.category.slug})
+        for value in ("²", "۳", "x", "-1", "99999999999999999999999"):
+            response = self.client.get(url, {"wage": value})
+            self.assertEqual(response.status_code, 200, value)
+            self.assertFalse(response.context["facets"]["selection"].is_active, value)
+        selection = FacetSelection.from_querydict(QueryDict(f"wage={self.tier.pk}&wage=²"))
+        self.assertEqual(selection.wage_tier_ids, (self.tier.pk,))
+
+    def test_counts_survive_edits_elsewhere(self):
+        selection = FacetSelection()
+        counts = compute_facet_counts(self.category.pk, selection)
+        elsewhere = Product.objects.exclude(category=self.category).first()
+        elsewhere.weight_gram += 1
+        elsewhere.save()
+        # Only the category's statistics are read again.
+        with self.assertNumQueries(1):
+            self.assertEqual(compute_facet_counts(self.category.pk, selection), counts)
+
+        product = Product.objects.filter(category=self.category, wage_tier=self.tier).first()
+        product.is_active = False
+        product.save()
+        fresh = compute_facet_counts(self.category.pk, selection)
+        self.assertEqual(fresh["total"], counts["total"] - 1)
+
+    def test_bucket_labels(self):
+        self.assertEqual(_bucket_label(0, 2), "کمتر از 2 گرم")
+        self.assertEqual(_bucket_label(2, 5), "2 تا 5 گرم")
+        self.assertEqual(_bucket_label(20, None), "20 گرم و بیشتر")
+        self.assertEqual(_bucket_label(0, None), "همه وزن‌ها")
+        self.assertEqual(_bucket_label(None, None), "همه وزن‌ها")
+
+
+class CursorPaginationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        # A third of the prices are NULL and the rest share three values.
+        for product in Product.objects.all():
+            price = None if product.pk % 3 == 0 else Decimal(product.pk % 4 * 1000)
+            Product.objects.filter(pk=product.pk).update(computed_price=price)
+
+    def expected(self, keys) -> list[int]:
+        ordering = keyset_ordering(Product, keys)
+        return list(Product.objects.order_by(*ordering).values_list("pk", flat=True))
+
+    def walk(self, keys, per_page: int = 7):
+        paginator = CursorPaginator(Product.objects.all(), per_page, keys)
+        pages = [paginator.page(None)]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return paginator, pages
+
+    def test_walk_forward_and_back_across_ties_and_nulls(self):
+        for keys in (("computed_price", "id"), ("-computed_price", "-id"), ("-computed_price", "id")):
+            paginator, pages = self.walk(keys)
+            forward = [[product.pk for product in page] for page in pages]
+            self.assertEqual([pk for page in forward for pk in page], self.expected(keys), keys)
+            self.assertEqual([page.number for page in pages], list(range(1, len(pages) + 1)))
+            self.assertFalse(pages[0].has_previous())
+
+            page, backward = pages[-1], [forward[-1]]
+            while page.has_previous():
+                page = paginator.page(page.previous_cursor)
+                backward.insert(0, [product.pk for product in page])
+            self.assertEqual(backward, forward, keys)
+            self.assertEqual(page.number, 1)
+
+    def test_tampered_cursor_shows_the_first_page(self):
+        paginator = CursorPaginator(Product.objects.all(), 7, ("-created_at", "-id"))
+        first = [product.pk for product in paginator.page(None)]
+        created = self.product.created_at.isoformat()
+        forged = [
+            b'{"k":[1]}',
+            b'{"k":["today",1],"n":"x"}',
+            # Out of range for SQLite's 64-bit integers.
+            f'{{"k":["{created}",1],"n":Infinity}}'.encode(),
+            f'{{"k":["{created}",1],"n":{2**63}}}'.encode(),
+            f'{{"k":["{created}",{10**27}]}}'.encode(),
+            f'{{"k":["{created}",{-2**63 - 1}]}}'.encode(),
+        ]
+        tokens = ["not-a-cursor", "%%%"] + [base64.urlsafe_b64encode(raw).decode() for raw in forged]
+        for token in tokens:
+            self.assertFalse(paginator.is_valid_cursor(token), token)
+            page = paginator.page(token)
+            self.assertEqual([product.pk for product in page], first, token)
+            self.assertEqual(page.number, 1)
+
+        url = reverse("shop:product_list")
+        with mock.patch.object(ProductListView, "cursor_pagination", True):
+            expected = list(self.client.get(url).context["page_obj"])
+            for token in tokens:
+                response = self.client.get(url, {"cursor": token})
+                self.assertEqual(response.status_code, 200, token)
+                self.assertEqual(list(response.context["page_obj"]), expected, token)
+
+        # Decimal keys are held to their column's digits.
+        by_price = CursorPaginator(Product.objects.all(), 7, ("-computed_price", "-id"))
+        huge = base64.urlsafe_b64encode(b'{"k":["1e30",1]}').decode()
+        self.assertFalse(by_price.is_valid_cursor(huge))
+        self.assertEqual(len(by_price.page(huge)), 7)
+
+
+class AsyncViewTests(CatalogTestCase):
+    """The async variants render the same pages as the sync views."""
+
+    def pages(self):
+        category = {"slug": self.category.slug}
+        product = {"slug": self.product.slug}
+        return [
+            (HomeView, AsyncHomeView, reverse("shop:home"), {}),
+            (ProductListView, AsyncProductListView, reverse("shop:product_list") + "?page=2", {}),
+            (
+                CategoryDetailView,
+                AsyncCategoryDetailView,
+                reverse("shop:category_detail", kwargs=category) + "?sort=price_asc",
+                category,
+            ),
+            (
+                ProductDetailView,
+                AsyncProductDetailView,
+                reverse("shop:product_detail", kwargs=product),
+                product,
+            ),
+        ]
+
+    def test_async_views_match_sync_views(self):
+        factory = RequestFactory()
+        for sync_view, async_view, url, kwargs in self.pages():
+            with self.subTest(view=async_view.__name__):
+                self.reset_caches()
+                expected, expected_queries = self.render(sync_view.as_view(), factory.get(url), kwargs)
+                self.reset_caches()
+                view = async_to_sync(async_view.as_view())
+                response, queries = self.render(view, factory.get(url), kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+                # The same queries, only issued concurrently.
+                self.assertEqual(len(queries), len(expected_queries), format_queries(queries))
+
+                request = factory.get(url, HTTP_IF_NONE_MATCH=response.headers["ETag"])
+                self.assertEqual(view(request, **kwargs).status_code, 304)
+
+    def render(self, view, request, kwargs):
+        with CaptureQueriesContext(connection) as captured:
+            response = view(request, **kwargs)
+            response.render()
+        return response, captured.captured_queries
+
+    async def test_missing_product_is_404(self):
+        request = RequestFactory().get("/product/missing/")
+        with self.assertRaises(Http404):
+            await AsyncProductDetailView.as_view()(request, slug="missing")
+
+    async def test_parallel_queries_use_worker_threads(self):
+        calls = [lambda n=n: n for n in range(3)]
+        with override_settings(SHOP_ASYNC_PARALLEL_QUERIES=True):
+            self.assertEqual(await gather_queries(*calls), [0, 1, 2])
+
+
+class InstrumentationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    @override_settings(SHOP_SERVER_TIMING=True, DEBUG=True)
+    def test_server_timing_and_metrics(self):
+        url = reverse("shop:category_detail", kwargs={"slug": self.category.slug})
+        count, _ = self.get_query_count(url)
+        self.reset_caches()
+        response = self.client.get(url)
+        timing = dict(part.split(";", 1) for part in response["Server-Timing"].split(", "))
+        self.assertEqual(set(timing), {"db", "tpl", "nav", "total"})
+        self.assertIn(f'desc="{count} queries"', timing["db"])
+
+        metrics = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn('shop_requests_total{view="shop:category_detail",status="200"} 2', metrics)
+        self.assertIn('shop_request_duration_seconds_count{view="shop:category_detail"} 2', metrics)
+        self.assertRegex(metrics, r'shop_request_template_seconds_total\{view="shop:category_detail"\} [0-9.e-]+')
+
+    @override_settings(SHOP_METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SHOP_METRICS_TOKEN=None)
+    def test_metrics_without_a_token_need_debug(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 200)
+
+    @override_settings(SHOP_SERVER_TIMING=False)
+    def test_server_timing_is_opt_in(self):
+        response = self.client.get(reverse("shop:home"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.assertEqual(registry.snapshot()["requests"]["shop:home"]["200"], 1)
+
+    def test_worker_snapshots_are_summed(self):
+        self.client.get(reverse("shop:home"))
+        with tempfile.TemporaryDirectory() as directory:
+            registry.write_snapshot(directory, force=True)
+            os.rename(os.path.join(directory, f"{os.getpid()}.json"), os.path.join(directory, "1.json"))
+            with override_settings(SHOP_METRICS_DIR=directory, DEBUG=True):
+                metrics = self.client.get(reverse("metrics")).content.decode()
+        # The snapshot of "worker 1" plus this process, now counting /metrics too.
+        self.assertIn('shop_requests_total{view="shop:home",status="200"} 2', metrics)
+        merged = merge_snapshots([registry.snapshot(), registry.snapshot()])
+        self.assertEqual(merged["requests"]["shop:home"]["200"], 2)
+
+    def test_snapshots_of_exited_workers_are_removed(self):
+        self.client.get(reverse("shop:home"))
+        worker = subprocess.Popen([sys.executable, "-c", ""])
+        worker.wait()
+        with tempfile.TemporaryDirectory() as directory:
+            registry.write_snapshot(directory, force=True)
+            os.rename(os.path.join(directory, f"{os.getpid()}.json"), os.path.join(directory, f"{worker.pid}.json"))
+            with override_settings(SHOP_METRICS_DIR=directory, DEBUG=True):
+                metrics = self.client.get(reverse("metrics")).content.decode()
+            self.assertNotIn(f"{worker.pid}.json", os.listdir(directory))
+        self.assertIn('shop_requests_total{view="shop:home",status="200"} 1', metrics)
+
+
+class ProfilingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.store = ProfileStore(self.directory)
+
+    def test_sampled_request_is_profiled(self):
+        url = reverse("shop:category_detail", kwargs={"slug": self.category.slug})
+        with override_settings(SHOP_PROFILE_SAMPLE_RATE=1.0, SHOP_PROFILE_DIR=self.directory):
+            self.client.get(url)
+        [profile_id] = self.store.ids()
+        entry = self.store.load(profile_id)
+        self.assertEqual((entry["trigger"], entry["source"], entry["view"]), ("sampled", "cprofile", "shop:category_detail"))
+        self.assertTrue(entry["top"])
+        self.assertTrue(entry["queries"])
+
+        admin_user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+        with override_settings(SHOP_PROFILE_DIR=self.directory):
+            self.assertContains(self.client.get(reverse("admin:index")), reverse("shop_profiles"))
+            self.assertContains(self.client.get(reverse("shop_profiles")), profile_id)
+            self.assertContains(self.client.get(reverse("shop_profile", args=[profile_id])), "cumulative")
+            collapsed = self.client.get(reverse("shop_profile_collapsed", args=[profile_id]))
+            self.assertEqual(collapsed["Content-Type"], "text/plain; charset=utf-8")
+            self.assertEqual(self.client.get(reverse("shop_profile", args=["not-a-profile"])).status_code, 404)
+
+    def test_slow_request_keeps_stack_samples(self):
+        with override_settings(SHOP_PROFILE_SLOW_MS=0, SHOP_PROFILE_DIR=self.directory):
+            self.client.get(reverse("shop:home"))
+        entry = self.store.load(self.store.ids()[0])
+        self.assertEqual((entry["trigger"], entry["source"]), ("slow", "samples"))
+
+    def test_staff_without_superuser_is_denied(self):
+        user = get_user_model().objects.create_user("staff", password="pw", is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse("shop_profiles")).status_code, 403)
+
+    def test_store_evicts_oldest(self):
+        first = self.store.save({"payload": "x"})
+        # Room for two profiles; compressed sizes differ by a byte or two with the id.
+        size = os.path.getsize(self.store.path(first))
+        store = ProfileStore(self.directory, max_bytes=size * 2 + size // 2)
+        second = store.save({"payload": "y"})
+        third = store.save({"payload": "z"})
+        self.assertEqual(store.ids(), [third, second])
+
+
+@override_settings(SHOP_SITEMAP_CHUNK_SIZE=40)
+class SitemapAndFeedTests(CatalogTestCase):
+    NS = {"sm": "http://www.sitemaps.org/schemas/sitemap/0.9"}
+
+    def get_xml(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, ElementTree.fromstring(body)
+
+    def test_index_lists_every_product_once(self):
+        _, index = self.get_xml(reverse("sitemap"))
+        locations = [loc.text for loc in index.findall("sm:sitemap/sm:loc", self.NS)]
+        self.assertTrue(locations[0].endswith(reverse("sitemap_categories")))
+        products = []
+        for location in locations[1:]:
+            _, urlset = self.get_xml(location.replace("http://testserver", ""))
+            products += [loc.text for loc in urlset.findall("sm:url/sm:loc", self.NS)]
+        self.assertEqual(len(products), Product.objects.active().count())
+        self.assertIn(f"http://testserver{reverse('shop:product_detail', kwargs={'slug': self.product.slug})}", products)
+
+    def test_only_changed_chunks_are_rebuilt(self):
+        size = 40
+        changed = Product.objects.active().order_by("pk").last()
+        urls = {chunk: reverse("sitemap_products", kwargs={"chunk": chunk}) for chunk in (0, (changed.pk - 1) // size)}
+        for url in urls.values():
+            self.assertTrue(self.get_xml(url)[0].streaming)
+            self.assertFalse(self.get_xml(url)[0].streaming)
+        changed.name = "تغییر یافته"
+        changed.save()
+        first, last = urls.values()
+        self.assertFalse(self.get_xml(first)[0].streaming)
+        self.assertTrue(self.get_xml(last)[0].streaming)
+
+    def test_sitemap_chunk_revalidation(self):
+        url = reverse("sitemap_products", kwargs={"chunk": 0})
+        response, _ = self.get_xml(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(reverse("sitemap_products", kwargs={"chunk": 999})).status_code, 404)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("sitemap_products", kwargs={"chunk": 10**20}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_feeds(self):
+        with self.assertQueryBudget(2, "json feed"):
+            response = self.client.get(reverse("product_feed", kwargs={"fmt": "json"}))
+            items = json.loads(b"".join(response.streaming_content))["products"]
+        self.assertEqual(len(items), Product.objects.active().count())
+        item = next(item for item in items if item["id"] == self.product.pk)
+        self.assertEqual(item["code"], self.product.code)
+        self.assertTrue(item["image"].startswith("http://testserver/media/products/"))
+        self.assertEqual(self.client.get(response.request["PATH_INFO"], HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        response, root = self.get_xml(reverse("product_feed", kwargs={"fmt": "xml"}))
+        self.assertEqual(len(root.findall("product")), len(items))
+
+    def test_feed_revalidates_after_category_rename(self):
+        url = reverse("product_feed", kwargs={"fmt": "json"})
+        response = self.client.get(url)
+        with mock.patch("shop.cache.time.time", return_value=time.time() + 5):
+            self.category.name = "دسته تازه"
+            self.category.save()
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertIn("دسته تازه", b"".join(fresh.streaming_content).decode())
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 200)
+
+
+class ProductCardCacheTests(CatalogTestCase):
+    CARD = "includes/product_card.html"
+
+    def rendered_cards(self, url) -> tuple[int, str]:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return [template.name for template in response.templates].count(self.CARD), response.content.decode()
+
+    def test_warm_listing_renders_only_changed_cards(self):
+        url = reverse("shop:product_list")
+        self.assertEqual(self.rendered_cards(url)[0], 12)
+        self.assertEqual(self.rendered_cards(url)[0], 0)
+
+        self.product.name = "انگشتر تازه"
+        self.product.save()
+        rendered, content = self.rendered_cards(url)
+        self.assertEqual(rendered, 1)
+        self.assertIn("انگشتر تازه", content)
+
+        Category.objects.filter(pk=self.product.category_id).update(name="دسته تازه")
+        rendered, content = self.rendered_cards(url)
+        self.assertGreaterEqual(rendered, 1)
+        self.assertIn("دسته تازه", content)
+
+    def test_card_variants_are_cached_apart(self):
+        self.rendered_cards(reverse("shop:product_list"))
+        category = self.product.category
+        rendered, content = self.rendered_cards(reverse("shop:category_detail", kwargs={"slug": category.slug}))
+        self.assertEqual(rendered, 12)
+        self.assertNotIn('class="product-category"', content)
+
+
+class CatalogApiTests(CatalogTestCase):
+    def get_json(self, url, **extra):
+        response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200, url)
+        return response, json.loads(response.content)
+
+    def test_cursor_walk_covers_every_product_once(self):
+        url, ids = f"{reverse('api_products')}?limit=40&fields=id,price", []
+        while url:
+            with self.assertQueryBudget(2, url):
+                _, body = self.get_json(url.replace("http://testserver", ""))
+            ids += [item["id"] for item in body["results"]]
+            self.assertEqual(set(body["results"][0]), {"id", "price"})
+            url = body["next"]
+        expected = list(Product.objects.active().order_by("-created_at", "-id").values_list("pk", flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(body["count"], len(expected))
+
+    def test_filters(self):
+        products = Product.objects.active().filter(category=self.category, wage_tier=self.tier)
+        weights = sorted(products.values_list("weight_gram", flat=True))
+        low, high = weights[0], weights[len(weights) // 2]
+        query = f"category={self.category.slug}&wage_tier={self.tier.pk}&min_weight={low}&max_weight={high}&limit=100"
+        _, body = self.get_json(f"{reverse('api_products')}?{query}")
+        expected = products.filter(weight_gram__gte=low, weight_gram__lt=high)
+        self.assertEqual({item["id"] for item in body["results"]}, set(expected.values_list("pk", flat=True)))
+        self.assertTrue(all(item["category"] == self.category.slug for item in body["results"]))
+        bad = (
+            "fields=id,secret",
+            "min_weight=heavy",
+            "wage_tier=x",
+            "wage_tier=99999999999999999999999",
+            "wage_tier=%C2%B2",
+            "wage_tier=%DB%B3",
+            "limit=0",
+            "limit=1000",
+            "limit=%C2%B2",
+            "cursor=not-a-cursor",
+            "cursor=eyJrIjpbInRvZGF5IiwxXX0",
+        )
+        for query in bad:
+            response = self.client.get(f"{reverse('api_products')}?{query}")
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn("error", json.loads(response.content))
+
+    def test_etags_follow_updated_at(self):
+        url = reverse("api_products")
+        response, _ = self.get_json(url)
+        with self.assertQueryBudget(0, "warm revalidation"):
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+        detail = reverse("api_product_detail", kwargs={"slug": self.product.slug})
+        response, body = self.get_json(detail)
+        self.assertEqual(body["description"], self.product.description)
+        self.assertTrue(body["images"][0]["url"].startswith("http://testserver/media/products/"))
+        with self.assertQueryBudget(1, "product revalidation"):
+            self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        self.product.name = "تغییر یافته"
+        self.product.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+        self.assertEqual(self.client.get(reverse("api_product_detail", kwargs={"slug": "missing"})).status_code, 404)
+
+    def test_category_rename_revalidates(self):
+        urls = [reverse("api_products"), reverse("api_product_detail", kwargs={"slug": self.product.slug})]
+        validators = {url: self.get_json(url)[0] for url in urls}
+        with mock.patch("shop.cache.time.time", return_value=time.time() + 5):
+            self.category.slug = "renamed"
+            self.category.save()
+        for url, response in validators.items():
+            fresh = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(fresh.status_code, 200, url)
+            self.assertIn('"category":"renamed"', fresh.content.decode())
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(since.status_code, 200, url)
+
+    def test_categories_and_gzip(self):
+        _, body = self.get_json(f"{reverse('api_categories')}?fields=slug")
+        self.assertEqual(body["results"][0], {"slug": self.category.slug})
+        response = self.client.get(reverse("api_products"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["results"]), 24)
+        revalidated = self.client.get(reverse("api_products"), HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+
+class AdminChangelistQueryBudgetTests(CatalogTestCase):
+    """Every registered changelist runs a fixed number of queries."""
+
+    # Session, user, the page, the filtered and unfiltered counts, list
+    # filter choices and admin bookkeeping; overrides go in ``budgets``.
+    budgets: dict[str, int] = {}
+    default_budget = 8
+
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(user)
+
+    def test_changelists(self):
+        for model, model_admin in admin.site._registry.items():
+            opts = model._meta
+            url = reverse(f"admin:{opts.app_label}_{opts.model_name}_changelist")
+            budget = self.budgets.get(opts.model_name, self.default_budget)
+            with self.subTest(model=opts.model_name):
+                count, queries = self.get_query_count(url)
+                if count > budget:
+                    self.fail(
+                        f"{url} ran {count} queries, budget is {budget}:\n" + format_queries(queries)
+                    )
+                with mock.patch.object(model_admin, "list_per_page", 5):
+                    small, _ = self.get_query_count(url)
+                with mock.patch.object(model_admin, "list_per_page", 100):
+                    large, queries = self.get_query_count(url)
+                if small != large:
+                    self.fail(
+                        f"{url} query count grows with page size ({small} vs {large}):\n"
+                        + format_queries(queries)
+                    )
+
+    def test_product_changelist_skips_table_counts_when_warm(self):
+        # Counts and filter choices are cached: session, user, the page and
+        # the SiteConfig add-permission check in the sidebar remain.
+        url = reverse("admin:shop_product_changelist")
+        for query in ("", f"?category={self.category.pk}&is_active__exact=1", "?q=product"):
+            self.client.get(url + query)
+            with self.assertQueryBudget(4, url + query) as captured:
+                self.client.get(url + query)
+            counts = [entry["sql"] for entry in captured if "COUNT(" in entry["sql"]]
+            self.assertEqual(counts, [], query)
+
+
+class ProductAdminActionTests(CatalogTestCase):
+    """Bulk actions run one ``UPDATE`` for the whole selection."""
+
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(user)
+        self.url = reverse("admin:shop_product_changelist")
+
+    def run_action(self, action: str, products, **data):
+        payload = {"action": action, "_selected_action": [product.pk for product in products], **data}
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(self.url, payload)
+        self.assertEqual(response.status_code, 302)
+        return [entry["sql"] for entry in captured if entry["sql"].startswith('UPDATE "shop_product"')]
+
+    def test_deactivate_updates_once_and_reindexes(self):
+        products = list(Product.objects.active().filter(category=self.category)[:5])
+        version = get_version(CATALOG)
+        updates = self.run_action("deactivate", products)
+        self.assertEqual(len(updates), 1)
+        self.assertFalse(Product.objects.filter(pk__in=[p.pk for p in products], is_active=True).exists())
+        self.assertEqual(get_version(CATALOG), version + 1)
+        self.assertNotIn(products[0], list(search_products(products[0].code)[:10]))
+
+        self.run_action("activate", products)
+        self.assertIn(products[0], list(search_products(products[0].code)[:10]))
+
+    def test_change_category_follows_the_filtered_selection(self):
+        other = Category.objects.exclude(pk=self.category.pk).first()
+        products = list(Product.objects.filter(category=self.category)[:3])
+        before = {p.pk: p.updated_at for p in products}
+        updates = self.run_action("change_category", products, category=other.pk)
+        self.assertEqual(len(updates), 1)
+        for product in Product.objects.filter(pk__in=before):
+            self.assertEqual(product.category_id, other.pk)
+            self.assertGreater(product.updated_at, before[product.pk])
+        # Rows that already hold the value are not touched again.
+        touched = dict(Product.objects.filter(pk__in=before).values_list("pk", "updated_at"))
+        self.run_action("change_category", products, category=other.pk)
+        self.assertEqual(dict(Product.objects.filter(pk__in=before).values_list("pk", "updated_at")), touched)
+
+    def test_change_wage_tier_reprices(self):
+        GoldRate.objects.create(rate_per_gram=Decimal("5000000"))
+        tier = WageTier.objects.order_by("-wage_percent").first()
+        products = list(Product.objects.exclude(wage_tier=tier)[:4])
+        self.run_action("change_wage_tier", products, wage_tier=tier.pk)
+        for product in Product.objects.filter(pk__in=[p.pk for p in products]):
+            self.assertEqual(product.wage_tier_id, tier.pk)
+            self.assertEqual(product.computed_price, price_for_product(product))
+
+    def test_change_without_a_target_does_nothing(self):
+        self.assertEqual(self.run_action("change_wage_tier", [self.product]), [])
+
+    def test_only_the_selection_is_repriced(self):
+        GoldRate.objects.create(rate_per_gram=Decimal("5000000"))
+        tier = WageTier.objects.order_by("-wage_percent").first()
+        selected, bystander = Product.objects.exclude(wage_tier=tier)[:2]
+        # A row outside the selection that happens to share the new value and
+        # the update's timestamp must be left alone.
+        now = timezone.now()
+        Product.objects.filter(pk=bystander.pk).update(wage_tier=tier, updated_at=now, computed_price=1)
+        with mock.patch("shop.admin.timezone.now", return_value=now):
+            self.assertEqual(bulk_update(Product.objects.filter(pk=selected.pk), reprice=True, wage_tier_id=tier.pk), 1)
+        self.assertEqual(Product.objects.get(pk=bystander.pk).computed_price, 1)
+        selected.refresh_from_db()
+        self.assertEqual(selected.computed_price, price_for_product(selected))
+
+
+class PricingTests(CatalogTestCase):
+    def prices(self) -> dict:
+        return dict(Product.objects.values_list("pk", "computed_price"))
+
+    def test_sql_and_python_prices_agree(self):
+        # 1.15 is 1.1499999... as a float, so float rounding gave 11 for 11.5.
+        for weight in ("1.15", "0.01", "2.675", "0.05", "9999.99"):
+            Product.objects.create(name=f"وزن {weight}", category=self.category, weight_gram=Decimal(weight))
+        for rate in ("10", "3", "5123457"):
+            update_rate(rate)
+            for product in Product.objects.select_related("wage_tier"):
+                self.assertEqual(product.computed_price, price_for_product(product), (rate, product.weight_gram))
+        self.assertEqual(
+            Product.objects.get(weight_gram=Decimal("1.15")).computed_price,
+            Decimal(round(Decimal("1.15") * 5123457)),
+        )
+        update_rate("10")
+        self.assertEqual(Product.objects.get(weight_gram=Decimal("1.15")).computed_price, 12)
+
+    def test_recompute_scopes(self):
+        before = self.prices()
+        rate = current_rate() * 2
+        tier_products = set(Product.objects.filter(wage_tier=self.tier).values_list("pk", flat=True))
+        changed = recompute_prices(rate, wage_tier_ids=[self.tier.pk])
+        after = self.prices()
+        self.assertEqual(changed, len(tier_products))
+        self.assertEqual({pk for pk in after if after[pk] != before[pk]}, tier_products)
+
+        changed = recompute_prices(rate, product_ids=[self.product.pk])
+        self.assertEqual(changed, 0 if self.product.pk in tier_products else 1)
+
+        with mock.patch("shop.pricing.current_rate", return_value=None):
+            self.assertEqual(recompute_prices(), Product.objects.count())
+        self.assertFalse(Product.objects.filter(computed_price__isnull=False).exists())
+
+    def test_invalid_rates_are_rejected(self):
+        rates = GoldRate.objects.count()
+        for rate in ("-5", "0", "0.2", "NaN", "Infinity", "abc"):
+            with self.assertRaises(ValidationError, msg=rate):
+                update_rate(rate)
+            with self.assertRaises(CommandError, msg=rate):
+                call_command("update_gold_rate", rate=rate, stdout=StringIO())
+        self.assertEqual(GoldRate.objects.count(), rates)
+
+    def test_admin_rejects_a_zero_rate(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "pw"))
+        before, rates = self.prices(), GoldRate.objects.count()
+        for rate in ("0", "-5"):
+            response = self.client.post(reverse("admin:shop_goldrate_add"), {"rate_per_gram": rate, "source": "admin"})
+            self.assertEqual(response.status_code, 200, rate)
+            self.assertTrue(response.context["adminform"].form.errors["rate_per_gram"], rate)
+        self.assertEqual(GoldRate.objects.count(), rates)
+        self.assertEqual(self.prices(), before)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="متفرقه", slug="misc")
+
+    def make(self, name, description=""):
+        return Product.objects.create(name=name, description=description, category=self.category, weight_gram=1)
+
+    def test_normalize(self):
+        self.assertEqual(normalize("كيف"), "کیف")  # Arabic kaf and yeh
+        self.assertEqual(normalize("می\u200cخواهم"), "میخواهم")  # ZWNJ
+        self.assertEqual(normalize("۱۸ عيار ٢١"), "18 عیار 21")
+        self.assertEqual(normalize("طَلا"), "طلا")  # diacritics
+        self.assertEqual(normalize("Ring"), "ring")
+        self.assertEqual(tokenize("انگشتر، طلای ۱۸-عيار"), ["انگشتر", "طلای", "18", "عیار"])
+
+    def test_variants_match(self):
+        product = self.make("گردنبند ياقوت ۱۸")
+        for query in ("گردنبند یاقوت", "گردنبند ياقوت", "18", "یاق"):
+            self.assertEqual([p.pk for p in search_products(query)[:5]], [product.pk], query)
+
+    def test_every_match_is_ranked_and_counted(self):
+        # The oldest match is the best one and must not be cut off.
+        best = self.make("دستبند زمرد")
+        for index in range(30):
+            self.make(f"انگشتر {index}", description="ست با دستبند")
+        results = search_products("دستبند")
+        self.assertEqual(results.count(), 31)
+        self.assertEqual(results[0].pk, best.pk)
+        pages = [product.pk for start in range(0, 31, 10) for product in results[start : start + 10]]
+        self.assertEqual(len(set(pages)), 31)
+
+    @override_settings(SHOP_SEARCH_MAX_CANDIDATES=10)
+    def test_broad_queries_rank_the_newest_matches(self):
+        products = [self.make(f"انگشتر {index}", description="ست با دستبند") for index in range(15)]
+        best = self.make("دستبند زمرد")
+        results = search_products("دستبند")
+        self.assertEqual(results.count(), 10)
+        self.assertEqual(results[0].pk, best.pk)
+        self.assertEqual({product.pk for product in results[0:20]}, {best.pk, *(p.pk for p in products[-9:])})
+
+
+class SlugAllocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="انگشتر", slug="rings")
+
+    def make(self, name="انگشتر", slug=""):
+        return Product.objects.create(name=name, slug=slug, category=self.category, weight_gram=1)
+
+    def test_next_free_suffix(self):
+        self.assertEqual([self.make().slug for _ in range(3)], ["product", "product-1", "product-2"])
+        # Neither a word, a padded number nor a number with a tail is a suffix.
+        for slug in ("product-ring", "product-007", "product-10x", "product-9-1"):
+            self.make(slug=slug)
+        self.assertEqual(self.make().slug, "product-3")
+        last = self.make(slug="product-41")
+        self.assertEqual(self.make(name="Gold Ring").slug, "gold-ring")
+        self.assertEqual(self.make().slug, "product-42")
+        # An object does not collide with its own slug.
+        self.assertEqual(allocate_slug(last, "انگشتر"), "product-43")
+        self.assertEqual(allocate_slug(Product.objects.get(slug="product-42"), "انگشتر"), "product-42")
+
+    def test_batch_allocation(self):
+        self.make(name="Ring")
+        batch = [Product(name=name, category=self.category, weight_gram=1) for name in ("Ring", "Ring", "گردنبند", "Chain")]
+        batch.append(Product(name="Ring", slug="ring-5", category=self.category, weight_gram=1))
+        with self.assertNumQueries(1):
+            assign_slugs(batch)
+        self.assertEqual([obj.slug for obj in batch], ["ring-6", "ring-7", "product", "chain", "ring-5"])
+
+    def test_collision_is_retried(self):
+        self.make()
+        real = allocate_slug
+        calls = []
+
+        def racing(instance, value):
+            calls.append(value)
+            # Another writer took the slug between allocation and insert.
+            return "product" if len(calls) == 1 else real(instance, value)
+
+        with mock.patch("shop.slugs.allocate_slug", side_effect=racing):
+            self.assertEqual(self.make().slug, "product-1")
+        self.assertEqual(len(calls), 2)
+
+        with mock.patch("shop.slugs.allocate_slug", return_value="product"):
+            with self.assertRaises(IntegrityError):
+                self.make()
+
+
+class CatalogImportExportTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, "catalog.jsonl")
+        self.archive = os.path.join(self.directory, "images.zip")
+
+    def export(self) -> list[dict]:
+        call_command("export_catalog", self.path, images_zip=self.archive, stdout=StringIO())
+        with open(self.path, encoding="utf-8") as handle:
+            return [json.loads(line) for line in handle]
+
+    def import_(self, **options) -> str:
+        out = StringIO()
+        call_command("import_catalog", self.path, images_zip=self.archive, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_round_trip(self):
+        exported = self.export()
+        Product.objects.filter(pk=self.product.pk).update(name="نام عوض شده")
+        # Only rows that differ from the database are written.
+        self.assertIn("Created 0 and updated 1 products", self.import_())
+        self.assertEqual(self.export(), exported)
+
+        Product.objects.all().delete()
+        self.assertIn(f"Created {len(exported)} and updated 0 products", self.import_(batch_size=25))
+        # Seeded photos come back under their content-addressed names.
+        reimported = self.export()
+        self.assertEqual(
+            [{**row, "images": len(row["images"])} for row in reimported],
+            [{**row, "images": len(row["images"])} for row in exported],
+        )
+        self.assertTrue(all(is_content_addressed(name) for row in reimported for name in row["images"]))
+        self.assertIn(self.product.code, [product.code for product in search_products(self.product.code)[:10]])
+
+    def test_dry_run_writes_nothing(self):
+        exported = self.export()
+        Product.objects.all().delete()
+        output = self.import_(dry_run=True)
+        self.assertIn(f"Would create {len(exported)} and update 0 products", output)
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+    def test_resume_skips_committed_rows(self):
+        exported = self.export()
+        Product.objects.all().delete()
+        Checkpoint(f"{self.path}.checkpoint", self.path).save(30)
+        output = self.import_(resume=True, batch_size=20)
+        self.assertIn("Resuming after 30 committed rows.", output)
+        self.assertEqual(
+            sorted(Product.objects.values_list("code", flat=True)),
+            sorted(row["code"] for row in exported[30:]),
+        )
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+
+class SeedCatalogTests(TestCase):
+    def test_seeding_is_deterministic(self):
+        seed_catalog(30, categories=3, seed=7, images=False)
+        first = list(Product.objects.order_by("code").values_list("name", "weight_gram", "code"))
+        Product.objects.all().delete()
+        Category.objects.all().delete()
+        seed_catalog(30, categories=3, seed=7, images=False)
+        second = list(Product.objects.order_by("code").values_list("name", "weight_gram", "code"))
+        self.assertEqual(first, second)
+        self.assertEqual(Product.objects.values("slug").distinct().count(), 30)
+        self.assertFalse(Product.objects.filter(computed_price__isnull=True).exists())
+
+
+class BenchViewsTests(TestCase):
+    def test_reports_every_view(self):
+        seed_catalog(40, categories=2, images=False)
+        out = StringIO()
+        call_command("bench_views", requests=2, warmup=0, stdout=out)
+        results = json.loads(out.getvalue())["results"]
+        for label in ("home", "product_list", "search", "category_detail", "product_detail"):
+            self.assertEqual(results[label]["statuses"], {"200": 2}, label)
+            self.assertGreater(results[label]["queries_avg"], 0)
+            self.assertGreater(results[label]["bytes_avg"], 0)
+
+
+class StaticFilesTests(TestCase):
+    """collectstatic output served by StaticFilesMiddleware."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.static_override = override_settings(
+            DEBUG=False,
+            STATIC_ROOT=cls.static_root,
+            STORAGES={
+                "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+                "staticfiles": {"BACKEND": "shop.staticfiles.CompressedManifestStaticFilesStorage"},
+            },
+        )
+        cls.static_override.enable()
+        call_command("collectstatic", interactive=False, verbosity=0)
+        cls.middleware = StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.static_override.disable()
+        shutil.rmtree(cls.static_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, path, **headers):
+        return self.middleware(RequestFactory().get(path, **headers))
+
+    def test_hashed_url_is_immutable_and_precompressed(self):
+        url = staticfiles_storage.url("css/styles.css")
+        self.assertRegex(url, r"/static/css/styles\.[0-9a-f]{12}\.css$")
+        plain = self.get(url)
+        self.assertEqual(plain.status_code, 200)
+        self.assertIn("immutable", plain.headers["Cache-Control"])
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertEqual(plain.headers["Vary"], "Accept-Encoding")
+
+        gzipped = self.get(url, HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(gzipped.headers["Content-Encoding"], "gzip")
+        body = b"".join(gzipped.streaming_content)
+        self.assertEqual(gzip.decompress(body), b"".join(plain.streaming_content))
+        self.assertEqual(int(gzipped.headers["Content-Length"]), len(body))
+
+        revalidated = self.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=gzipped.headers["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_unhashed_url_is_revalidated(self):
+        response = self.get("/static/css/styles.css")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("must-revalidate", response.headers["Cache-Control"])
+
+    def test_unknown_paths_fall_through(self):
+        self.assertEqual(self.get("/static/../settings.py").status_code, 404)
+        self.assertEqual(self.get("/static/missing.css").status_code, 404)
+
+    def test_accept_encoding_parsing(self):
+        self.assertEqual(accepted_encodings("gzip;q=0.5, br;q=0, deflate"), {"gzip", "deflate"})
+
+
+class MediaServingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        cls.data = bytes(range(256)) * 40
+        os.makedirs(os.path.join(cls.media_root, "products", "7"))
+        with open(os.path.join(cls.media_root, "products", "7", "photo.jpg"), "wb") as handle:
+            handle.write(cls.data)
+        cls.url = "/media/products/7/photo.jpg"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_full_file_and_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.data)}")
+        self.assertEqual(b"".join(response.streaming_content), self.data[100:200])
+
+        stale = self.client.get(self.url, HTTP_RANGE="bytes=100-199", HTTP_IF_RANGE='"old"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=99999-").status_code, 416)
+        self.assertEqual(parse_range("bytes=-10", 100), (90, 99))
+        self.assertEqual(parse_range("bytes=0-5,10-20", 100), None)
+
+    def test_offload_headers(self):
+        with override_settings(SHOP_MEDIA_ACCEL="nginx", SHOP_MEDIA_ACCEL_PREFIX="/internal/"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], "/internal/products/7/photo.jpg")
+        self.assertEqual(response.content, b"")
+        with override_settings(SHOP_MEDIA_ACCEL="sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], os.path.join(self.media_root, "products", "7", "photo.jpg"))
+
+    def test_paths_outside_products_are_not_served(self):
+        self.assertEqual(self.client.get("/media/products/../secret.txt").status_code, 404)
+        self.assertEqual(self.client.get("/media/products/7/missing.jpg").status_code, 404)
+
+
+class DatabaseTuningTests(SimpleTestCase):
+    """WAL lets the replica connection read while an admin write is in progress."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def open_pair(self, pragmas):
+        path = os.path.join(self.directory, f"{pragmas['journal_mode']}.sqlite3")
+        handler = ConnectionHandler(
+            {
+                "default": {"ENGINE": "django.db.backends.sqlite3", "NAME": path},
+                "replica": {
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": f"file:{path}?mode=ro",
+                    "OPTIONS": {"uri": True},
+                },
+            }
+        )
+        self.addCleanup(handler.close_all)
+        with override_settings(SHOP_SQLITE_PRAGMAS=pragmas):
+            writer, reader = handler["default"], handler["replica"]
+            with writer.cursor() as cursor:
+                cursor.execute("CREATE TABLE item (id integer PRIMARY KEY, price integer)")
+                cursor.executemany("INSERT INTO item (price) VALUES (%s)", [(i,) for i in range(100)])
+            reader.ensure_connection()
+        return writer, reader
+
+    def read_during_write(self, writer, reader):
+        """Read from ``reader`` while ``writer`` holds an uncommitted bulk update."""
+        with writer.cursor() as cursor:
+            # The lock a commit takes; journal-mode readers cannot share it.
+            cursor.execute("BEGIN EXCLUSIVE")
+            cursor.execute("UPDATE item SET price = price + 1")
+            try:
+                with reader.cursor() as read:
+                    read.execute("SELECT COUNT(*), SUM(price) FROM item")
+                    return read.fetchone()
+            finally:
+                cursor.execute("ROLLBACK")
+
+    def test_pragmas_are_applied(self):
+        writer, reader = self.open_pair(DEFAULT_PRAGMAS)
+        with writer.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+        with reader.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_reads_proceed_during_a_write_in_wal_mode(self):
+        writer, reader = self.open_pair(DEFAULT_PRAGMAS)
+        # The reader sees the last committed state, without waiting.
+        self.assertEqual(self.read_during_write(writer, reader), (100, sum(range(100))))
+
+    def test_reads_wait_for_a_write_in_rollback_journal_mode(self):
+        writer, reader = self.open_pair({"journal_mode": "delete", "busy_timeout": 50})
+        with self.assertRaisesMessage(OperationalError, "locked"):
+            self.read_during_write(writer, reader)
+
+    def test_router_reads_from_replica_outside_transactions(self):
+        router = ReadReplicaRouter()
+        default = connections["default"]
+        with mock.patch.object(default, "in_atomic_block", False):
+            self.assertEqual(router.db_for_read(Product), "replica")
+        with mock.patch.object(default, "in_atomic_block", True):
+            self.assertEqual(router.db_for_read(Product), "default")
+        self.assertIsNone(router.db_for_read(get_user_model()))
+        self.assertEqual(router.db_for_write(Product), "default")
+        self.assertFalse(router.allow_migrate("replica", "shop"))
+
+
+class ReadReplicaRoutingTests(TransactionTestCase):
+    """Outside a test transaction, so reads really go to ``replica``."""
+
+    databases = {"default", "replica"}
+
+    def test_bulk_update_writes_to_default(self):
+        category = Category.objects.create(name="دسته", slug="routed")
+        products = [
+            Product.objects.create(name=f"محصول {index}", category=category, weight_gram=1) for index in range(3)
+        ]
+        with (
+            CaptureQueriesContext(connections["default"]) as written,
+            CaptureQueriesContext(connections["replica"]) as read,
+        ):
+            changed = bulk_update(Product.objects.filter(category=category), is_featured=True)
+        self.assertEqual(changed, len(products))
+        updates = [entry["sql"] for entry in written if entry["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertTrue(any(entry["sql"].startswith("SELECT") for entry in read))
+        self.assertFalse(any(entry["sql"].startswith("UPDATE") for entry in read))
+        self.assertEqual(Product.objects.filter(category=category, is_featured=True).count(), len(products))
+
+
+class MainImageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="انگشتر", slug="rings")
+        cls.product = Product.objects.create(name="انگشتر", category=category, weight_gram=1)
+
+    def add(self, name, sort_order, is_main=False) -> ProductImage:
+        return ProductImage.objects.create(
+            product=self.product, image=f"products/main/{name}", sort_order=sort_order, is_main=is_main
+        )
+
+    def assertMain(self, image):
+        main = list(self.product.images.filter(is_main=True).values_list("pk", flat=True))
+        self.assertEqual(main, [image.pk] if image else [])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.main_image_id, image.pk if image else None)
+
+    def test_single_main_image_follows_changes(self):
+        first = self.add("a.jpg", sort_order=2)
+        self.assertMain(first)
+        second = self.add("b.jpg", sort_order=1)
+        self.assertMain(first)
+        third = self.add("c.jpg", sort_order=3, is_main=True)
+        self.assertMain(third)
+
+        second.is_main = True
+        second.save()
+        self.assertMain(second)
+
+        # The next image by sort_order is promoted, not the oldest one.
+        second.delete()
+        self.assertMain(first)
+        first.delete()
+        self.assertMain(third)
+        third.delete()
+        self.assertMain(None)
+
+
+@override_settings(SHOP_IMAGE_WIDTHS=(320, 640))
+class ImageDerivativeTests(CatalogTestCase):
+    def original(self, size=(400, 300)) -> str:
+        buffer = BytesIO()
+        Image.new("RGB", size, "orange").save(buffer, "JPEG")
+        return default_storage.save("products/derivatives/photo.jpg", ContentFile(buffer.getvalue()))
+
+    def srcset(self, name, fmt, widths=(320, 400)) -> str:
+        return ", ".join(f"/media/{derivative_name(name, width, fmt)} {width}w" for width in widths)
+
+    def test_manifest_lists_every_width_and_format(self):
+        name = self.original()
+        manifest = build_derivatives(name)
+        self.assertEqual((manifest["source"], manifest["width"], manifest["height"]), (name, 400, 300))
+        self.assertEqual(list(manifest["sources"]), ["webp", "jpeg"])
+        for fmt, entries in manifest["sources"].items():
+            # 640 is clamped to the original width instead of upscaling.
+            self.assertEqual([width for width, _ in entries], [320, 400])
+            for width, derivative in entries:
+                self.assertEqual(derivative, derivative_name(name, width, fmt))
+                with default_storage.open(derivative) as fh, Image.open(fh) as image:
+                    self.assertEqual((image.format, image.size), (fmt.upper(), (width, width * 3 // 4)))
+
+    def test_responsive_image_renders_srcset(self):
+        name = self.original()
+        image = ProductImage(image=name, derivatives=build_derivatives(name))
+        template = Template("{% load shop_tags %}{% responsive_image image alt='انگشتر' %}")
+        html = template.render(Context({"image": image}))
+        self.assertIn(f'<source type="image/webp" srcset="{self.srcset(name, "webp")}"', html)
+        self.assertIn(f'<img src="/media/{derivative_name(name, 400, "jpeg")}" srcset="{self.srcset(name, "jpeg")}"', html)
+        self.assertIn('width="400" height="300"', html)
+
+        # A manifest for another file is ignored and the original served as-is.
+        image.image = "products/derivatives/replaced.jpg"
+        html = template.render(Context({"image": image}))
+        self.assertNotIn("<picture>", html)
+        self.assertIn('src="/media/products/derivatives/replaced.jpg"', html)
+
+    def test_command_backfills_missing_derivatives(self):
+        name = self.original()
+        image = ProductImage.objects.create(product=self.product, image=name)
+        out = StringIO()
+        call_command("build_image_derivatives", workers=1, stdout=out)
+        self.assertIn("Built 1 files, 0 failed.", out.getvalue())
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives["sources"]["jpeg"][0], [320, derivative_name(name, 320, "jpeg")])
+        self.assertTrue(default_storage.exists(derivative_name(name, 400, "webp")))
+
+        out = StringIO()
+        call_command("build_image_derivatives", workers=1, stdout=out)
+        self.assertIn("already have derivatives", out.getvalue())
+
+
+class ImageUploadTests(CatalogTestCase):
+    """Drop-zone uploads are streamed, hashed and stored once per content."""
+
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(user)
+        self.url = reverse("admin:shop_product_upload_images", args=[self.product.pk])
+
+    def photo(self, name: str, color: str) -> SimpleUploadedFile:
+        buffer = BytesIO()
+        Image.new("RGB", (8, 8), color).save(buffer, "JPEG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def test_handler_hashes_while_streaming(self):
+        handler = HashingFileUploadHandler()
+        handler.new_file("images", "a.jpg", "image/jpeg", 6)
+        handler.receive_data_chunk(b"abc", 0)
+        handler.receive_data_chunk(b"def", 3)
+        upload = handler.file_complete(6)
+        self.assertEqual(upload.content_hash, hashlib.sha256(b"abcdef").hexdigest())
+        self.assertTrue(os.path.exists(upload.temporary_file_path()))
+        upload.close()
+
+    def test_duplicates_are_stored_once(self):
+        self.assertContains(self.client.get(reverse("admin:shop_product_change", args=[self.product.pk])), self.url)
+        before = self.product.images.count()
+        response = self.client.post(
+            self.url,
+            {"images": [self.photo("a.jpg", "red"), self.photo("copy.JPG", "red"), self.photo("b.jpg", "blue")]},
+        )
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([image["name"] for image in body["added"]], ["a.jpg", "b.jpg"])
+        self.assertEqual(body["skipped"], ["copy.JPG"])
+        self.assertEqual(self.product.images.count(), before + 2)
+
+        added = ProductImage.objects.get(pk=body["added"][0]["id"])
+        self.assertTrue(is_content_addressed(added.image.name))
+        self.assertEqual(added.image.name, cas_name(added.content_hash, "a.jpg"))
+
+        # Another product references the same file instead of a copy.
+        other = Product.objects.exclude(pk=self.product.pk).first()
+        url = reverse("admin:shop_product_upload_images", args=[other.pk])
+        shared = self.client.post(url, {"images": [self.photo("again.jpg", "red")]}).json()["added"][0]
+        self.assertEqual(ProductImage.objects.get(pk=shared["id"]).image.name, added.image.name)
+        directory = os.path.join(self.media_root, os.path.dirname(added.image.name))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+        media = self.client.get(f"/media/{added.image.name}")
+        self.assertIn("immutable", media["Cache-Control"])
+
+    def test_invalid_files_are_rejected(self):
+        upload = SimpleUploadedFile("notes.jpg", b"not an image", content_type="image/jpeg")
+        response = self.client.post(self.url, {"images": [upload]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["errors"][0]["name"], "notes.jpg")
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_reclaim_deletes_only_old_orphans(self):
+        body = self.client.post(self.url, {"images": [self.photo("kept.jpg", "green")]}).json()
+        kept = ProductImage.objects.get(pk=body["added"][0]["id"]).image.name
+        orphan = default_storage.save("products/cas/00/orphan.jpg", ContentFile(b"x" * 10))
+        recent = default_storage.save("products/cas/00/recent.jpg", ContentFile(b"x"))
+        old = time.time() - 48 * 3600
+        os.utime(default_storage.path(orphan), (old, old))
+
+        call_command("reclaim_media", dry_run=True, stdout=StringIO())
+        self.assertTrue(default_storage.exists(orphan))
+        out = StringIO()
+        call_command("reclaim_media", stdout=out)
+        self.assertIn("Reclaimed 1 files", out.getvalue())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(recent))
+        self.assertTrue(default_storage.exists(kept))
+
+    def test_reupload_revives_an_old_orphan(self):
+        photo = self.photo("again.jpg", "purple")
+        orphan = default_storage.save(cas_name(hashlib.sha256(photo.read()).hexdigest(), "again.jpg"), photo)
+        photo.seek(0)
+        old = time.time() - 48 * 3600
+        os.utime(default_storage.path(orphan), (old, old))
+
+        body = self.client.post(self.url, {"images": [photo]}).json()
+        self.assertEqual(ProductImage.objects.get(pk=body["added"][0]["id"]).image.name, orphan)
+        # reclaim_media loaded its references before the upload was saved.
+        with mock.patch("shop.management.commands.reclaim_media.referenced_names", return_value=set()):
+            call_command("reclaim_media", stdout=StringIO())
+        self.assertTrue(default_storage.exists(orphan))
+
+
+class SimilarProductsTests(CatalogTestCase):
+    """The similar index matches a nearest-weight scan and follows product saves."""
+
+    def brute_force(self, product, count):
+        others = [
+            (abs(float(other.weight_gram) - float(product.weight_gram)), other.wage_tier_id != product.wage_tier_id)
+            for other in Product.objects.active().filter(category=product.category).exclude(pk=product.pk)
+        ]
+        return sorted(others)[:count]
+
+    def test_neighbours_are_nearest_in_weight_same_tier_first(self):
+        for product in Product.objects.active().order_by("pk")[:10]:
+            _, ids = similar_ids(product.pk, product.category_id, product.weight_gram, product.wage_tier_id)
+            self.assertEqual(len(ids), 4)
+            neighbours = Product.objects.in_bulk(ids)
+            same = [pk for pk in ids if neighbours[pk].wage_tier_id == product.wage_tier_id]
+            self.assertEqual(ids[: len(same)], same)
+            candidates = [
+                other for other in Product.objects.active().filter(
+                    category=product.category, wage_tier=product.wage_tier
+                ).exclude(pk=product.pk)
+            ]
+            # Same-tier picks are the nearest same-tier products (up to ties).
+            nearest = sorted(abs(float(o.weight_gram) - float(product.weight_gram)) for o in candidates)
+            picked = sorted(abs(float(neighbours[pk].weight_gram) - float(product.weight_gram)) for pk in same)
+            self.assertEqual(picked, nearest[: len(same)])
+
+    def test_detail_page_shows_the_strip(self):
+        response = self.client.get(reverse("shop:product_detail", kwargs={"slug": self.product.slug}))
+        similar = response.context["similar_products"]
+        self.assertTrue(similar)
+        self.assertNotIn(self.product, similar)
+        self.assertContains(response, similar[0].name)
+
+    def test_saves_update_the_index_in_place(self):
+        index = get_similar_index(self.category.pk)
+        product = Product.objects.filter(category=self.category).exclude(pk=self.product.pk).first()
+        product.weight_gram = Decimal("999.99")
+        with CaptureQueriesContext(connection) as captured:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.save(update_fields=["weight_gram"])
+        # The product's row is re-read; the category is not scanned again.
+        rebuilds = [entry["sql"] for entry in captured if 'ORDER BY "shop_product"."weight_gram"' in entry["sql"]]
+        self.assertEqual(rebuilds, [])
+        updated = get_similar_index(self.category.pk)
+        self.assertNotEqual(updated.revision, index.revision)
+        self.assertEqual((updated.ids[-1], updated.weights[-1]), (product.pk, 999.99))
+
+        other = Category.objects.exclude(pk=self.category.pk).first()
+        get_similar_index(other.pk)
+        product.category = other
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertNotIn(product.pk, get_similar_index(self.category.pk).ids)
+        self.assertIn(product.pk, get_similar_index(other.pk).ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertNotIn(product.pk, get_similar_index(other.pk).ids)
+
+    def test_concurrent_update_drops_the_index(self):
+        get_similar_index(self.category.pk)
+        product = Product.objects.filter(category=self.category).exclude(pk=self.product.pk).first()
+        product.weight_gram = Decimal("999.99")
+        # Another worker is updating this category's index.
+        _, index_key, _ = similar_keys(self.category.pk)
+        cache.add(f"{index_key}:lock", 0, 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save(update_fields=["weight_gram"])
+        self.assertIsNone(cache.get(index_key))
+        rebuilt = get_similar_index(self.category.pk)
+        self.assertEqual((rebuilt.ids[-1], rebuilt.weights[-1]), (product.pk, 999.99))
+
+    def test_bulk_changes_invalidate(self):
+        version = get_version(SIMILAR)
+        bulk_update(Product.objects.filter(pk=self.product.pk), is_featured=not self.product.is_featured)
+        self.assertEqual(get_version(SIMILAR), version)
+        bulk_update(Product.objects.filter(pk=self.product.pk), is_active=False)
+        self.assertGreater(get_version(SIMILAR), version)
@@ -0,0 +1,96 @@
+"""
+Content-addressed storage for product photos.
+
+``HashingFileUploadHandler`` streams every upload to a temporary file in
+64 KiB chunks and feeds each chunk to SHA-256 as it arrives, so a photo is
+never held in memory and its digest is known when the request body ends.
+
+:func:`store_content` then stores the bytes once under
+``products/cas/<aa>/<sha256><ext>``. Every ``ProductImage`` with the same
+content references that one file (``ProductImage.content_hash`` records the
+digest) and shares its derivatives. Files no row references any more are
+deleted by the ``reclaim_media`` command.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+CAS_PREFIX = "products/cas"
+HASH_CHUNK_SIZE = 64 * 1024
+
+_CAS_NAME = re.compile(rf"^{CAS_PREFIX}/([0-9a-f]{{2}})/\1[0-9a-f]{{62}}\.[a-z0-9]+$")
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """Streams uploads to disk and sets ``content_hash`` on the uploaded file."""
+
+    chunk_size = HASH_CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.content_hash = self.hasher.hexdigest()
+        return file
+
+
+def content_hash(file) -> str:
+    """SHA-256 of a Django ``File``, reusing the digest taken during upload."""
+    digest = getattr(file, "content_hash", None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in file.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+
+def cas_name(digest: str, filename: str) -> str:
+    """Storage name for content ``digest``; the extension keeps MIME types right."""
+    extension = os.path.splitext(filename)[1].lower()
+    return f"{CAS_PREFIX}/{digest[:2]}/{digest}{extension}"
+
+
+def is_content_addressed(name: str) -> bool:
+    """True for a stored original, whose bytes never change under its name."""
+    return bool(_CAS_NAME.match(name))
+
+
+def store_content(file, filename: str | None = None) -> tuple[str, str]:
+    """Store ``file`` once per content; return ``(content_hash, storage name)``.
+
+    Temporary uploads are moved into place rather than copied.
+    """
+    digest = content_hash(file)
+    name = cas_name(digest, filename or file.name)
+    if default_storage.exists(name):
+        # The file may be an orphan that reclaim_media is about to delete;
+        # a fresh mtime keeps it out of the command's --min-age window.
+        _touch(name)
+    else:
+        saved = default_storage.save(name, file)
+        if saved != name:
+            # A concurrent upload stored the same content first.
+            default_storage.delete(saved)
+    return digest, name
+
+
+def _touch(name: str) -> None:
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return
+    os.utime(path)
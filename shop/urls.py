@@ -2,22 +2,45 @@
 
 Maps URL patterns to their corresponding views. Uses class-based views
 imported from ``shop.views`` and associates a namespace for reverse lookups.
+With ``SHOP_ASYNC_VIEWS`` the pages that have async variants use them.
 """
 
+from django.conf import settings
 from django.urls import path
 
 from .views import (
+    AsyncCategoryDetailView,
+    AsyncHomeView,
+    AsyncProductDetailView,
+    AsyncProductListView,
     HomeView,
     CategoryDetailView,
     ProductDetailView,
     ProductListView,
+    SearchView,
 )
 
+if getattr(settings, "SHOP_ASYNC_VIEWS", False):
+    home, product_list, category_detail, product_detail = (
+        AsyncHomeView,
+        AsyncProductListView,
+        AsyncCategoryDetailView,
+        AsyncProductDetailView,
+    )
+else:
+    home, product_list, category_detail, product_detail = (
+        HomeView,
+        ProductListView,
+        CategoryDetailView,
+        ProductDetailView,
+    )
+
 app_name = "shop"
 
 urlpatterns = [
-    path("", HomeView.as_view(), name="home"),
-    path("products/", ProductListView.as_view(), name="product_list"),
-    path("category/<slug:slug>/", CategoryDetailView.as_view(), name="category_detail"),
-    path("product/<slug:slug>/", ProductDetailView.as_view(), name="product_detail"),
+    path("", home.as_view(), name="home"),
+    path("products/", product_list.as_view(), name="product_list"),
+    path("search/", SearchView.as_view(), name="search"),
+    path("category/<slug:slug>/", category_detail.as_view(), name="category_detail"),
+    path("product/<slug:slug>/", product_detail.as_view(), name="product_detail"),
 ]
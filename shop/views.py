@@ -5,57 +5,259 @@ This module implements class-based views to handle the home page, category
 listing, product details and the product listing. Using generic views
 provides extensibility and built-in pagination support. At the bottom
 of the module we expose function aliases for backwards compatibility.
+
+The ``Async*`` variants serve the same pages under ASGI (``SHOP_ASYNC_VIEWS``)
+and load a page's independent queries concurrently instead of one after the
+other; see :func:`gather_queries`.
 """
 
+from __future__ import annotations
+
+import asyncio
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import cached_property
+from django.utils.http import http_date, quote_etag
 from django.views.generic import DetailView, ListView, TemplateView
 
-from .models import Category, Product
+from .cache import CATALOG, NAVIGATION, WAGE_TIERS, cached_aggregate, get_version, last_changed
+from .context_processors import get_navigation
+from .facets import FacetSelection, build_facets, category_stats
+from .models import Category, Product, ProductImage
+from .pagination import CachedCountPaginator, CursorPaginator, keyset_ordering
+from .search import search_products
+from .similar import load_similar, similar_ids
 
 
-class HomeView(TemplateView):
-    """Display the home page with featured categories and latest products."""
+def _run_in_worker(call):
+    def run():
+        try:
+            return call()
+        finally:
+            # Worker threads are not covered by request_finished.
+            connections.close_all()
 
-    template_name = "home.html"
+    return run
+
+
+async def gather_queries(*calls):
+    """Run blocking callables concurrently and return their results in order.
+
+    Each callable must evaluate its queries (``list()``, ``.first()``) rather
+    than return a lazy queryset. By default they run on the thread shared by
+    Django's async ORM, which overlaps them with other requests but not with
+    each other. ``SHOP_ASYNC_PARALLEL_QUERIES`` runs each one on its own
+    worker thread and connection instead, so reads against a networked or
+    WAL-mode database overlap as well; every call then pays for a connection.
+    """
+    if getattr(settings, "SHOP_ASYNC_PARALLEL_QUERIES", False):
+        tasks = (sync_to_async(_run_in_worker(call), thread_sensitive=False)() for call in calls)
+    else:
+        tasks = (sync_to_async(call)() for call in calls)
+    return await asyncio.gather(*tasks)
+
+
+class ConditionalGetMixin:
+    """Answer ``If-None-Match``/``If-Modified-Since`` before rendering.
+
+    Subclasses implement :meth:`get_validators`, which must be cheap (a single
+    cached aggregate or ``values_list`` query) and cover every product the page
+    renders. The navigation and wage tier cache versions are folded into the
+    ETag because every page renders the navbar and facets list every tier; a
+    product edit therefore only changes the ETags of pages that show it.
+
+    ``Last-Modified`` cannot see a product that left the page (deactivated,
+    moved or deleted), so it is also raised to the last catalog and navigation
+    invalidation. That is global: after any catalog write, clients that only
+    send ``If-Modified-Since`` fetch each page once more. Browsers also send
+    ``If-None-Match``, which takes precedence and stays per page.
+    """
+
+    def get_validators(self):
+        """Return ``(last_modified, fingerprint)`` for the requested page."""
+        raise NotImplementedError
+
+    def get_context_loaders(self) -> dict:
+        """Callables for context entries that need their own query.
+
+        They depend only on the request, so the async views run them
+        concurrently; entries already passed in ``kwargs`` are not reloaded.
+        """
+        return {}
 
     def get_context_data(self, **kwargs):  # type: ignore[override]
-        context = super().get_context_data(**kwargs)
-        context["featured_categories"] = (
-            Category.objects.filter(is_active=True)
-            .order_by("sort_order", "name")[:4]
-        )
-        context["latest_products"] = (
-            Product.objects.filter(is_active=True)
-            .order_by("-created_at")[:8]
+        for name, load in self.get_context_loaders().items():
+            if name not in kwargs:
+                kwargs[name] = load()
+        return super().get_context_data(**kwargs)
+
+    def check_conditional(self, request):
+        """Return ``(not_modified_response_or_None, etag, timestamp)``."""
+        last_modified, fingerprint = self.get_validators()
+        site_config = get_navigation()["site_config"]
+        candidates = [last_changed(NAVIGATION), last_changed(CATALOG)]
+        if last_modified:
+            candidates.append(last_modified)
+        if site_config:
+            candidates.append(site_config["updated_at"])
+        last_modified = max(candidates)
+        digest = hashlib.md5(
+            f"{fingerprint}|{get_version(NAVIGATION)}|{get_version(WAGE_TIERS)}".encode(),
+            usedforsecurity=False,
+        ).hexdigest()
+        etag = quote_etag(digest)
+        timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        return response, etag, timestamp
+
+    def add_validators(self, response, etag, timestamp):
+        response.headers["ETag"] = etag
+        if timestamp is not None:
+            response.headers["Last-Modified"] = http_date(timestamp)
+        # Let browsers store pages but always revalidate them.
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def get(self, request, *args, **kwargs):
+        response, etag, timestamp = self.check_conditional(request)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return self.add_validators(response, etag, timestamp)
+
+
+class ListingValidatorsMixin(ConditionalGetMixin):
+    """Validators for listings: newest ``updated_at`` plus the row count."""
+
+    def get_validators(self):
+        stats = cached_aggregate(
+            self.get_queryset().order_by(), last_modified=Max("updated_at"), count=Count("pk")
         )
-        context["hero_product"] = (
-            Product.objects.filter(is_active=True, is_featured=True)
-            .order_by("-created_at")
-            .first()
+        return stats["last_modified"], f"{stats['last_modified']}:{stats['count']}"
+
+
+def page_query(request) -> str:
+    """The current query string without pagination parameters."""
+    query = request.GET.copy()
+    query.pop("page", None)
+    query.pop("cursor", None)
+    return query.urlencode()
+
+
+class CatalogPaginationMixin:
+    """Offset pagination with a cached count, or opt-in keyset pagination.
+
+    Keyset (cursor) pagination is enabled with ``SHOP_CURSOR_PAGINATION`` or
+    the ``cursor_pagination`` attribute. Pages are then addressed by an opaque
+    ``?cursor=`` token and deep pages cost the same as the first one.
+    """
+
+    paginator_class = CachedCountPaginator
+    cursor_pagination: bool | None = None
+    # Set by prefetch_page() and returned by paginate_queryset().
+    prefetched_page: tuple | None = None
+
+    def get_cursor_keys(self) -> tuple[str, ...]:
+        return ("-created_at", "-id")
+
+    def uses_cursor_pagination(self) -> bool:
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination
+        return getattr(settings, "SHOP_CURSOR_PAGINATION", False)
+
+    def paginate_queryset(self, queryset, page_size):  # type: ignore[override]
+        if self.prefetched_page is not None:
+            return self.prefetched_page
+        if not self.uses_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.get_cursor_keys())
+        page = paginator.page(self.request.GET.get("cursor"))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def prefetch_page(self) -> None:
+        """Load ``object_list`` and evaluate the requested page ahead of rendering."""
+        self.object_list = self.get_queryset()
+        paginator, page, object_list, is_paginated = self.paginate_queryset(
+            self.object_list, self.get_paginate_by(self.object_list)
         )
+        page.object_list = list(object_list)
+        self.prefetched_page = (paginator, page, page.object_list, is_paginated)
+
+    def get_context_data(self, **kwargs):  # type: ignore[override]
+        context = super().get_context_data(**kwargs)
+        context["page_query"] = page_query(self.request)
         return context
 
 
-class CategoryDetailView(ListView):
-    """Show products in a category with optional sorting and pagination."""
+class HomeView(ConditionalGetMixin, TemplateView):
+    """Display the home page with featured categories and latest products."""
+
+    template_name = "home.html"
+
+    def get_validators(self):
+        stats = cached_aggregate(
+            Product.objects.active(), last_modified=Max("updated_at"), count=Count("pk")
+        )
+        return stats["last_modified"], f"home:{stats['last_modified']}:{stats['count']}"
+
+    def get_context_loaders(self) -> dict:
+        return {
+            "featured_categories": lambda: list(
+                Category.objects.filter(is_active=True).order_by("sort_order", "name")[:4]
+            ),
+            "latest_products": lambda: list(
+                Product.objects.active().cards().order_by("-created_at")[:8]
+            ),
+            "hero_product": lambda: (
+                Product.objects.active()
+                .cards()
+                .filter(is_featured=True)
+                .order_by("-created_at")
+                .first()
+            ),
+        }
+
+
+class CategoryDetailView(CatalogPaginationMixin, ListingValidatorsMixin, ListView):
+    """Show products in a category with facet filters, sorting and pagination."""
 
     model = Product
     template_name = "category.html"
     context_object_name = "products"
     paginate_by = 12
 
-    def get_queryset(self):  # type: ignore[override]
+    @cached_property
+    def category(self) -> Category:
         # Fetch the category or raise 404
-        self.category = get_object_or_404(Category, slug=self.kwargs["slug"], is_active=True)
-        sort = self.request.GET.get("sort", "newest")
-        qs = self.category.products.filter(is_active=True)
-        if sort == "weight_desc":
-            qs = qs.order_by("-weight_gram")
-        elif sort == "weight_asc":
-            qs = qs.order_by("weight_gram")
-        else:
-            qs = qs.order_by("-created_at")
-        return qs
+        return get_object_or_404(Category, slug=self.kwargs["slug"], is_active=True)
+
+    # Sort options and their unique ordering keys (shared by both paginators).
+    sort_keys = {
+        "newest": ("-created_at", "-id"),
+        "weight_desc": ("-weight_gram", "-id"),
+        "weight_asc": ("weight_gram", "id"),
+        "price_asc": ("computed_price", "id"),
+        "price_desc": ("-computed_price", "-id"),
+    }
+
+    def get_validators(self):
+        # Filtered pages and the facets all derive from the whole category.
+        stats = category_stats(self.category.pk)
+        return stats["last_modified"], f"category:{stats['last_modified']}:{stats['count']}"
+
+    def get_cursor_keys(self) -> tuple[str, ...]:
+        return self.sort_keys.get(self.request.GET.get("sort"), self.sort_keys["newest"])
+
+    def get_queryset(self):  # type: ignore[override]
+        qs = self.category.products.active().cards()
+        qs = FacetSelection.from_querydict(self.request.GET).apply(qs)
+        return qs.order_by(*keyset_ordering(Product, self.get_cursor_keys()))
 
     def get_context_data(self, **kwargs):  # type: ignore[override]
         context = super().get_context_data(**kwargs)
@@ -63,8 +265,11 @@ class CategoryDetailView(ListView):
         context["current_sort"] = self.request.GET.get("sort", "newest")
         return context
 
+    def get_context_loaders(self) -> dict:
+        return {"facets": lambda: build_facets(self.category.pk, self.request.GET)}
+
 
-class ProductDetailView(DetailView):
+class ProductDetailView(ConditionalGetMixin, DetailView):
     """Display details of a single product and prepare a WhatsApp message."""
 
     model = Product
@@ -77,11 +282,28 @@ class ProductDetailView(DetailView):
         return (
             super()
             .get_queryset()
-            .filter(is_active=True)
-            .select_related("category", "wage_tier")
+            .active()
+            .cards()
             .prefetch_related("images")
         )
 
+    def get_validators(self):
+        row = (
+            Product.objects.active()
+            .filter(slug=self.kwargs[self.slug_url_kwarg])
+            .values_list("updated_at", "pk", "category_id", "weight_gram", "wage_tier_id")
+            .first()
+        )
+        if row is None:
+            raise Http404("No product found matching the query")
+        updated_at, pk, self.similar_category_id, weight, wage_tier_id = row
+        # Neighbours come from the cached index; its revision joins the
+        # fingerprint so the strip is revalidated when they change. Their
+        # prices and photos can change without touching the index, so the
+        # catalog version joins it too.
+        revision, self.similar_ids = similar_ids(pk, self.similar_category_id, weight, wage_tier_id)
+        return updated_at, f"product:{updated_at}:{revision}:{get_version(CATALOG)}"
+
     def get_context_data(self, **kwargs):  # type: ignore[override]
         context = super().get_context_data(**kwargs)
         product = self.object
@@ -92,8 +314,15 @@ class ProductDetailView(DetailView):
         context["whatsapp_message"] = message
         return context
 
+    def get_context_loaders(self) -> dict:
+        return {
+            # Served from the prefetch in get_queryset().
+            "gallery": lambda: list(self.object.images.all()),
+            "similar_products": lambda: load_similar(self.similar_ids, self.similar_category_id),
+        }
+
 
-class ProductListView(ListView):
+class ProductListView(CatalogPaginationMixin, ListingValidatorsMixin, ListView):
     """List all active products with pagination."""
 
     model = Product
@@ -102,12 +331,92 @@ class ProductListView(ListView):
     paginate_by = 12
 
     def get_queryset(self):  # type: ignore[override]
-        return (
-            Product.objects.filter(is_active=True)
-            .select_related("category", "wage_tier")
-            .prefetch_related("images")
-            .order_by("-created_at")
+        return Product.objects.active().cards().order_by("-created_at", "-id")
+
+
+class SearchView(ListView):
+    """Full-text product search ranked by relevance."""
+
+    template_name = "search.html"
+    context_object_name = "products"
+    paginate_by = 12
+
+    def get_queryset(self):  # type: ignore[override]
+        return search_products(self.request.GET.get("q", "").strip())
+
+    def get_context_data(self, **kwargs):  # type: ignore[override]
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.request.GET.get("q", "").strip()
+        context["page_query"] = page_query(self.request)
+        return context
+
+
+class AsyncHomeView(HomeView):
+    """:class:`HomeView` with its sections and the navigation loaded concurrently."""
+
+    async def get(self, request, *args, **kwargs):
+        response, etag, timestamp = await sync_to_async(self.check_conditional)(request)
+        if response is None:
+            loaders = self.get_context_loaders()
+            *sections, _ = await gather_queries(*loaders.values(), get_navigation)
+            context = self.get_context_data(**kwargs, **dict(zip(loaders, sections)))
+            response = self.render_to_response(context)
+        return self.add_validators(response, etag, timestamp)
+
+
+class AsyncListingMixin:
+    """Async ``get`` for paginated listings.
+
+    The page, the view's context loaders and the navigation are fetched
+    concurrently; rendering then runs without touching the database.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        response, etag, timestamp = await sync_to_async(self.check_conditional)(request)
+        if response is None:
+            loaders = self.get_context_loaders()
+            _, *sections, _ = await gather_queries(
+                self.prefetch_page, *loaders.values(), get_navigation
+            )
+            context = self.get_context_data(**dict(zip(loaders, sections)))
+            response = self.render_to_response(context)
+        return self.add_validators(response, etag, timestamp)
+
+
+class AsyncCategoryDetailView(AsyncListingMixin, CategoryDetailView):
+    """:class:`CategoryDetailView` loading the page and its facets concurrently."""
+
+
+class AsyncProductListView(AsyncListingMixin, ProductListView):
+    """:class:`ProductListView` loading the page and the navigation concurrently."""
+
+
+class AsyncProductDetailView(ProductDetailView):
+    """:class:`ProductDetailView` loading the product and its gallery concurrently."""
+
+    def get_queryset(self):  # type: ignore[override]
+        # The gallery is loaded on its own, alongside the product.
+        return super().get_queryset().prefetch_related(None)
+
+    def get_context_loaders(self) -> dict:
+        loaders = super().get_context_loaders()
+        loaders["gallery"] = lambda: list(
+            ProductImage.objects.filter(
+                product__slug=self.kwargs[self.slug_url_kwarg], product__is_active=True
+            )
         )
+        return loaders
+
+    async def get(self, request, *args, **kwargs):
+        response, etag, timestamp = await sync_to_async(self.check_conditional)(request)
+        if response is None:
+            loaders = self.get_context_loaders()
+            self.object, *sections, _ = await gather_queries(
+                self.get_object, *loaders.values(), get_navigation
+            )
+            context = self.get_context_data(object=self.object, **dict(zip(loaders, sections)))
+            response = self.render_to_response(context)
+        return self.add_validators(response, etag, timestamp)
 
 
 # Function wrappers for backwards compatibility
@@ -115,3 +424,4 @@ home_view = HomeView.as_view()
 category_detail_view = CategoryDetailView.as_view()
 product_detail_view = ProductDetailView.as_view()
 product_list_view = ProductListView.as_view()
+search_view = SearchView.as_view()
@@ -0,0 +1,64 @@
+/*
+ * Multi-file drop zone on the product change page.
+ *
+ * Dropped or chosen photos are posted together to the product's
+ * ``images/upload/`` admin URL; the server streams them to disk, stores
+ * each distinct file once and answers with what was added, skipped as a
+ * duplicate or rejected. The page is reloaded afterwards so the image
+ * inline shows the new rows.
+ */
+
+document.addEventListener('DOMContentLoaded', () => {
+    const zone = document.querySelector('[data-image-dropzone]');
+    if (!zone) {
+        return;
+    }
+    const input = zone.querySelector('input[type="file"]');
+    const results = zone.querySelector('[data-dropzone-results]');
+    const csrf = document.querySelector('input[name="csrfmiddlewaretoken"]');
+
+    const report = (text) => {
+        const item = document.createElement('li');
+        item.textContent = text;
+        results.appendChild(item);
+    };
+
+    const upload = async (files) => {
+        if (!files.length) {
+            return;
+        }
+        const data = new FormData();
+        Array.from(files).forEach(file => data.append('images', file));
+        results.textContent = '';
+        report(`در حال بارگذاری ${files.length} فایل...`);
+        try {
+            const response = await fetch(zone.dataset.uploadUrl, {
+                method: 'POST',
+                body: data,
+                headers: {'X-CSRFToken': csrf ? csrf.value : ''},
+                credentials: 'same-origin',
+            });
+            const body = await response.json();
+            results.textContent = '';
+            body.added.forEach(image => report(`اضافه شد: ${image.name}`));
+            body.skipped.forEach(name => report(`تکراری بود: ${name}`));
+            body.errors.forEach(error => report(`${error.name}: ${error.error}`));
+            if (body.added.length && !body.errors.length) {
+                window.location.reload();
+            }
+        } catch (error) {
+            report('بارگذاری ناموفق بود.');
+        }
+    };
+
+    ['dragenter', 'dragover'].forEach(name => zone.addEventListener(name, event => {
+        event.preventDefault();
+        zone.classList.add('is-dragover');
+    }));
+    ['dragleave', 'drop'].forEach(name => zone.addEventListener(name, event => {
+        event.preventDefault();
+        zone.classList.remove('is-dragover');
+    }));
+    zone.addEventListener('drop', event => upload(event.dataTransfer.files));
+    input.addEventListener('change', () => upload(input.files));
+});